@@ -1,62 +1,165 @@
 # This script houses main functions of the BAARD study. key functions like creating the master sheet, and the html dashboard.
+# The plotting, upload (gsheet_sync) and dashboard layers are only imported when they are used.
 
 
 #  libraries
 
 import os
 import glob
+import hashlib
+import inspect
+import time
+import itertools
+import warnings
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import pandas as pd
 import numpy as np
-import plotly.express as px
-import plotly.io as pio
-import plotly.graph_objects as go
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from upsetplot import UpSet
-from upsetplot import from_indicators
-import matplotlib.pyplot as plt
+
+# the core (master sheet and derived columns) only needs pandas and numpy. The upload, plotting and dashboard
+# libraries take seconds to import, so they are loaded the first time they're used: inside the functions that need
+# them, and as baard.px, baard.plt, ... through __getattr__ below for code that used them from this module.
+_LAZY_IMPORTS = {
+    "px": ("plotly.express", None),
+    "pio": ("plotly.io", None),
+    "go": ("plotly.graph_objects", None),
+    "plt": ("matplotlib.pyplot", None),
+    "gspread": ("gspread", None),
+    "ServiceAccountCredentials": ("oauth2client.service_account", "ServiceAccountCredentials"),
+    "UpSet": ("upsetplot", "UpSet"),
+    "from_indicators": ("upsetplot", "from_indicators"),
+}
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    module_name, attr = _LAZY_IMPORTS[name]
+    value = importlib.import_module(module_name)
+    if attr is not None:
+        value = getattr(value, attr)
+    globals()[name] = value # later lookups don't come back here
+    return value
 
 
 ######## helper functions ###########
 
-def load_all_record_ids(baard_dir): ### used in generating the master sheet (to begin left joining)
-    record_ids = []
+# folders (relative to the BAARD folder) holding the processed csvs for each MRI modality
+MRI_MODALITY_DIRS = {
+    "smri": "mri/smri/processed",
+    "fmri": "mri/fmri/processed",
+    "dwi": "mri/dwi/processed",
+}
 
+def list_processed_csvs(baard_dir):
+    # every csv inside a "processed" folder, these are the files load_all_record_ids reads
+    paths = []
     for root, dirs, files in os.walk(baard_dir):
-        if os.path.basename(root) == "processed": # only pull from processed folder 
-            for file in files:
-                if file.endswith(".csv"):
-                    file_path = os.path.join(root, file)
-                    df = pd.read_csv(file_path, usecols=[0])  # record_id columns
-                    df.columns = ["record_id"]  # rename just incase 
-                    df['record_id'] = df['record_id'].str.upper() # and make the values in the record_id column uppercase
-                    record_ids.append(df)
+        if os.path.basename(root) == "processed": # only pull from processed folder
+            paths.extend(os.path.join(root, file) for file in files if file.endswith(".csv"))
+    return paths
 
+def _read_first_column(path):
+    # read only the record_id column of a csv and time it
+    start = time.perf_counter()
+    try:
+        ids = pd.read_csv(path, usecols=[0]).iloc[:, 0]
+        return path, ids, time.perf_counter() - start, None
+    except Exception as e:
+        return path, None, time.perf_counter() - start, e
 
-    record_id_df = pd.concat(record_ids, ignore_index=True)
-    return record_id_df
+def iter_record_ids(paths, max_workers=8):
+    """
+    Reads the first (record_id) column of each csv in a thread pool and yields results as they finish.
 
-# function that pulls record_id from csv file in mri directory and then makes a dataframe that outlines what mri data is available for each record_id
+    At most max_workers files are in flight at once, so a slow NAS mount is never hit with the whole folder at the same time.
 
-def add_mri_columns(df, baard_dir): ### used in master sheet
-    def get_record_ids_from_csvs(folder):
-        record_ids = set()
-        for file in glob.glob(os.path.join(baard_dir, folder, "*.csv")):
-            try:
-                sub_df = pd.read_csv(file, usecols=[0])
-                sub_df.columns = ["record_id"]
-                record_ids.update(sub_df['record_id'].dropna().unique())
-            except Exception as e:
-                print(f"Skipping {file}: {e}")
-        return record_ids
-
-    smri_ids = get_record_ids_from_csvs("mri/smri/processed")
-    fmri_ids = get_record_ids_from_csvs("mri/fmri/processed")
-    dwi_ids  = get_record_ids_from_csvs("mri/dwi/processed")
-
-    df['has_smri'] = df['record_id'].isin(smri_ids).astype(int)
-    df['has_fmri'] = df['record_id'].isin(fmri_ids).astype(int)
-    df['has_dwi']  = df['record_id'].isin(dwi_ids).astype(int)
+    Args:
+        paths (list): csv paths to read.
+        max_workers (int): Number of files read at the same time.
+
+    Yields:
+        tuple: (path, record_id Series or None, seconds, exception or None)
+    """
+    paths = iter(paths)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = {pool.submit(_read_first_column, p) for p in itertools.islice(paths, max_workers)}
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+            for p in itertools.islice(paths, len(done)):
+                in_flight.add(pool.submit(_read_first_column, p))
+
+def scan_record_ids(baard_dir, max_workers=8):
+    """
+    One pass over every processed csv in the BAARD folder: collects all record_ids and which MRI modalities each id has.
+
+    Args:
+        baard_dir (str): Path to the BAARD data folder.
+        max_workers (int): Number of files read at the same time.
+
+    Returns:
+        dict:
+            "record_ids" (pd.DataFrame): uppercased record_id of every row of every file, in file discovery order (same as load_all_record_ids).
+            "modalities" (dict): modality name -> set of record_ids found in that modality's processed folder (as in add_mri_columns).
+            "report" (pd.DataFrame): one row per file with path, rows, seconds, skipped and error.
+    """
+    paths = list_processed_csvs(baard_dir)
+    modality_of = {}
+    for modality, folder in MRI_MODALITY_DIRS.items():
+        folder = os.path.normpath(os.path.join(baard_dir, folder))
+        for path in paths:
+            if os.path.dirname(os.path.normpath(path)) == folder:
+                modality_of[path] = modality
+
+    ids_by_path = {}
+    modalities = {modality: set() for modality in MRI_MODALITY_DIRS}
+    report = []
+    for path, ids, seconds, error in iter_record_ids(paths, max_workers=max_workers):
+        report.append({"path": path, "rows": 0 if ids is None else len(ids), "seconds": seconds,
+                       "skipped": error is not None, "error": None if error is None else repr(error)})
+        if ids is None:
+            continue
+        ids_by_path[path] = ids
+        if path in modality_of:
+            modalities[modality_of[path]].update(ids.dropna().unique())
+
+    # put everything back into discovery order so results don't depend on which read finished first
+    order = {path: i for i, path in enumerate(paths)}
+    record_ids = [ids_by_path[p].astype("object").str.upper() for p in paths if p in ids_by_path]
+    record_id_df = (pd.concat(record_ids, ignore_index=True) if record_ids else pd.Series(dtype="object")).to_frame("record_id")
+    report_df = pd.DataFrame(report, columns=["path", "rows", "seconds", "skipped", "error"])
+    report_df = report_df.sort_values("path", key=lambda col: col.map(order)).reset_index(drop=True)
+
+    return {"record_ids": record_id_df, "modalities": modalities, "report": report_df}
+
+def load_all_record_ids(baard_dir, max_workers=8): ### used in generating the master sheet (to begin left joining)
+    scan = scan_record_ids(baard_dir, max_workers=max_workers)
+    skipped = scan["report"][scan["report"]["skipped"]]
+    if len(skipped):
+        warnings.warn(f"Skipped {len(skipped)} unreadable csv(s) while loading record_ids: {skipped['path'].tolist()}")
+    return scan["record_ids"]
+
+# function that pulls record_id from csv file in mri directory and then makes a dataframe that outlines what mri data is available for each record_id
+# pass the result of scan_record_ids as scan to reuse it instead of reading the mri folders again
+
+def add_mri_columns(df, baard_dir, scan=None, max_workers=8): ### used in master sheet
+    if scan is None:
+        paths = [path for folder in MRI_MODALITY_DIRS.values() for path in glob.glob(os.path.join(baard_dir, folder, "*.csv"))]
+        modalities = {modality: set() for modality in MRI_MODALITY_DIRS}
+        for path, ids, seconds, error in iter_record_ids(paths, max_workers=max_workers):
+            if error is not None:
+                warnings.warn(f"Skipping {path}: {error}")
+                continue
+            for modality, folder in MRI_MODALITY_DIRS.items():
+                if os.path.normpath(os.path.dirname(path)) == os.path.normpath(os.path.join(baard_dir, folder)):
+                    modalities[modality].update(ids.dropna().unique())
+    else:
+        modalities = scan["modalities"]
+
+    df['has_smri'] = df['record_id'].isin(modalities["smri"]).astype(int)
+    df['has_fmri'] = df['record_id'].isin(modalities["fmri"]).astype(int)
+    df['has_dwi']  = df['record_id'].isin(modalities["dwi"]).astype(int)
 
     return df
 
@@ -128,6 +231,7 @@ def compute_remission_status(row): ## this function is used in the master sheet
     return np.nan
 
 # Function to trim extra missing_var_N columns based on total_missing -- in issues list
+# (row by row; missingness.PresenceMatrix builds the issues list for all participants at once, see issues_list / issues_wide)
 def trim_to_missing_count(row):
     count = int(row['total_missing'])
     # Keep record_id, total_missing, and exactly `count` missing_var_N columns
@@ -137,7 +241,7 @@ def trim_to_missing_count(row):
 # this function takes in a dataframe, the name of the spreadsheet, the name of the worksheet, and the path to the credentials file
     # adapted from several stackoverflow posts
 
-def upload_to_gsheet(df, spreadsheet_name, worksheet_name, creds_path):
+def upload_to_gsheet(df, spreadsheet_name, worksheet_name, creds_path, sync=False, snapshot_dir=None, full=False):
     """
     Uploads a DataFrame to a specific worksheet in a Google Sheet. Security is maintained as we don't ask for credentails but rather a JSON key file.
     Args:
@@ -145,8 +249,23 @@ def upload_to_gsheet(df, spreadsheet_name, worksheet_name, creds_path):
         spreadsheet_name (str): The name of the Google Sheet.
         worksheet_name (str): The name of the worksheet within the Google Sheet.
         creds_path (str): Path to the JSON key file for Google Sheets API.
+        sync (bool): Only send the cells that changed since the last upload, in chunks with retries (see gsheet_sync).
+        snapshot_dir (str): Folder of the sync snapshots (default ~/.baard/gsheet_snapshots).
+        full (bool): With sync, rewrite the whole worksheet and start a new snapshot.
     """
 
+    if sync:
+        from gsheet_sync import SNAPSHOT_DIR, sync_to_gsheet
+
+        result = sync_to_gsheet(df, spreadsheet_name, worksheet_name, creds_path,
+                                snapshot_dir=snapshot_dir or SNAPSHOT_DIR, full=full)
+        print(f"Synced to Google Sheet: {spreadsheet_name} > {worksheet_name} "
+              f"({result['mode']}, {result['cells']} cells in {result['requests']} requests)")
+        return result
+
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
    # Defines the OAuth2 scope, which limits what script can access.
     scope = [
         'https://spreadsheets.google.com/feeds', # feeds
@@ -274,8 +393,93 @@ def reorder_columns(master_df):
         
     return master_df
 
+######## column layout engine ###########
+# table driven version of reorder_columns. the layout is a list of rules applied in order:
+#   ("after", anchor, [columns])  -- put the columns right after the anchor (in that order), if the anchor exists
+#   ("suffix", suffix)            -- put every <col><suffix> right after <col>
+# reorder_columns above is kept as the reference implementation (benchmarks/bench_column_layout.py compares the two)
+
+COLUMN_LAYOUT = (
+    [("after", f"week{week}_freq2", [f"on_bup_week{week}", f"on_arp_week{week}"]) for week in [2, 4, 6, 8, 10]] +
+    [
+        ("after", "on_arp_week10", ["total_on_bup", "total_on_arp"]),
+        ("after", "total_on_arp", ["medication_group"]),
+        ("after", "medication_group", ["taking_bup", "taking_arp"]),
+        ("after", "total_on_arp", ["total_number_falls"]),
+        ("after", "total_number_falls", ["total_number_injuries"]),
+        ("suffix", "_sqrt"),
+        ("suffix", "_log"),
+        ("after", "total_number_falls", ["had_fall"]),
+        ("after", "bmi", ["BMI_extreme"]),
+        ("after", "age", ["years_with_depression"]),
+    ]
+)
 
+def column_layout_order(columns, layout=COLUMN_LAYOUT):
+    """
+    Computes the final column order for a layout without touching any data.
 
+    The order is kept as a linked list of column names, so each move is O(1) and the whole layout is
+    linear in the number of columns (reorder_columns does a DataFrame.insert per move instead).
+
+    Args:
+        columns (list): Current column names (must be unique).
+        layout (list): Layout rules, see COLUMN_LAYOUT.
+
+    Returns:
+        list: Column names in their new order.
+    """
+    columns = list(columns)
+    head, tail = object(), object()
+    nxt = dict(zip([head] + columns, columns + [tail]))
+    prv = dict(zip(columns + [tail], [head] + columns))
+
+    def move_after(col, anchor):
+        if col == anchor or nxt[anchor] == col:
+            return
+        nxt[prv[col]], prv[nxt[col]] = nxt[col], prv[col]  # unlink
+        nxt[col], prv[col] = nxt[anchor], anchor
+        prv[nxt[anchor]] = col
+        nxt[anchor] = col
+
+    def current_order():
+        order, col = [], nxt[head]
+        while col is not tail:
+            order.append(col)
+            col = nxt[col]
+        return order
+
+    for rule in layout:
+        if rule[0] == "after":
+            _, anchor, followers = rule
+            if anchor not in nxt:
+                continue
+            for col in followers:
+                if col in nxt:
+                    move_after(col, anchor)
+                    anchor = col
+        elif rule[0] == "suffix":
+            suffix = rule[1]
+            for col in current_order():
+                if col.endswith(suffix) and col[:-len(suffix)] in nxt:
+                    move_after(col, col[:-len(suffix)])
+        else:
+            raise ValueError(f"Unknown column layout rule: {rule!r}")
+
+    return current_order()
+
+def apply_column_layout(df, layout=COLUMN_LAYOUT):
+    """
+    Reorders the columns of the master sheet with a single reindex.
+
+    Args:
+        df (pd.DataFrame): The master DataFrame.
+        layout (list): Layout rules, see COLUMN_LAYOUT.
+
+    Returns:
+        pd.DataFrame: DataFrame with reordered columns.
+    """
+    return df.reindex(columns=column_layout_order(df.columns, layout))
 
 def compute_response_delta(row):
     # Try using MADRS scores first
@@ -297,34 +501,219 @@ def compute_response_delta(row):
     # If neither is available, return NaN
     return np.nan
 
-def add_sqrt_blood_markers(df):
+######## vectorized versions of the row functions ###########
+# these give the same output as compute_remission_status, compute_response_delta and classify_medication
+# but work on whole columns at once, so they replace the slow df.apply(axis=1) calls in the master sheet.
+# the row functions above are kept as the reference path
+
+def _numeric_col(df, col):
+    # mirrors row.get(col) -- a missing column behaves like an all-NaN column
+    if col not in df.columns:
+        return pd.Series(np.nan, index=df.index, dtype="float64")
+    return pd.to_numeric(df[col], errors="coerce").astype("float64")
+
+def _normalized_med_col(df, col):
+    # same as normalize() but for a whole column, empty strings count as missing just like in classify_medication
+    if col not in df.columns:
+        return pd.Series(None, index=df.index, dtype="object")
+    s = df[col].astype("object").where(df[col].notna(), None)
+    s = s.map(lambda v: v.strip().lower() if isinstance(v, str) else v)
+    return s.where(s != "", None)
+
+def compute_remission_status_vectorized(df):
     """
-    Applies square root transformation to all relevant numeric blood marker columns
-    and adds new columns with a '_sqrt' suffix.
+    Column-wise version of compute_remission_status.
+
+    Uses MADRS week 10 first (<= 10 is remission), then falls back to PHQ9 week 10, 8 and 6 (<= 4 is remission).
 
     Args:
-        df (pd.DataFrame): The DataFrame containing blood markers.
+        df (pd.DataFrame): master DataFrame with the MADRS/PHQ9 columns.
 
     Returns:
-        pd.DataFrame: DataFrame with new sqrt-transformed columns.
+        pd.Series: 1.0, 0.0 or NaN for each row.
     """
-    blood_marker_cols = [
-        'IL-6', 'gp130', 'IL-8/CXCL8', 'uPAR', 'MIF',
-        'CCL2/JE/MCP-1', 'Osteoprotegerin/TNFRSF11B', 'IL-1 beta/IL-1F2',
-        'CCL20/MIP-3 alpha', 'CCL3/MIP-1 alpha', 'CCL4/MIP-1 beta',
-        'CCL13/MCP-4', 'GM-CSF', 'ICAM-1/CD54', 'TNF RII/TNFRSF1B',
-        'TNF RI/TNFRSF1A', 'PIGF', 'CXCL1/GRO alpha/KC/CINC-1',
-        'IGFBP-2', 'TIMP-1', 'IGFBP-6', 'Angiogenin'
-    ]
+    madras_w10 = _numeric_col(df, "week10_madrs").to_numpy()
+    phq9_scores = [_numeric_col(df, f"week{wk}_phq9").to_numpy() for wk in [10, 8, 6]]
+
+    conditions = [~np.isnan(madras_w10)] + [~np.isnan(score) for score in phq9_scores]
+    choices = [(madras_w10 <= 10).astype(float)] + [(score <= 4).astype(float) for score in phq9_scores]
+
+    return pd.Series(np.select(conditions, choices, default=np.nan), index=df.index, name="remission_status")
+
+def compute_response_delta_vectorized(df):
+    """
+    Column-wise version of compute_response_delta.
+
+    Percent change from baseline to week 10 on MADRS, falling back to PHQ9 when MADRS can't be used.
 
-    for col in blood_marker_cols:
-        if col in df.columns:
-            numeric_series = pd.to_numeric(df[col], errors='coerce')  # force numeric, coerce errors to NaN
-            df[f"{col}_sqrt"] = np.where(numeric_series >= 0, np.sqrt(numeric_series), np.nan)
+    Args:
+        df (pd.DataFrame): master DataFrame with the baseline/week10 MADRS and PHQ9 columns.
+
+    Returns:
+        pd.Series: rounded percent change (float, NaN when neither scale is usable).
+    """
+    deltas, usable = [], []
+    for scale in ["madrs", "phq9"]:
+        baseline = _numeric_col(df, f"baseline_{scale}").to_numpy()
+        week10 = _numeric_col(df, f"week10_{scale}").to_numpy()
+        mask = ~np.isnan(baseline) & ~np.isnan(week10) & (baseline != 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            deltas.append(np.round((baseline - week10) / baseline * 100))
+        usable.append(mask)
+
+    return pd.Series(np.select(usable, deltas, default=np.nan), index=df.index, name="response_delta")
+
+def classify_medication_vectorized(df):
+    """
+    Column-wise version of classify_medication.
+
+    Precedence is the same as the row function: no medications, then augmentation (first week wins),
+    then switch, then single-med cases, otherwise "mixed_or_other".
+
+    Args:
+        df (pd.DataFrame): DataFrame with the week{N}_med1 / week{N}_med2 columns.
 
+    Returns:
+        pd.Series: medication classification for each row.
+    """
+    weeks = [2, 4, 6, 8, 10]
+    med1 = [_normalized_med_col(df, f"week{wk}_med1").to_numpy() for wk in weeks]
+    med2 = [_normalized_med_col(df, f"week{wk}_med2").to_numpy() for wk in weeks]
+    all_meds = np.column_stack(med1 + med2)
+
+    present = pd.notna(all_meds)
+    has_any = present.any(axis=1)
+    non_bup = (present & (all_meds != "bupropion")).any(axis=1)
+    non_arp = (present & (all_meds != "aripiprazole")).any(axis=1)
+
+    conditions = [~has_any]
+    choices = ["no_medications"]
+
+    # augmentation is checked week by week, so the first matching week decides
+    for m1, m2 in zip(med1, med2):
+        conditions += [(m1 == "bupropion") & (m2 == "aripiprazole"), (m1 == "aripiprazole") & (m2 == "bupropion")]
+        choices += ["bupropion_augment", "aripiprazole_augment"]
+
+    med1_block = np.column_stack(med1)
+    conditions.append((med1_block == "bupropion").any(axis=1) & (med1_block == "aripiprazole").any(axis=1))
+    choices.append("switch")
+
+    conditions += [has_any & ~non_bup, has_any & ~non_arp]
+    choices += ["on_bupropion", "on_aripiprazole"]
+
+    result = np.select(conditions, choices, default="mixed_or_other")
+    return pd.Series(result, index=df.index, dtype="object", name="medication_class")
+
+######## blood marker transforms ###########
+
+# the 22 SASP blood markers in baseline_blood.csv
+BLOOD_MARKER_COLS = [
+    'IL-6', 'gp130', 'IL-8/CXCL8', 'uPAR', 'MIF',
+    'CCL2/JE/MCP-1', 'Osteoprotegerin/TNFRSF11B', 'IL-1 beta/IL-1F2',
+    'CCL20/MIP-3 alpha', 'CCL3/MIP-1 alpha', 'CCL4/MIP-1 beta',
+    'CCL13/MCP-4', 'GM-CSF', 'ICAM-1/CD54', 'TNF RII/TNFRSF1B',
+    'TNF RI/TNFRSF1A', 'PIGF', 'CXCL1/GRO alpha/KC/CINC-1',
+    'IGFBP-2', 'TIMP-1', 'IGFBP-6', 'Angiogenin'
+]
+
+# SASP index weights from Breno (same as compute_sasp_index in baard_log_regression.ipynb)
+SASP_WEIGHTS = {
+    'IL-6': 0.282894877, 'gp130': 0.123199448, 'IL-8/CXCL8': 0.308384372, 'uPAR': 0.204622649,
+    'MIF': 0.058976240, 'CCL2/JE/MCP-1': 0.291745272, 'Osteoprotegerin/TNFRSF11B': 0.221205524,
+    'IL-1 beta/IL-1F2': 0.255700198, 'CCL20/MIP-3 alpha': 0.208287277, 'CCL3/MIP-1 alpha': 0.193388148,
+    'CCL4/MIP-1 beta': 0.289456430, 'CCL13/MCP-4': 0.289657031, 'GM-CSF': 0.088343487,
+    'ICAM-1/CD54': 0.122586493, 'TNF RII/TNFRSF1B': 0.248676185, 'TNF RI/TNFRSF1A': 0.286050168,
+    'PIGF': 0.030422109, 'CXCL1/GRO alpha/KC/CINC-1': 0.189362370, 'IGFBP-2': 0.052284421,
+    'TIMP-1': 0.124990789, 'IGFBP-6': 0.236375717, 'Angiogenin': 0.197317664,
+}
+
+# each transform takes the (rows x markers) float64 matrix and returns a matrix of the same shape
+def sqrt_transform(values, markers):
+    with np.errstate(invalid='ignore'):
+        return np.where(values >= 0, np.sqrt(values), np.nan)
+
+def log_transform(values, markers):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(values > 0, np.log(values), np.nan)
+
+def zscore_transform(values, markers):
+    # population sd and NaNs left out of the mean/sd, same as sklearn's StandardScaler
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.nanmean(values, axis=0)
+        std = np.nanstd(values, axis=0)
+        std = np.where(std == 0, 1.0, std)
+        return (values - mean) / std
+
+def sasp_index(values, markers):
+    # weighted sum of z-scored markers, needs all markers (NaN if any marker is missing for a row)
+    missing = [m for m in SASP_WEIGHTS if m not in markers]
+    if missing:
+        raise ValueError(f"SASP index needs all {len(SASP_WEIGHTS)} markers, missing: {missing}")
+    weights = np.array([SASP_WEIGHTS[m] for m in markers])
+    return zscore_transform(values, markers) @ weights
+
+# registry of named transforms:
+#   func   -- function(values, markers) working on the whole marker matrix at once
+#   suffix -- for per-marker transforms, the new columns are named <marker><suffix>
+#   column -- for transforms that collapse the markers into one column (e.g. an index), its name
+#   input  -- run on the output of another transform instead of the raw markers (e.g. SASP index on the sqrt markers)
+BLOOD_TRANSFORMS = {
+    "sqrt": {"func": sqrt_transform, "suffix": "_sqrt"},
+    "log": {"func": log_transform, "suffix": "_log"},
+    "zscore": {"func": zscore_transform, "suffix": "_z"},
+    "sasp_index": {"func": sasp_index, "column": "SASP_index"},
+    "sasp_index_sqrt": {"func": sasp_index, "column": "SASP_index_sqrt", "input": "sqrt"},
+}
+
+def add_blood_transforms(df, transforms=("sqrt", "log"), markers=BLOOD_MARKER_COLS):
+    """
+    Adds transformed blood marker columns for every transform in `transforms`.
+
+    The marker columns are coerced to one float64 matrix once (non-numeric values become NaN), each transform runs
+    on the whole matrix, and all new columns are assigned to df in place in one step (columns that are already there,
+    e.g. when this runs twice, are overwritten), like the other add_* stages.
+
+    Args:
+        df (pd.DataFrame): The DataFrame containing blood markers.
+        transforms (list): Names from BLOOD_TRANSFORMS, in the order their columns should be added.
+        markers (list): Marker columns to transform, the ones missing from df are skipped.
+
+    Returns:
+        pd.DataFrame: df, with the new columns.
+    """
+    present = [col for col in markers if col in df.columns]
+    block = df[present]
+    if all(pd.api.types.is_numeric_dtype(dtype) for dtype in block.dtypes):
+        values = block.to_numpy(dtype="float64")
+    else:
+        values = block.apply(pd.to_numeric, errors='coerce').to_numpy(dtype="float64")  # force numeric, coerce errors to NaN
+
+    results = {}
+    new_cols = {}
+    for name in transforms:
+        spec = BLOOD_TRANSFORMS[name]
+        source = values if spec.get("input") is None else results[spec["input"]]
+        results[name] = spec["func"](source, present)
+        if "suffix" in spec:
+            new_cols.update({f"{col}{spec['suffix']}": results[name][:, i] for i, col in enumerate(present)})
+        else:
+            new_cols[spec["column"]] = results[name]
+
+    df[list(new_cols)] = pd.DataFrame(new_cols, index=df.index)
     return df
 
+def add_sqrt_blood_markers(df):
+    """
+    Applies square root transformation to all relevant numeric blood marker columns
+    and adds new columns with a '_sqrt' suffix.
 
+    Args:
+        df (pd.DataFrame): The DataFrame containing blood markers.
+
+    Returns:
+        pd.DataFrame: DataFrame with new sqrt-transformed columns.
+    """
+    return add_blood_transforms(df, transforms=["sqrt"])
 
 def add_log_blood_markers(df):
     """
@@ -338,77 +727,130 @@ def add_log_blood_markers(df):
     Returns:
         pd.DataFrame: DataFrame with new log-transformed columns.
     """
-    blood_marker_cols = [
-        'IL-6', 'gp130', 'IL-8/CXCL8', 'uPAR', 'MIF',
-        'CCL2/JE/MCP-1', 'Osteoprotegerin/TNFRSF11B', 'IL-1 beta/IL-1F2',
-        'CCL20/MIP-3 alpha', 'CCL3/MIP-1 alpha', 'CCL4/MIP-1 beta',
-        'CCL13/MCP-4', 'GM-CSF', 'ICAM-1/CD54', 'TNF RII/TNFRSF1B',
-        'TNF RI/TNFRSF1A', 'PIGF', 'CXCL1/GRO alpha/KC/CINC-1',
-        'IGFBP-2', 'TIMP-1', 'IGFBP-6', 'Angiogenin'
-    ]
+    return add_blood_transforms(df, transforms=["log"])
 
-    for col in blood_marker_cols:
-        if col in df.columns:
-            numeric_series = pd.to_numeric(df[col], errors='coerce')  # force numeric, coerce errors to NaN
-            df[f"{col}_log"] = np.where(numeric_series > 0, np.log(numeric_series), np.nan)
+######## master sheet creation #############
 
+BAARD_DIR = "/external/rprshnas01/netdata_kcni/dflab/data/BAARD/"
+
+# every table that gets left joined onto the record_ids, in merge order
+# (name, path relative to the BAARD folder, columns to keep, columns to drop)
+MASTER_SOURCES = [
+    ("mri_date", "mri/smri/processed/OPT_baseline_selected_thickness.csv", ["record_id", "mr_date"], None),
+    ("baseline_date", "temp/processed/OPT_baseline_date.csv", None, None),
+    ("madras", "temp/processed/OPT_madrs.csv", None, None),
+    ("phq9", "temp/processed/OPT_phq9.csv", None, None),
+    ("core_variables", "temp/processed/OPT_demographics.csv", None, None),
+    ("opt_mini", "temp/processed/OPT_mini.csv", None, None),
+    ("athf", "temp/processed/OPT_ATHF.csv", None, None),
+    ("meds", "temp/processed/OPT_decision_support.csv", None, None),
+    ("neurocog", "temp/processed/baseline_indexscores.csv", None, None),
+    ("nih_toolbox_cog", "temp/processed/OPT_nih_toolbox_cog.csv", None, None),
+    ("nih_toolbox_motor", "temp/processed/OPT_nih_toolbox_motor.csv", None, None),
+    ("falls", "temp/processed/OPT_falls.csv", None, None),
+    ("blood", "temp/processed/baseline_blood.csv", None, None),
+    ("genetics", "temp/processed/OPT_genetics.csv", None, None),
+    ("smri", "mri/smri/processed/OPT_baseline_selected_thickness.csv", None, ["mr_date"]),
+    ("fmri", "mri/fmri/processed/OPT_baseline_connectivity_Network_Connectivity.csv", None, None),
+    ("dwi", "mri/dwi/processed/FA_2024.csv", None, ["subjects"]),
+]
+
+def read_master_source(baard_dir, name):
+    # read one of the MASTER_SOURCES tables from the BAARD folder
+    _, rel_path, keep_cols, drop_cols = next(src for src in MASTER_SOURCES if src[0] == name)
+    df = pd.read_csv(os.path.join(baard_dir, rel_path))
+    if keep_cols is not None:
+        df = df[keep_cols]
+    if drop_cols is not None:
+        df = df.drop(columns=drop_cols, errors='ignore')
     return df
 
-######## master sheet creation #############
+def normalize_record_id(record_ids):
+    # record_ids are compared stripped and uppercase everywhere (some sources have e.g. "up10153"), missing stays missing
+    record_ids = pd.Series(record_ids, copy=False)
+    normalized = record_ids.astype("object").where(record_ids.notna(), None)
+    normalized = normalized.map(lambda v: str(v).strip().upper() if v is not None else v)
+    return normalized.where(normalized != "", None)
 
-# make master dataframe by adding all record_ids into one column and then drop the duplicates
-def make_master_df():
-    from baard import load_all_record_ids, compute_remission_status, reorder_columns 
-    baard_dir = "/external/rprshnas01/netdata_kcni/dflab/data/BAARD/"
+def join_master_sources(base_df, sources, key="record_id", profiler=None):
+    """
+    Left joins every source onto the base record_ids in a single pass.
 
-    # Load base record IDs
-    master_df = load_all_record_ids(baard_dir).drop_duplicates(subset=["record_id"]).reset_index(drop=True)
+    Each source is indexed on its normalized record_id once, duplicate ids are found before joining
+    (the first row per id is kept instead of multiplying rows), and all sources are lined up on the
+    base ids and put together with one column-wise concat. Column names that clash between sources
+    get the same _x/_y suffixes a chain of DataFrame.merge calls would give them.
 
-    # Load CSVs
-    mri_date = pd.read_csv(f"{baard_dir}/mri/smri/processed/OPT_baseline_selected_thickness.csv")[['record_id', 'mr_date']]
-    madras = pd.read_csv(f"{baard_dir}/temp/processed/OPT_madrs.csv")
-    phq9 = pd.read_csv(f"{baard_dir}/temp/processed/OPT_phq9.csv")
-    core_variables = pd.read_csv(f"{baard_dir}/temp/processed/OPT_demographics.csv")
-    opt_mini = pd.read_csv(f"{baard_dir}/temp/processed/OPT_mini.csv")
-    OPT_athf = pd.read_csv(f"{baard_dir}/temp/processed/OPT_ATHF.csv")
-    nih_toolbox_cog = pd.read_csv(f"{baard_dir}/temp/processed/OPT_nih_toolbox_cog.csv")
-    nih_toolbox_motor = pd.read_csv(f"{baard_dir}/temp/processed/OPT_nih_toolbox_motor.csv")
-    meds_df = pd.read_csv(f"{baard_dir}/temp/processed/OPT_decision_support.csv")
-    neurocog_df = pd.read_csv(f"{baard_dir}/temp/processed/baseline_indexscores.csv")
-    falls_df = pd.read_csv(f"{baard_dir}/temp/processed/OPT_falls.csv")
-    blood_df = pd.read_csv(f"{baard_dir}/temp/processed/baseline_blood.csv")
-    smri_df = pd.read_csv(f"{baard_dir}/mri/smri/processed/OPT_baseline_selected_thickness.csv").drop(columns=['mr_date'], errors='ignore')
-    fmri_df = pd.read_csv(f"{baard_dir}/mri/fmri/processed/OPT_baseline_connectivity_Network_Connectivity.csv")
-    dwi_df = pd.read_csv(f"{baard_dir}/mri/dwi/processed/FA_2024.csv").drop(columns=['subjects'], errors='ignore')
-    baseline_date_df = pd.read_csv(f"{baard_dir}/temp/processed/OPT_baseline_date.csv")
-    genetics_df = pd.read_csv(f"{baard_dir}/temp/processed/OPT_genetics.csv")
-
-    # Merge
-    master_df = (master_df
-        .merge(mri_date, on="record_id", how="left")
-        .merge(baseline_date_df, on="record_id", how="left")
-        .merge(madras, on="record_id", how="left")
-        .merge(phq9, on="record_id", how="left")
-        .merge(core_variables, on="record_id", how="left")
-        .merge(opt_mini, on="record_id", how="left")
-        .merge(OPT_athf, on="record_id", how="left")
-        .merge(meds_df, on="record_id", how="left")
-        .merge(neurocog_df, on="record_id", how="left")
-        .merge(nih_toolbox_cog, on="record_id", how="left")
-        .merge(nih_toolbox_motor, on="record_id", how="left")
-        .merge(falls_df, on="record_id", how="left")
-        .merge(blood_df, on="record_id", how="left")
-        .merge(genetics_df, on="record_id", how="left")
-        .merge(smri_df, on="record_id", how="left")
-        .merge(fmri_df, on="record_id", how="left")
-        .merge(dwi_df, on="record_id", how="left")
-    )
+    Args:
+        base_df (pd.DataFrame): DataFrame with the key column holding the record_ids to keep.
+        sources (list): (name, DataFrame) pairs in join order, each with a key column.
+        key (str): Name of the record_id column.
+        profiler (baard_profile.StageProfiler): Records each source's part of the join as a "merge:<name>" stage.
+
+    Returns:
+        tuple: (joined DataFrame, report DataFrame with one row per source: rows, unique_ids, duplicate_ids,
+            extra_rows (rows a chained merge would have added), missing_ids (rows with no id), example_duplicates)
+    """
+    if profiler is None:
+        from baard_profile import NullProfiler
+        profiler = NullProfiler()
+
+    base_ids = normalize_record_id(base_df[key]).drop_duplicates()
+    base_index = pd.Index(base_ids, name=key)
+
+    blocks, report = [], []
+    names = [key]
+    for name, source_df in sources:
+        with profiler.stage(f"merge:{name}", "merge", df_in=source_df) as stage:
+            ids = normalize_record_id(source_df[key])
+            has_id = ids.notna().to_numpy()
+            counts = ids[has_id].value_counts()
+            dup_counts = counts[counts > 1]
+            report.append({
+                "source": name,
+                "rows": len(source_df),
+                "unique_ids": len(counts),
+                "duplicate_ids": len(dup_counts),
+                "extra_rows": int((dup_counts - 1).sum()),
+                "missing_ids": int((~has_id).sum()),
+                "example_duplicates": dup_counts.index[:5].tolist(),
+            })
+
+            # keep the first row for each id, then line it up with the base ids
+            first_rows = has_id & ~ids.duplicated().to_numpy()
+            block = source_df.loc[first_rows, [c for c in source_df.columns if c != key]]
+            block.index = pd.Index(ids[first_rows], name=key)
+            blocks.append(stage.out(block.reindex(base_index)))
+
+            # same column naming as DataFrame.merge(..., suffixes=("_x", "_y"))
+            overlap = set(names) & set(block.columns)
+            names = [f"{c}_x" if c in overlap else c for c in names]
+            names += [f"{c}_y" if c in overlap else c for c in block.columns]
+            if len(set(names)) != len(names):
+                raise ValueError(f"Joining source '{name}' gives duplicate column names: {sorted(overlap)}")
+
+    with profiler.stage("merge:concat", "merge") as stage:
+        joined = pd.concat([base_ids.reset_index(drop=True).to_frame(key)] + [b.reset_index(drop=True) for b in blocks], axis=1)
+        joined.columns = names
+        stage.out(joined)
+    return joined, pd.DataFrame(report)
+
+######## derived columns of the master sheet ###########
+# each of these adds columns to the merged master sheet, they run in the order of MASTER_STAGES
+
+def add_remission_status(master_df):
+    master_df["remission_status"] = compute_remission_status_vectorized(master_df)
+    return master_df
 
-    master_df["remission_status"] = master_df.apply(compute_remission_status, axis=1)
-    master_df = master_df.sort_values(by="record_id").drop_duplicates(subset=["record_id"]).reset_index(drop=True)
+def add_site_column(master_df):
     master_df['site'] = master_df['record_id'].str[:2].str.upper()
+    return master_df
+
+def add_has_blood(master_df):
     master_df['has_blood'] = master_df['IL-6'].notna().astype(int) #don't really need this
+    return master_df
 
+def add_medication_flags(master_df):
     for week in [2, 4, 6, 8, 10]:
         master_df[f"on_bup_week{week}"] = ((master_df.get(f"week{week}_med1") == "BUPROPION") | 
                                            (master_df.get(f"week{week}_med2") == "BUPROPION")).astype(int)
@@ -431,43 +873,295 @@ def make_master_df():
 
     master_df['taking_bup'] = (master_df['medication_group'] == 'BUPROPION').astype(int)
     master_df['taking_arp'] = (master_df['medication_group'] == 'ARIPIPRAZOLE').astype(int)
+    return master_df
 
+def add_falls_totals(master_df):
     # sum falls and injury info
-
-
     falls_cols = [f"number_falls_week{w}" for w in [2, 4, 6, 8, 10] if f"number_falls_week{w}" in master_df.columns]
     inj_cols = [f"fall_injury_week{w}" for w in [2, 4, 6, 8, 10] if f"fall_injury_week{w}" in master_df.columns]
 
     master_df["total_number_falls"] = master_df[falls_cols].sum(axis=1)
     master_df["total_number_injuries"] = master_df[inj_cols].sum(axis=1)
+    return master_df
 
-
-
+def add_response_columns(master_df):
     # Compute percent change in symptoms from baseline to week 10 using MADRS or PHQ9
-    master_df["response_delta"] = master_df.apply(compute_response_delta, axis=1)
+    master_df["response_delta"] = compute_response_delta_vectorized(master_df)
     #make response_status flag, that captures if someone has responded more than 50%
-    master_df["response_status"] = master_df["response_delta"].apply(lambda x: 1 if x >= 50 else 0)
+    master_df["response_status"] = (master_df["response_delta"] >= 50).astype(int)
+    return master_df
 
-        # add had_fall binarized variable
+def add_had_fall(master_df):
+    # add had_fall binarized variable
     master_df['had_fall'] = (master_df['total_number_falls'] > 0).astype(int)
+    return master_df
 
+def add_bmi_extreme(master_df):
     # add new varaible BMI_extremer, where 1 = bmi > 40 or < 20, binary variables
     master_df['BMI_extreme'] = ((master_df['bmi'] > 40) | (master_df['bmi'] < 20)).astype(int)
+    return master_df
+
+def add_years_with_depression(master_df):
+    # compute years_with_depression using difference between age and mini_addtl_q2(age at first depression episode)
+    master_df['mini_addtl_q2_numeric'] = pd.to_numeric(master_df['mini_addtl_q2'], errors='coerce')
+    master_df['years_with_depression'] = master_df['age'] - master_df['mini_addtl_q2_numeric']
+    return master_df
 
+# (stage name, function, sources the stage reads from) -- the build cache only reruns a stage when one of its sources changed
+# stages with sources=None always rerun (site overwrites the site column that comes in with the demographics)
+MASTER_STAGES = [
+    ("remission_status", add_remission_status, ["madras", "phq9"]),
+    ("site", add_site_column, None),
+    ("has_blood", add_has_blood, ["blood"]),
+    ("medication_flags", add_medication_flags, ["meds"]),
+    ("falls_totals", add_falls_totals, ["falls"]),
+    ("response", add_response_columns, ["madras", "phq9"]),
+    ("had_fall", add_had_fall, ["falls"]),
+    ("bmi_extreme", add_bmi_extreme, ["core_variables"]),
+    ("blood_transforms", add_blood_transforms, ["blood"]),
+    ("years_with_depression", add_years_with_depression, ["core_variables", "opt_mini"]),
+]
+
+# sources whose columns are imaging measures, stored as float32 by the downcasting stage
+MRI_SOURCES = ["smri", "fmri", "dwi"]
+
+def downcast_master_df(master_df, imaging_columns=None, report=True):
+    """
+    Shrinks the dtypes of the master sheet: 0/1 flags to uint8 (UInt8 when they have missing values), site and
+    medication fields to categoricals, imaging to float32 and other integers to the smallest type that holds them.
+    Every converted column is checked against the original, columns that would lose values are left as they are.
 
+    Args:
+        master_df (pd.DataFrame): The master sheet.
+        imaging_columns (list): Columns of the MRI sources (also matched by name, see baard_storage.IMAGING_PATTERNS).
+        report (bool): Print the memory used per column family before and after.
 
-    master_df=add_sqrt_blood_markers(master_df)
+    Returns:
+        pd.DataFrame: The downcast master sheet.
+    """
+    from baard_storage import downcast_dtypes
 
-    master_df=add_log_blood_markers(master_df)
+    master_df, memory = downcast_dtypes(master_df, imaging_columns)
+    if report:
+        print(memory.to_string(index=False, float_format=lambda mb: f"{mb:.2f}"))
+    return master_df
 
+def _stable_repr(value):
+    # repr without memory addresses: functions by name, containers item by item
+    if callable(value):
+        return getattr(value, "__qualname__", repr(value))
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{_stable_repr(k)}: {_stable_repr(v)}" for k, v in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return type(value).__name__ + "(" + ", ".join(_stable_repr(v) for v in value) + ")"
+    return repr(value)
+
+def master_build_version():
+    """
+    Hash of the code that builds the master sheet, stored in the build cache so a change to it means a full rebuild.
 
-    # compute years_with_depression using difference between age and mini_addtl_q2(age at first depression episode)
-    master_df['mini_addtl_q2_numeric'] = pd.to_numeric(master_df['mini_addtl_q2'], errors='coerce')
-    master_df['years_with_depression'] = master_df['age'] - master_df['mini_addtl_q2_numeric']
+    Covers MASTER_SOURCES, MASTER_STAGES and the source of every function of this module the build runs (the stage
+    functions, the join, the column layout, ... and the functions and constants they use, followed by name).
+
+    Returns:
+        str: Hex digest.
+    """
+    module = globals()
+    sources, constants = {}, {}
+
+    def names_in(code):
+        # names used by a function, including its comprehensions and nested functions
+        names = set(code.co_names)
+        for const in code.co_consts:
+            if inspect.iscode(const):
+                names |= names_in(const)
+        return names
+
+    def visit(func):
+        if func.__name__ in sources:
+            return
+        sources[func.__name__] = inspect.getsource(func) + _stable_repr(func.__defaults__)
+        for value in func.__defaults__ or ():
+            visit_value(value)
+        for name in sorted(names_in(func.__code__)):
+            if name in module:
+                if inspect.isfunction(module[name]) and module[name].__module__ == __name__:
+                    visit(module[name])
+                elif name.isupper():
+                    constants[name] = _stable_repr(module[name])
+                    visit_value(module[name])
+
+    def visit_value(value):
+        # functions held in constants (e.g. BLOOD_TRANSFORMS)
+        values = value.values() if isinstance(value, dict) else value if isinstance(value, (list, tuple)) else [value]
+        for item in values:
+            if inspect.isfunction(item) and item.__module__ == __name__:
+                visit(item)
+            elif isinstance(item, (list, tuple, dict)):
+                visit_value(item)
+
+    for func in [load_all_record_ids, read_master_source, join_master_sources, apply_column_layout]:
+        visit(func)
+    visit_value(MASTER_STAGES)
+    constants["MASTER_SOURCES"] = _stable_repr(MASTER_SOURCES)
+    constants["MASTER_STAGES"] = _stable_repr(MASTER_STAGES)
+
+    digest = hashlib.blake2b(digest_size=16)
+    for name in sorted(sources):
+        digest.update(f"def {name}\n{sources[name]}".encode())
+    for name in sorted(constants):
+        digest.update(f"{name} = {constants[name]}\n".encode())
+    return digest.hexdigest()
 
-    # use reorder_columns to reorder the columns in the master_df
-    master_df = reorder_columns(master_df)
+# make master dataframe by adding all record_ids into one column and then drop the duplicates
+def make_master_df(baard_dir=BAARD_DIR, cache_dir=None, downcast=False, profile=None):
+    """
+    Builds the BAARD master sheet: left joins every processed table onto the record_ids and adds the derived columns.
+
+    Args:
+        baard_dir (str): Path to the BAARD data folder.
+        cache_dir (str): Optional local folder for the build cache. When given, only sources whose files changed
+            are re-read from baard_dir, derived columns are only recomputed from changed sources, and an
+            unchanged rebuild just loads the last master sheet from the cache.
+        downcast (bool): Shrink the dtypes at the end (see downcast_master_df) and print the memory saved.
+            The build cache always keeps the full-width master sheet.
+        profile (bool or str): Record wall time, shapes and memory of every step (reads, merges, derived columns)
+            and write them as a Chrome trace JSON: True writes baard_profile.json, a string is the output path.
+            None (default) follows the BAARD_PROFILE environment variable, see baard_profile.
+
+    Returns:
+        pd.DataFrame: The master sheet.
+    """
+    from baard_profile import get_profiler
+
+    profiler = get_profiler(profile)
+    try:
+        with profiler.stage("make_master_df", "build", cached=cache_dir is not None, downcast=downcast) as build:
+            master_df = build.out(_build_master_df(baard_dir, cache_dir, downcast, profiler))
+    finally:
+        path = profiler.write(metadata={"baard_dir": baard_dir, "cache_dir": cache_dir})
+        profiler.close()
+    if path is not None:
+        print(f"Build profile written to {path}")
+    return master_df
+
+def _build_master_df(baard_dir, cache_dir, downcast, profiler):
+    # make_master_df without the profiler setup, every step runs inside a profiler stage
+    cache = None
+    if cache_dir is not None:
+        from baard_cache import BuildCache
+        cache = BuildCache(cache_dir)
+
+        # fingerprint everything first (stat calls only, nothing is read unless it changed);
+        # tables made by a different version of the build code are never reused
+        with profiler.stage("fingerprint sources", "cache"):
+            cache.check_version(master_build_version())
+            ids_changed = cache.check_source("record_ids", list_processed_csvs(baard_dir))
+            for name, rel_path, _, _ in MASTER_SOURCES:
+                cache.check_source(name, os.path.join(baard_dir, rel_path))
+
+        if not cache.changed and cache.has_table("master"):
+            with profiler.stage("read:master", "read", cached=True) as stage:
+                master_df = stage.out(cache.read_table("master"))
+            if downcast:
+                imaging_columns = [col for name in MRI_SOURCES for col in cache.table_columns(name) if col != "record_id"]
+                with profiler.stage("downcast", "derive", df_in=master_df) as stage:
+                    master_df = stage.out(downcast_master_df(master_df, imaging_columns))
+            return master_df
+
+        previous_ids = cache.read_table("record_ids") if cache.has_table("record_ids") else None
+
+    # Load base record IDs
+    with profiler.stage("read:record_ids", "read", cached=cache is not None and not ids_changed) as stage:
+        if cache is not None and not ids_changed:
+            master_df = cache.read_table("record_ids")
+        else:
+            master_df = load_all_record_ids(baard_dir).drop_duplicates(subset=["record_id"]).reset_index(drop=True)
+            if cache is not None:
+                cache.write_table("record_ids", master_df)
+                # files changing doesn't matter for the derived columns as long as the set of ids is the same
+                if previous_ids is not None and set(previous_ids["record_id"].dropna()) == set(master_df["record_id"].dropna()):
+                    cache.changed.discard("record_ids")
+        stage.out(master_df)
+
+    # Load CSVs
+    sources = []
+    for name, _, _, _ in MASTER_SOURCES:
+        cached = cache is not None and not cache.is_changed(name)
+        with profiler.stage(f"read:{name}", "read", cached=cached) as stage:
+            if cached:
+                source_df = cache.read_table(name)
+            else:
+                source_df = read_master_source(baard_dir, name)
+                if cache is not None:
+                    cache.write_table(name, source_df)
+            sources.append((name, stage.out(source_df)))
+
+    # Join everything onto the record_ids in one go, duplicate ids in a source are reported instead of multiplying rows
+    with profiler.stage("join", "merge", df_in=master_df) as stage:
+        master_df, join_report = join_master_sources(master_df, sources, profiler=profiler)
+        stage.out(master_df)
+    duplicated = join_report[join_report["duplicate_ids"] > 0]
+    if len(duplicated):
+        warnings.warn("Duplicate record_ids found (first row kept): " +
+                      ", ".join(f"{row.source} ({row.duplicate_ids} ids, {row.extra_rows} extra rows)" for row in duplicated.itertuples()))
+
+    with profiler.stage("sort and dedupe", "merge", df_in=master_df) as stage:
+        master_df = master_df.sort_values(by="record_id", kind="stable").drop_duplicates(subset=["record_id"]).reset_index(drop=True)
+        stage.out(master_df)
+
+    # derived columns, reusing the last build for stages whose sources didn't change
+    previous_master = None
+    if cache is not None and cache.has_table("master") and not cache.is_changed("record_ids"):
+        with profiler.stage("read:previous master", "read", cached=True) as stage:
+            previous_master = stage.out(cache.read_table("master").set_index("record_id"))
+
+    for stage_name, stage_func, stage_sources in MASTER_STAGES:
+        stage_cols = cache.stage_columns(stage_name) if cache is not None else None
+        reuse = (previous_master is not None and stage_cols is not None and stage_sources is not None
+                 and not cache.is_changed(*stage_sources)
+                 and all(col in previous_master.columns for col in stage_cols))
+        with profiler.stage(f"derive:{stage_name}", "derive", df_in=master_df, cached=reuse) as stage:
+            if reuse:
+                reused = previous_master[stage_cols].reindex(master_df["record_id"]).reset_index(drop=True)
+                for col in stage_cols:
+                    master_df[col] = reused[col]
+            else:
+                cols_before = set(master_df.columns)
+                master_df = stage_func(master_df)
+                if cache is not None:
+                    cache.set_stage_columns(stage_name, [col for col in master_df.columns if col not in cols_before])
+            stage.out(master_df)
+
+    # put the derived columns next to the columns they come from
+    with profiler.stage("column layout", "layout", df_in=master_df) as stage:
+        master_df = stage.out(apply_column_layout(master_df))
+
+    if cache is not None:
+        with profiler.stage("write:master", "cache", df_in=master_df):
+            cache.write_table("master", master_df)
+            cache.save()
+
+    if downcast:
+        imaging_columns = [col for name, source_df in sources if name in MRI_SOURCES
+                           for col in source_df.columns if col != "record_id"]
+        with profiler.stage("downcast", "derive", df_in=master_df) as stage:
+            master_df = stage.out(downcast_master_df(master_df, imaging_columns))
 
     return master_df
 
+######## dashboard ###########
+
+def make_dashboard(master_df, out_dir, title="BAARD dashboard"):
+    """
+    Writes the html dashboard of the master sheet to out_dir (index.html, one shared plotly.js and per-panel data
+    files loaded when a panel is scrolled to), see dashboard.build_dashboard.
+
+    Returns:
+        pd.DataFrame: Written files and their sizes.
+    """
+    from dashboard import build_dashboard
 
+    files = build_dashboard(master_df, out_dir, title=title)
+    print(f"Dashboard written to {os.path.join(out_dir, 'index.html')} ({files['bytes'].sum() / 1e6:.1f} MB)")
+    return files
@@ -0,0 +1,191 @@
+# Build cache for the BAARD master sheet. make_master_df uses this to avoid re-reading every CSV from the NAS
+# when nothing (or only a few files) changed since the last build.
+#
+# The cache lives in a local folder and holds:
+#   manifest.json       -- fingerprint (path, mtime, size, content hash) of every input, the columns each derived stage produced,
+#                          and the build version (hash of the build code) they were made with
+#   tables/<name>.parquet -- local copy of each source table and of the finished master sheet
+
+
+import os
+import json
+import hashlib
+import pandas as pd
+
+
+MANIFEST_NAME = "manifest.json"
+HASH_CHUNK_SIZE = 1 << 20  # read 1 MB at a time when hashing
+
+
+def file_fingerprint(path, previous=None):
+    """
+    Fingerprint a file by path, mtime, size and content hash.
+
+    The content hash is only recomputed when mtime or size moved, so checking an unchanged file is a single stat call.
+
+    Args:
+        path (str): Path to the file.
+        previous (dict): Fingerprint recorded for this file on the last build, if any.
+
+    Returns:
+        dict: {"path", "mtime", "size", "hash"}
+    """
+    stat = os.stat(path)
+    fingerprint = {"path": os.path.abspath(path), "mtime": stat.st_mtime, "size": stat.st_size}
+
+    if (previous and previous.get("path") == fingerprint["path"] and previous.get("mtime") == fingerprint["mtime"]
+            and previous.get("size") == fingerprint["size"]):
+        fingerprint["hash"] = previous.get("hash")
+        return fingerprint
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    fingerprint["hash"] = digest.hexdigest()
+    return fingerprint
+
+
+def same_content(old, new):
+    # a touched file with identical bytes still counts as unchanged
+    if not old or not new:
+        return False
+    return old.get("path") == new.get("path") and old.get("hash") == new.get("hash")
+
+
+class BuildCache:
+    """
+    Local cache of source tables, fingerprints and the last master sheet build.
+
+    Args:
+        cache_dir (str): Local folder to keep the cache in (created if missing). Keep this off the NAS.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.table_dir = os.path.join(cache_dir, "tables")
+        os.makedirs(self.table_dir, exist_ok=True)
+        self.manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+        self.manifest = self._load_manifest()
+        self.changed = set()
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"sources": {}, "stages": {}}
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            # a broken manifest just means a full rebuild
+            return {"sources": {}, "stages": {}}
+        manifest.setdefault("sources", {})
+        manifest.setdefault("stages", {})
+        return manifest
+
+    def save(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    ######## build version ###########
+
+    def check_version(self, version):
+        """
+        Compare the version of the build code with the one the cache was made with. Call before check_source.
+
+        On a mismatch every fingerprint and stage is forgotten, so all sources count as changed and the master
+        sheet is rebuilt in full instead of serving tables made by older code.
+
+        Args:
+            version (str): Hash of the build code, e.g. baard.master_build_version().
+
+        Returns:
+            bool: True if the version changed (or the cache has none).
+        """
+        if self.manifest.get("version") == version:
+            return False
+        self.manifest["sources"] = {}
+        self.manifest["stages"] = {}
+        self.manifest["version"] = version
+        return True
+
+    ######## fingerprints ###########
+
+    def check_source(self, name, paths):
+        """
+        Fingerprint the file(s) behind a source and record whether they changed since the last build.
+
+        Args:
+            name (str): Source name, e.g. "phq9".
+            paths (str or list): File path, or list of file paths for sources built from several files.
+
+        Returns:
+            bool: True if the source changed (or was never cached).
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        previous = {fp["path"]: fp for fp in self.manifest["sources"].get(name, [])}
+        current = [file_fingerprint(p, previous.get(os.path.abspath(p))) for p in sorted(paths)]
+
+        changed = (len(current) != len(previous)
+                   or not all(same_content(previous.get(fp["path"]), fp) for fp in current)
+                   or not self.has_table(name))
+
+        self.manifest["sources"][name] = current
+        if changed:
+            self.changed.add(name)
+        return changed
+
+    def is_changed(self, *names):
+        return any(name in self.changed for name in names)
+
+    ######## tables ###########
+
+    def _table_path(self, name, ext):
+        safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+        return os.path.join(self.table_dir, f"{safe_name}.{ext}")
+
+    def has_table(self, name):
+        return os.path.exists(self._table_path(name, "parquet")) or os.path.exists(self._table_path(name, "pkl"))
+
+    def read_table(self, name, columns=None):
+        path = self._table_path(name, "parquet")
+        if os.path.exists(path):
+            return pd.read_parquet(path, columns=columns)
+        df = pd.read_pickle(self._table_path(name, "pkl"))
+        return df[columns] if columns is not None else df
+
+    def table_columns(self, name):
+        # column names of a cached table, from the parquet schema without reading the data
+        path = self._table_path(name, "parquet")
+        if os.path.exists(path):
+            import pyarrow.parquet as pq
+            return list(pq.read_schema(path).names)
+        return list(pd.read_pickle(self._table_path(name, "pkl")).columns)
+
+    def write_table(self, name, df):
+        """
+        Write a table to the local cache as Parquet.
+
+        Columns that pyarrow can't store (e.g. object columns mixing numbers and strings from read_csv)
+        make the table fall back to a pickle, so values are never altered by the cache.
+        """
+        parquet_path = self._table_path(name, "parquet")
+        pickle_path = self._table_path(name, "pkl")
+        try:
+            df.to_parquet(parquet_path, index=False)
+            if os.path.exists(pickle_path):
+                os.remove(pickle_path)
+        except (ImportError, ValueError, TypeError):
+            if os.path.exists(parquet_path):
+                os.remove(parquet_path)
+            df.to_pickle(pickle_path)
+
+    ######## derived stages ###########
+
+    def stage_columns(self, name):
+        return self.manifest["stages"].get(name)
+
+    def set_stage_columns(self, name, columns):
+        self.manifest["stages"][name] = list(columns)
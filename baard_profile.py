@@ -0,0 +1,261 @@
+# Stage-level profiling of the master sheet build. make_master_df(profile=...) (or BAARD_PROFILE=<path> in the
+# environment) records every step -- record_id scan, each source read, each merge, each derived-column stage, the
+# column layout, cache writes -- with:
+#   wall time, rows and columns in and out,
+#   peak traced memory during the step (tracemalloc, includes numpy/pandas buffers) and the process RSS after it.
+#
+# The result is one JSON file in Chrome trace format (open it in chrome://tracing or https://ui.perfetto.dev), with
+# the same records as a flat list under "stages" so two runs can be compared:
+#
+#   BAARD_PROFILE=profile_new.json python build_master.py
+#   from baard_profile import compare_profiles
+#   compare_profiles("profile_old.json", "profile_new.json")
+
+
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+ENV_VAR = "BAARD_PROFILE"
+MEMORY_ENV_VAR = "BAARD_PROFILE_MEMORY"  # "0" turns off tracemalloc (it slows allocation-heavy steps down)
+DEFAULT_PATH = "baard_profile.json"
+
+
+######## memory ###########
+
+def current_rss_mb():
+    # resident memory of this process now, from /proc where there is one (Linux), else the peak from getrusage
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3  # bytes on macOS, kB elsewhere
+
+
+def _shape(df):
+    # (rows, columns) of a DataFrame (or anything with a shape), (None, None) otherwise
+    shape = getattr(df, "shape", None)
+    if shape is None:
+        return None, None
+    return shape[0], shape[1] if len(shape) > 1 else 1
+
+
+######## profiler ###########
+
+class StageRecord:
+    # what a stage's with-block gets: set the output with .out(df), extra fields with .args
+    def __init__(self, name, category, df_in, args):
+        self.name = name
+        self.category = category
+        self.rows_in, self.cols_in = _shape(df_in)
+        self.rows_out, self.cols_out = None, None
+        self.args = dict(args)
+        self.peak_bytes = 0
+
+    def out(self, df):
+        self.rows_out, self.cols_out = _shape(df)
+        return df
+
+
+class StageProfiler:
+    """
+    Records nested stages with wall time, shapes and memory.
+
+    Args:
+        path (str): Where write() puts the trace (default DEFAULT_PATH).
+        memory (bool): Trace Python allocations with tracemalloc for the peak memory of each stage.
+    """
+
+    enabled = True
+
+    def __init__(self, path=None, memory=True):
+        self.path = path or DEFAULT_PATH
+        self.memory = memory
+        self.records = []
+        self._stack = []
+        self._origin = time.perf_counter()
+        self._started_tracemalloc = False
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    @contextmanager
+    def stage(self, name, category="stage", df_in=None, **args):
+        """
+        Times the with-block as one stage.
+
+            with profiler.stage("read:blood", "read") as stage:
+                df = stage.out(read_master_source(baard_dir, "blood"))
+
+        Args:
+            name (str): Stage name, unique within a run so runs can be compared by name.
+            category (str): Group of the stage (read, merge, derive, ...), the trace's "cat".
+            df_in (pd.DataFrame): Input table, for rows_in / cols_in.
+            **args: Extra fields stored with the record (e.g. cached=True).
+        """
+        record = StageRecord(name, category, df_in, args)
+        if self.memory and tracemalloc.is_tracing():
+            # the peak counter is global: keep what the enclosing stage reached so far before resetting it
+            if self._stack:
+                self._stack[-1].peak_bytes = max(self._stack[-1].peak_bytes, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        self._stack.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            wall = time.perf_counter() - start
+            self._stack.pop()
+            entry = {
+                "name": name,
+                "category": category,
+                "depth": len(self._stack),
+                "start_s": round(start - self._origin, 6),
+                "wall_s": round(wall, 6),
+                "rows_in": record.rows_in,
+                "cols_in": record.cols_in,
+                "rows_out": record.rows_out,
+                "cols_out": record.cols_out,
+            }
+            if self.memory and tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, record.peak_bytes)
+                entry["peak_traced_mb"] = round((peak - traced_before) / 1e6, 3)
+                entry["traced_delta_mb"] = round((current - traced_before) / 1e6, 3)
+                if self._stack:
+                    self._stack[-1].peak_bytes = max(self._stack[-1].peak_bytes, peak)
+            rss = current_rss_mb()
+            entry["rss_mb"] = round(rss, 1) if rss is not None else None
+            entry.update(record.args)
+            self.records.append(entry)
+
+    def to_frame(self):
+        # one row per stage, in start order
+        return pd.DataFrame(self.records).sort_values("start_s", kind="stable").reset_index(drop=True)
+
+    def trace_events(self):
+        # complete ("X") events in microseconds; the stage fields go into args so they show up in the viewer
+        pid, tid = os.getpid(), threading.get_ident()
+        return [{
+            "name": record["name"],
+            "cat": record["category"],
+            "ph": "X",
+            "ts": record["start_s"] * 1e6,
+            "dur": record["wall_s"] * 1e6,
+            "pid": pid,
+            "tid": tid,
+            "args": {key: value for key, value in record.items() if key not in ("name", "category", "start_s", "wall_s")},
+        } for record in sorted(self.records, key=lambda record: record["start_s"])]
+
+    def write(self, path=None, metadata=None):
+        """
+        Writes the trace: {"traceEvents": [...], "stages": [...], "otherData": metadata}.
+
+        Returns:
+            str: The written path.
+        """
+        path = path or self.path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        trace = {
+            "traceEvents": self.trace_events(),
+            "displayTimeUnit": "ms",
+            "stages": sorted(self.records, key=lambda record: record["start_s"]),
+            "otherData": {"python": sys.version.split()[0], "pandas": pd.__version__,
+                          "memory": self.memory, **(metadata or {})},
+        }
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(trace, f, indent=1, default=str)
+        os.replace(f"{path}.tmp", path)
+        return path
+
+    def close(self):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+
+class NullProfiler:
+    # same interface, records nothing: what make_master_df uses when profiling is off
+    enabled = False
+
+    @contextmanager
+    def stage(self, name, category="stage", df_in=None, **args):
+        yield _NULL_RECORD
+
+    def write(self, path=None, metadata=None):
+        return None
+
+    def close(self):
+        pass
+
+
+class _NullRecord:
+    args = {}
+
+    def out(self, df):
+        return df
+
+
+_NULL_RECORD = _NullRecord()
+
+
+def get_profiler(profile=None):
+    """
+    Profiler for one build.
+
+    Args:
+        profile: False: off. True: on, written to DEFAULT_PATH. A path: on, written there.
+            None: from the BAARD_PROFILE environment variable ("", "0" or unset: off, "1": DEFAULT_PATH, else a path).
+
+    Returns:
+        StageProfiler or NullProfiler
+    """
+    if profile is None:
+        profile = os.environ.get(ENV_VAR, "")
+        profile = False if profile in ("", "0") else (True if profile == "1" else profile)
+    if profile is False:
+        return NullProfiler()
+    memory = os.environ.get(MEMORY_ENV_VAR, "1") != "0"
+    return StageProfiler(None if profile is True else profile, memory=memory)
+
+
+######## comparing runs ###########
+
+def read_profile(path):
+    # the stage records of a written profile
+    with open(path) as f:
+        return pd.DataFrame(json.load(f)["stages"])
+
+
+def compare_profiles(before, after, columns=("wall_s", "peak_traced_mb", "rows_out", "cols_out")):
+    """
+    Stage-by-stage comparison of two profiles (paths or profilers), matched by stage name.
+
+    Returns:
+        pd.DataFrame: One row per stage with <column>_before, <column>_after and wall_ratio (after / before),
+        slowest stages of the later run first.
+    """
+    frames = []
+    for profile in (before, after):
+        frame = read_profile(profile) if isinstance(profile, str) else profile.to_frame()
+        frames.append(frame.set_index("name")[[col for col in columns if col in frame.columns]])
+    merged = frames[0].join(frames[1], how="outer", lsuffix="_before", rsuffix="_after")
+    if "wall_s_before" in merged.columns:
+        merged["wall_ratio"] = merged["wall_s_after"] / merged["wall_s_before"]
+    sort_by = "wall_s_after" if "wall_s_after" in merged.columns else merged.columns[0]
+    return merged.sort_values(sort_by, ascending=False)
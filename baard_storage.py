@@ -0,0 +1,324 @@
+# Columnar storage for the master sheet (and its _centile / _fs variants) and the processed tables.
+#
+# Tables are written as Parquet (or Feather) with explicit dtypes instead of CSV text, so a reload gets back the same
+# types without re-parsing, takes a fraction of the memory, and can read only the columns a model needs:
+#   record_id, site, medication_group      -> category
+#   0/1 flags (has_smri, on_bup_week2, ...) -> nullable Int8 (missing stays missing)
+#   imaging (thickness, volumes, FA, ...)  -> float32
+#
+#   from baard_storage import write_table, read_table
+#   write_table(master_df, "baard_master_sheet.parquet")
+#   df = read_table("baard_master_sheet.parquet", columns=["record_id", "remission_status"] + thickness_vars)
+
+
+import os
+import re
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+FORMATS = {".parquet": "parquet", ".feather": "feather", ".csv": "csv"}
+COMPRESSION = "zstd"
+
+CATEGORICAL_COLUMNS = ["record_id", "site", "medication_group"]
+
+FLAG_COLUMNS = [
+    "has_smri", "has_fmri", "has_dwi", "has_blood",
+    "taking_bup", "taking_arp", "had_fall", "BMI_extreme",
+    "remission_status", "response_status",
+]
+FLAG_PATTERNS = [r"^on_(bup|arp)_week\d+$"]
+
+# regional sMRI measures, FA and connectivity columns of the processed imaging tables
+IMAGING_PATTERNS = [
+    r"_(thickness|volume|area|thickavg|surfavg|grayvol)$",
+    r"(^|_)(FA|fa)(_|$)",
+    r"(^|_)(conn|connectivity)(_|$)",
+]
+
+
+######## dtype rules ###########
+
+def _matches(col, patterns):
+    return any(re.search(pattern, str(col)) for pattern in patterns)
+
+
+def _is_flag(values):
+    # numeric/bool column whose values (apart from missing) are all 0 or 1
+    if not (pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values)):
+        return False
+    present = values.dropna()
+    return bool(present.isin([0, 1]).all())
+
+
+def storage_dtypes(df, imaging_columns=None):
+    """
+    Picks the stored dtype of every column of df that has a rule (see the module header).
+
+    Rules only apply where they don't change a value: a "flag" column holding something else than 0/1, or an
+    "imaging" column that isn't numeric, keeps its dtype. Imaging columns are checked before they become float32:
+    integer columns only when every value is exactly representable (up to 2**24), float columns when every value
+    survives at float32 precision (no overflow to inf, no underflow to 0). Columns that fail keep their dtype, with
+    a warning.
+
+    Args:
+        df (pd.DataFrame): Table to store.
+        imaging_columns (list): Extra columns to store as float32 (e.g. the columns of the fmri source, whose names
+            don't follow a pattern).
+
+    Returns:
+        dict: column -> dtype, only for columns that change.
+    """
+    imaging_columns = set(imaging_columns or ())
+    dtypes, kept = {}, []
+    for col in df.columns:
+        values = df[col]
+        if col in CATEGORICAL_COLUMNS:
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                dtypes[col] = "category"
+        elif col in FLAG_COLUMNS or _matches(col, FLAG_PATTERNS):
+            if _is_flag(values) and values.dtype != "Int8":
+                dtypes[col] = "Int8"
+        elif col in imaging_columns or _matches(col, IMAGING_PATTERNS):
+            if pd.api.types.is_float_dtype(values) or pd.api.types.is_integer_dtype(values):
+                if values.dtype != np.float32:
+                    if _float32_safe(values):
+                        dtypes[col] = "float32"
+                    else:
+                        kept.append(col)
+        elif values.dtype == object:
+            # read_csv leaves columns mixing numbers and text (e.g. mini_6) as objects of several types, which
+            # parquet can't store; as text they read back the same as from a CSV
+            kinds = {type(v) for v in values.dropna()}
+            if len(kinds) > 1:
+                dtypes[col] = "string"
+    if kept:
+        warnings.warn(f"Not storing as float32, values would change: {', '.join(map(str, kept))}")
+    return dtypes
+
+
+def _float32_safe(values):
+    # integers must come back exactly, floats within float32 precision (see _lossless)
+    with np.errstate(over="ignore"):
+        converted = values.astype("float32")
+    if pd.api.types.is_integer_dtype(values):
+        present = values.notna().to_numpy()
+        return bool((values.to_numpy(dtype=np.float64, na_value=np.nan)[present] ==
+                     converted.to_numpy(dtype=np.float64)[present]).all())
+    return _lossless(values, converted)
+
+
+def apply_storage_dtypes(df, imaging_columns=None):
+    # copy of df with the storage dtypes, see storage_dtypes
+    dtypes = storage_dtypes(df, imaging_columns)
+    return df.astype(dtypes) if dtypes else df
+
+
+######## in-memory downcasting ###########
+# the same column families for a table kept in RAM (make_master_df(downcast=True)): flags without missing values
+# become uint8, integers the smallest integer type that holds them, site and medication fields categoricals and
+# imaging float32. record_id stays as it is, it's unique per row so a categorical wouldn't save anything.
+
+MEDICATION_PATTERNS = [r"^week\d+_med\d+$", r"^medication_group$"]
+MEMORY_CATEGORICAL_COLUMNS = ["site", "medication_group"]
+
+
+def downcast_rule(col, values, imaging_columns=()):
+    """
+    Column family and smaller dtype of one column.
+
+    Returns:
+        tuple: (family, dtype), dtype is None when the column stays as it is.
+    """
+    if col in MEMORY_CATEGORICAL_COLUMNS or _matches(col, MEDICATION_PATTERNS):
+        if values.dtype == object or pd.api.types.is_string_dtype(values):
+            return "category", "category"
+        return "category", None
+    if (col in FLAG_COLUMNS or _matches(col, FLAG_PATTERNS)) and _is_flag(values):
+        dtype = "UInt8" if values.isna().any() else "uint8"
+        return "flag", dtype if values.dtype != dtype else None
+    if col in imaging_columns or _matches(col, IMAGING_PATTERNS):
+        if pd.api.types.is_float_dtype(values) and values.dtype != np.float32:
+            return "imaging", "float32"
+        return "imaging", None
+    if pd.api.types.is_integer_dtype(values) and not pd.api.types.is_extension_array_dtype(values) and len(values):
+        kind = "unsigned" if values.min() >= 0 else "integer"
+        dtype = pd.to_numeric(values, downcast=kind).dtype
+        return "integer", dtype if dtype != values.dtype else None
+    return "other", None
+
+
+def _lossless(before, after):
+    # same missing values, and the same values (float32 within its precision, which is the point of storing it)
+    if not np.array_equal(before.isna().to_numpy(), after.isna().to_numpy()):
+        return False
+    present = before.notna().to_numpy()
+    if after.dtype == np.float32:
+        old = before.to_numpy(dtype=np.float64)[present]
+        new = after.to_numpy(dtype=np.float64)[present]
+        with np.errstate(invalid="ignore"):
+            return bool(np.all(np.isfinite(new) == np.isfinite(old)) and
+                        np.all(np.abs(new - old) <= np.finfo(np.float32).eps * np.abs(old) + np.finfo(np.float32).tiny))
+    if isinstance(after.dtype, pd.CategoricalDtype):
+        return bool((before.to_numpy(dtype=object)[present] == after.astype(object).to_numpy()[present]).all())
+    return bool((before.to_numpy(dtype=np.float64, na_value=np.nan)[present] ==
+                 after.to_numpy(dtype=np.float64, na_value=np.nan)[present]).all())
+
+
+def downcast_dtypes(df, imaging_columns=None, validate=True):
+    """
+    Shrinks the dtypes of a table by column family and reports the memory it saved.
+
+    Args:
+        df (pd.DataFrame): Table (not changed).
+        imaging_columns (list): Extra columns to treat as imaging (e.g. all columns of the smri, fmri and dwi sources).
+        validate (bool): Compare every converted column with the original; columns where a value would change
+            (e.g. imaging values too large for float32) keep their dtype, with a warning.
+
+    Returns:
+        tuple: (downcast copy of df, report DataFrame with columns, converted, MB before and MB after per family
+        and a total row).
+    """
+    imaging_columns = set(imaging_columns or ())
+    families, dtypes = {}, {}
+    for col in df.columns:
+        family, dtype = downcast_rule(col, df[col], imaging_columns)
+        families[col] = family
+        if dtype is not None:
+            dtypes[col] = dtype
+    with np.errstate(over="ignore"):
+        out = df.astype(dtypes) if dtypes else df.copy()
+
+    if validate:
+        changed = [col for col in dtypes if not _lossless(df[col], out[col])]
+        if changed:
+            warnings.warn(f"Not downcasting columns whose values would change: {', '.join(map(str, changed))}")
+            for col in changed:
+                out[col] = df[col]
+                del dtypes[col]
+
+    before = df.memory_usage(deep=True, index=False)
+    after = out.memory_usage(deep=True, index=False)
+    family = pd.Series(families)
+    report = pd.DataFrame({
+        "columns": family.value_counts(),
+        "converted": family[list(dtypes)].value_counts(),
+        "MB before": before.groupby(family).sum() / 1e6,
+        "MB after": after.groupby(family).sum() / 1e6,
+    }).fillna({"converted": 0})
+    report.loc["total"] = [len(df.columns), len(dtypes), before.sum() / 1e6, after.sum() / 1e6]
+    report.index.name = "family"
+    return out, report.astype({"columns": int, "converted": int}).reset_index()
+
+
+######## reading and writing ###########
+
+def table_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Unknown table format {extension!r} for {path}, use one of {', '.join(FORMATS)}")
+    return FORMATS[extension]
+
+
+def write_table(df, path, imaging_columns=None, typed=True):
+    """
+    Writes a table as Parquet or Feather (by extension) with the storage dtypes.
+
+    The file is written next to its final path first and then moved in place, so a reader never sees half a file.
+
+    Args:
+        df (pd.DataFrame): Table to write (its index is not stored).
+        path (str): .parquet or .feather (.csv writes plain CSV, for exports).
+        imaging_columns (list): Extra float32 columns, see storage_dtypes.
+        typed (bool): Apply the storage dtypes (False stores the dtypes df already has).
+
+    Returns:
+        pd.DataFrame: The table as stored.
+    """
+    fmt = table_format(path)
+    if typed:
+        df = apply_storage_dtypes(df, imaging_columns)
+    df = df.reset_index(drop=True)
+
+    tmp_path = f"{path}.tmp"
+    if fmt == "parquet":
+        df.to_parquet(tmp_path, index=False, compression=COMPRESSION)
+    elif fmt == "feather":
+        df.to_feather(tmp_path, compression=COMPRESSION)
+    else:
+        df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return df
+
+
+def read_table(path, columns=None):
+    """
+    Reads a table, only the given columns when columns is set (Parquet and Feather only read those from disk).
+
+    CSV files are read too (with usecols), so code can switch from the CSV master sheets one file at a time.
+
+    Args:
+        path (str): .parquet, .feather or .csv file.
+        columns (list): Columns to read, in this order (default: all).
+
+    Returns:
+        pd.DataFrame
+    """
+    fmt = table_format(path)
+    columns = list(columns) if columns is not None else None
+    if fmt == "parquet":
+        return pd.read_parquet(path, columns=columns)
+    if fmt == "feather":
+        return pd.read_feather(path, columns=columns)
+    df = pd.read_csv(path, usecols=columns, low_memory=False)
+    return df[columns] if columns is not None else df
+
+
+def table_columns(path):
+    """
+    Column names of a stored table, read from the file's schema (no data is read for Parquet/Feather).
+
+    Returns:
+        list: Column names in file order.
+    """
+    fmt = table_format(path)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(path).names)
+    if fmt == "feather":
+        import pyarrow.ipc as ipc
+        with ipc.open_file(path) as reader:
+            return list(reader.schema.names)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def convert_csv(csv_path, out_path=None, imaging_columns=None):
+    """
+    Converts a CSV table (e.g. baard_master_sheet.csv or a processed source) to Parquet next to it.
+
+    Returns:
+        str: Path of the written file.
+    """
+    out_path = out_path or os.path.splitext(csv_path)[0] + ".parquet"
+    write_table(pd.read_csv(csv_path, low_memory=False), out_path, imaging_columns)
+    return out_path
+
+
+def convert_processed_tables(baard_dir, out_dir, imaging_columns=None):
+    """
+    Converts every processed CSV of the BAARD folder to Parquet, keeping the folder structure under out_dir.
+
+    Returns:
+        dict: csv path -> parquet path.
+    """
+    from baard import list_processed_csvs
+
+    converted = {}
+    for csv_path in list_processed_csvs(baard_dir):
+        rel_path = os.path.relpath(csv_path, baard_dir)
+        out_path = os.path.join(out_dir, os.path.splitext(rel_path)[0] + ".parquet")
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        converted[csv_path] = convert_csv(csv_path, out_path, imaging_columns)
+    return converted
@@ -0,0 +1,69 @@
+# Benchmark: reorder_columns (pop/insert per move) vs apply_column_layout (one reindex)
+# on synthetic master sheets that look like the real one: clinical columns first, then wide imaging blocks,
+# with the derived columns appended at the end the way make_master_df adds them.
+#
+# usage: python benchmarks/bench_column_layout.py [n_rows]
+
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from baard import reorder_columns, apply_column_layout  # noqa: E402
+
+WIDTHS = [500, 2000, 10000]
+MARKERS = [f"marker_{i}" for i in range(22)]  # stand-ins for the 22 blood markers
+
+
+def make_sheet(n_cols, n_rows):
+    weeks = [2, 4, 6, 8, 10]
+    cols = ["record_id", "age", "bmi", "mini_addtl_q2"]
+    for week in weeks:
+        cols += [f"week{week}_date", f"week{week}_med1", f"week{week}_freq1", f"week{week}_med2", f"week{week}_freq2"]
+    cols += [f"number_falls_week{week}" for week in weeks]
+    cols += MARKERS
+
+    derived = ["remission_status", "site", "has_blood"]
+    derived += [f"on_{med}_week{week}" for week in weeks for med in ["bup", "arp"]]
+    derived += ["total_on_bup", "total_on_arp", "medication_group", "taking_bup", "taking_arp",
+                "total_number_falls", "total_number_injuries", "response_delta", "response_status", "had_fall", "BMI_extreme"]
+    derived += [f"{col}_sqrt" for col in MARKERS] + [f"{col}_log" for col in MARKERS]
+    derived += ["mini_addtl_q2_numeric", "years_with_depression"]
+
+    # fill the rest with imaging features
+    n_imaging = max(n_cols - len(cols) - len(derived), 0)
+    cols += [f"T_imaging_{i}" for i in range(n_imaging)] + derived
+
+    data = np.random.default_rng(0).random((n_rows, len(cols)))
+    return pd.DataFrame(data, columns=cols)
+
+
+def time_it(func, df, repeats):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        frame = df.copy()
+        start = time.perf_counter()
+        result = func(frame)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(n_rows=1000):
+    warnings.simplefilter("ignore", pd.errors.PerformanceWarning)
+    print(f"{'columns':>8} {'reorder_columns (s)':>20} {'apply_column_layout (s)':>24} {'speedup':>8}  same order")
+    for width in WIDTHS:
+        sheet = make_sheet(width, n_rows)
+        repeats = 1 if width >= 10000 else 3
+        old_time, old = time_it(reorder_columns, sheet, repeats)
+        new_time, new = time_it(apply_column_layout, sheet, repeats)
+        same = list(old.columns) == list(new.columns) and old.equals(new)
+        print(f"{width:>8} {old_time:>20.4f} {new_time:>24.4f} {old_time / new_time:>7.1f}x  {same}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,101 @@
+# Benchmark: memory held by the parsed concepts, old dataclass Concept (defaultdict(set) per field) vs the slotted,
+# interned Concept, on synthetic UMLS releases (see umls_fixture.py). Reports traced bytes per concept
+# for the whole concepts dict, names and codes included.
+#
+# usage: python benchmarks/bench_concept_memory.py [n_rows ...]   (default: 1000000 5000000)
+
+import collections
+import gc
+import importlib
+import os
+import sys
+import tempfile
+import tracemalloc
+from dataclasses import dataclass
+from typing import Set, Tuple, Dict
+
+os.environ.setdefault('TQDM_DISABLE', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from umls_fixture import write_fixture  # noqa: E402
+
+# the package __init__ shadows the module name with the class, so import the module itself
+parser_module = importlib.import_module('umlsparser.UMLSParser')
+
+SIZES = [1000000, 5000000]
+
+
+@dataclass(init=False, repr=True, eq=True)
+class LegacyConcept:
+    # the Concept class before the slotted rewrite, kept here for the comparison
+    __cui: str
+    __tui: str
+    __preferred_names: Dict[str, Set[str]]
+    __all_names: Dict[str, Set[str]]
+    __definitions: Set[Tuple[str, str]]
+    __source_ids: Dict[str, Set[str]]
+
+    def __init__(self, cui: str):
+        self.__cui = cui
+        self.__tui = None
+        self.__preferred_names = collections.defaultdict(set)
+        self.__all_names = collections.defaultdict(set)
+        self.__definitions = set()
+        self.__source_ids = collections.defaultdict(set)
+
+    def __add_mrconso_data__(self, data: dict):
+        self.__all_names[data['LAT']].add(data['STR'])
+        if data['TS'] == 'P':
+            self.__preferred_names[data['LAT']].add(data['STR'])
+        if data['SAB'] != '' and data['CODE'] != '':
+            self.__source_ids[data['SAB']].add(data['CODE'])
+
+    def __add_mrconso_row__(self, lat: str, ts: str, sab: str, code: str, string: str):
+        # the parser passes the raw fields since the RRF reader rewrite
+        self.__add_mrconso_data__({'LAT': lat, 'TS': ts, 'SAB': sab, 'CODE': code, 'STR': string})
+
+    def __add_mrdef_data__(self, data: dict):
+        self.__definitions.add((data.get('DEF'), data.get('SAB')))
+
+    def __add_mrsty_data__(self, data: dict):
+        self.__tui = data.get('TUI')
+
+    def __freeze__(self):
+        pass
+
+    def __hash__(self):
+        return hash(self.__cui)
+
+
+def measure(path, concept_class):
+    original = parser_module.Concept
+    parser_module.Concept = concept_class
+    try:
+        gc.collect()
+        tracemalloc.start()
+        parser = parser_module.UMLSParser(path)
+        gc.collect()
+        used, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        parser_module.Concept = original
+    n_concepts = len(parser.concepts)
+    del parser
+    gc.collect()
+    return n_concepts, used, peak
+
+
+def main(sizes=SIZES):
+    parser_module.logger.setLevel('WARNING')
+    print(f"{'rows':>9} {'concepts':>9} {'old B/concept':>14} {'new B/concept':>14} {'saved':>6} "
+          f"{'old peak MB':>12} {'new peak MB':>12}")
+    for n_rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            write_fixture(tmp, n_rows)
+            n_concepts, old_used, old_peak = measure(tmp, LegacyConcept)
+            _, new_used, new_peak = measure(tmp, parser_module.Concept)
+        print(f"{n_rows:>9} {n_concepts:>9} {old_used / n_concepts:>14.0f} {new_used / n_concepts:>14.0f} "
+              f"{1 - new_used / old_used:>6.0%} {old_peak / 2 ** 20:>12.0f} {new_peak / 2 ** 20:>12.0f}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
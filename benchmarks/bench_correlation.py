@@ -0,0 +1,65 @@
+# Benchmark: pandas DataFrame.corr() + to_csv / read_csv (how corr_master.csv and friends are made) vs
+# correlation.dataframe_corr + .npy / .parquet, on a synthetic imaging table with a few percent missing values
+# (filled in for spearman, where pandas re-ranks every pair and the two only agree without missing values).
+#
+# usage: python benchmarks/bench_correlation.py [n_columns] [n_rows] [missing_fraction]   (default: 2000 300 0.05)
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from correlation import dataframe_corr, read_corr, save_corr  # noqa: E402
+
+
+def make_table(n_columns, n_rows, missing_fraction, seed=0):
+    rnd = np.random.default_rng(seed)
+    # a shared component so the correlations aren't all ~0, like regional thickness
+    values = 2.5 + 0.1 * rnd.normal(size=(n_rows, 1)) + 0.1 * rnd.normal(size=(n_rows, n_columns))
+    values[rnd.random(values.shape) < missing_fraction] = np.nan
+    return pd.DataFrame(values, columns=[f"region_{i}_thickness" for i in range(n_columns)])
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    n_columns = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    missing_fraction = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    df = make_table(n_columns, n_rows, missing_fraction)
+    print(f"{n_rows} rows x {n_columns} columns, {missing_fraction:.0%} missing\n")
+
+    print(f"{'compute':<32}{'seconds':>10}")
+    for name, method in (("pearson", "pearson"), ("spearman", "spearman")):
+        complete = df.fillna(df.mean()) if method == "spearman" else df
+        pandas_time, expected = timed(complete.corr, method=method)
+        fast_time, result = timed(dataframe_corr, complete, method=method)
+        difference = np.nanmax(np.abs(expected.to_numpy() - result.to_numpy()))
+        label = f"{name}{' (no missing)' if method == 'spearman' else ''}"
+        print(f"{'pandas ' + label:<32}{pandas_time:>10.3f}")
+        print(f"{'matrix ' + label:<32}{fast_time:>10.3f}   {pandas_time / fast_time:.0f}x, max |difference| {difference:.1e}")
+
+    corr = dataframe_corr(df)
+    print(f"\n{'storage':<10}{'MB':>8}{'write s':>10}{'read s':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for extension in ("csv", "npy", "parquet"):
+            path = os.path.join(tmp, f"corr.{extension}")
+            if extension == "csv":
+                write_time, _ = timed(corr.to_csv, path)
+            else:
+                write_time, _ = timed(save_corr, path, corr)
+            read_time, _ = timed(read_corr, path)
+            print(f"{extension:<10}{os.path.getsize(path) / 1e6:>8.1f}{write_time:>10.3f}{read_time:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
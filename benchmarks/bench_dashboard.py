@@ -0,0 +1,155 @@
+# Benchmark: dashboard pages as plotly express figures of the participant rows, each written with write_html (its own
+# copy of plotly.js, every row embedded), vs dashboard.build_dashboard (aggregated panels, one shared plotly.js,
+# compressed per-panel data), on a synthetic master sheet: build time, page size, and the data a browser has to
+# decode per panel. When playwright (with chromium) is installed, the render times of both pages are measured in a
+# headless browser too.
+#
+# usage: python benchmarks/bench_dashboard.py [n_rows]   (default: 50000)
+
+import base64
+import gzip
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from dashboard import build_dashboard  # noqa: E402
+
+
+def make_master(n_rows, seed=0):
+    rnd = np.random.default_rng(seed)
+    site = rnd.choice(["UP", "UT", "WU", "UC", "CU"], n_rows)
+    baseline = rnd.integers(10, 45, n_rows).astype(float)
+    week10 = np.clip(baseline - rnd.normal(10, 8, n_rows), 0, None).round()
+    return pd.DataFrame({
+        "record_id": [f"{s}{10000 + i}" for i, s in enumerate(site)],
+        "site": site,
+        "medication_group": rnd.choice(["BUPROPION", "ARIPIPRAZOLE", "OTHER"], n_rows),
+        "has_smri": rnd.integers(0, 2, n_rows),
+        "has_fmri": rnd.integers(0, 2, n_rows),
+        "has_dwi": rnd.integers(0, 2, n_rows),
+        "has_blood": rnd.integers(0, 2, n_rows),
+        "baseline_madrs": baseline,
+        "week10_madrs": np.where(rnd.random(n_rows) < 0.2, np.nan, week10),
+        "remission_status": np.where(week10 <= 10, 1, 0),
+    })
+
+
+def row_level_pages(master_df, out_dir):
+    # the usual way: px figures straight from the rows, one self-contained html each
+    modalities = master_df.melt(id_vars=["record_id", "site"], value_vars=["has_smri", "has_fmri", "has_dwi", "has_blood"],
+                                var_name="modality", value_name="available")
+    figures = {
+        "enrollment": px.histogram(master_df, x="site", color="medication_group"),
+        "modalities": px.histogram(modalities, x="site", y="available", color="modality", barmode="group",
+                                   histfunc="avg"),
+        "remission": px.density_heatmap(master_df, x="site", y="medication_group", z="remission_status",
+                                        histfunc="avg"),
+        "madrs": px.scatter(master_df, x="baseline_madrs", y="week10_madrs", color="remission_status",
+                            hover_data=["record_id"]),
+    }
+    sizes = {}
+    for name, fig in figures.items():
+        path = os.path.join(out_dir, f"{name}.html")
+        fig.write_html(path)
+        sizes[name] = os.path.getsize(path)
+    return sizes
+
+
+def decode_embedded(path):
+    # parses the data and layout JSON that write_html puts into Plotly.newPlot("id", data, layout, config)
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+    decoder = json.JSONDecoder()
+    position = html.index("[", html.index("Plotly.newPlot("))
+    data, position = decoder.raw_decode(html, position)
+    layout, _ = decoder.raw_decode(html, html.index("{", position))
+    return data, layout
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def browser_render_ms(page_paths):
+    # render time of each page in headless chromium, None without playwright
+    try:
+        from playwright.sync_api import sync_playwright
+    except ImportError:
+        return None
+    times = {}
+    with sync_playwright() as p:
+        browser = p.chromium.launch()
+        page = browser.new_page()
+        for name, path in page_paths.items():
+            start = time.perf_counter()
+            page.goto(f"file://{os.path.abspath(path)}")
+            if name == "dashboard":
+                # scroll every panel into view and wait until all of them rendered
+                n_panels = page.locator(".panel").count()
+                for i in range(n_panels):
+                    page.locator(".panel").nth(i).scroll_into_view_if_needed()
+                page.wait_for_function(f"Object.keys(window.BAARD_RENDER_MS).length == {n_panels}")
+            else:
+                page.wait_for_selector(".main-svg")
+            times[name] = (time.perf_counter() - start) * 1000
+        browser.close()
+    return times
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    master_df = make_master(n_rows)
+    print(f"{n_rows} participants\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        row_dir, dash_dir = os.path.join(tmp, "rows"), os.path.join(tmp, "dashboard")
+        os.makedirs(row_dir)
+        row_time, row_sizes = timed(row_level_pages, master_df, row_dir)
+        dash_time, files = timed(build_dashboard, master_df, dash_dir)
+        # a second build reuses the plotly.js bundle already in the folder
+        rebuild_time, _ = timed(build_dashboard, master_df, dash_dir)
+
+        print(f"{'build':<34}{'seconds':>10}")
+        print(f"{'px figures + write_html':<34}{row_time:>10.2f}")
+        print(f"{'build_dashboard':<34}{dash_time:>10.2f}")
+        print(f"{'build_dashboard (bundle exists)':<34}{rebuild_time:>10.2f}")
+
+        data = files[files["file"].str.startswith("data/")].assign(panel=lambda d: d["file"].str.extract(r"data/(\w+)\.js")[0])
+        print(f"\n{'panel':<14}{'row-level page MB':>18}{'panel file KB':>15}{'panel JSON KB':>15}"
+              f"{'decode ms (rows)':>18}{'decode ms (panel)':>19}")
+        for row in data.itertuples():
+            row_json_time, _ = timed(decode_embedded, os.path.join(row_dir, f"{row.panel}.html"))
+            with open(os.path.join(dash_dir, row.file), encoding="ascii") as f:
+                payload = re.search(r'"([A-Za-z0-9+/=]+)";', f.read()).group(1)
+            panel_time, _ = timed(lambda: json.loads(gzip.decompress(base64.b64decode(payload))))
+            print(f"{row.panel:<14}{row_sizes[row.panel] / 1e6:>18.2f}{row.bytes / 1e3:>15.1f}{row.json_bytes / 1e3:>15.1f}"
+                  f"{row_json_time * 1000:>18.1f}{panel_time * 1000:>19.1f}")
+
+        bundle = files.loc[files["file"].str.endswith(".min.js"), "bytes"].sum()
+        print(f"\nrow-level pages, total        {sum(row_sizes.values()) / 1e6:8.2f} MB ({len(row_sizes)} copies of plotly.js)")
+        print(f"dashboard, total              {files['bytes'].sum() / 1e6:8.2f} MB "
+              f"(plotly.js {bundle / 1e6:.2f} MB once, index.html {files['bytes'].iloc[0] / 1e3:.1f} KB, "
+              f"panel data {data['bytes'].sum() / 1e3:.1f} KB)")
+
+        render = browser_render_ms({"dashboard": os.path.join(dash_dir, "index.html"),
+                                    **{name: os.path.join(row_dir, f"{name}.html") for name in row_sizes}})
+        if render is None:
+            print("\nrender times: install playwright (and `playwright install chromium`) to measure them in a browser")
+        else:
+            print("\nrender ms (headless chromium, until drawn): " +
+                  ", ".join(f"{name} {ms:.0f}" for name, ms in render.items()))
+
+
+if __name__ == "__main__":
+    main()
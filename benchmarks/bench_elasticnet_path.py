@@ -0,0 +1,103 @@
+# Benchmark: LogisticRegressionCV(elasticnet, saga) refit from scratch on every outer split (the notebook's
+# run_outer_loop) vs the warm-started regularization path of elasticnet_path.py, on a synthetic sMRI + clinical
+# feature set with the raw scales of the real one (age in years, MADRS, cortical thickness in mm, volumes in mm3).
+# Both run serially so only the solvers are compared.
+#
+# On the raw features saga stops (tol=1e-4) far from the optimum, so the elastic-net objective of the refit models is
+# compared as well. The coefficients are compared on a standardized copy of the same data, where saga does converge.
+#
+# usage: python benchmarks/bench_elasticnet_path.py [n_splits] [n_participants]   (default: 5 180)
+
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from elasticnet_path import StandardizedDesign, fit_elasticnet_logistic  # noqa: E402
+from remission_cv import MODEL_PARAMS, PATH_MODEL_PARAMS, make_splits, run_outer_loop  # noqa: E402
+
+# (name, mean, sd) of the clinical columns
+CLINICAL = [("age", 70, 6), ("sex", 0.4, 0.5), ("edu_lvl", 15, 3), ("baseline_madrs", 25, 5),
+            ("mini_addtl_q1", 30, 15), ("athf_f1_total_trials_v2", 1.5, 1), ("years_with_depression", 20, 12)]
+N_THICKNESS = 68  # Desikan regions, both hemispheres
+N_VOLUMES = 14  # subcortical volumes
+
+
+def make_smri_clinical(n_participants, seed=0):
+    rnd = np.random.default_rng(seed)
+    columns = {name: rnd.normal(mean, sd, n_participants) for name, mean, sd in CLINICAL}
+    # regional thickness shares a global component, like real cortical thickness
+    global_thickness = rnd.normal(0, 1, n_participants)
+    for i in range(N_THICKNESS):
+        columns[f"thickness_{i}"] = 2.5 + 0.1 * (0.7 * global_thickness + 0.7 * rnd.normal(0, 1, n_participants))
+    for i in range(N_VOLUMES):
+        columns[f"volume_{i}"] = rnd.normal(4000 + 500 * i, 600, n_participants)
+    X = pd.DataFrame(columns)
+
+    z = (X - X.mean()) / X.std()
+    logit = -1.0 + 0.6 * z["baseline_madrs"] * -1 + 0.4 * z["thickness_3"] + 0.4 * z["volume_2"] - 0.3 * z["age"]
+    y = (rnd.random(n_participants) < 1 / (1 + np.exp(-logit))).astype(int)
+    return X, y
+
+
+def timed(X, y, n_splits, model_params):
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # saga convergence warnings
+        result = run_outer_loop(X, y, n_splits=n_splits, model_params=model_params, n_jobs=1)
+    return time.perf_counter() - start, result
+
+
+def objective(X, y, coef, intercept, C, l1_ratio):
+    # what LogisticRegression(penalty="elasticnet") minimizes
+    eta = X @ coef + intercept
+    return C * np.sum(np.logaddexp(0, eta) - y * eta) + l1_ratio * np.abs(coef).sum() + (1 - l1_ratio) / 2 * coef @ coef
+
+
+def objective_gap(X, y, C=1.0, l1_ratio=0.5):
+    # a single fit on the first outer split's training rows, objective reached by saga and by the path solver
+    train_idx, _ = make_splits(y, 1)[0]
+    X, y = X.to_numpy()[train_idx], y[train_idx]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        saga = LogisticRegression(penalty="elasticnet", solver="saga", C=C, l1_ratio=l1_ratio, max_iter=1_000_000).fit(X, y)
+    design = StandardizedDesign(X)
+    coef, intercept = design.to_original(*fit_elasticnet_logistic(design, y.astype(float), C, l1_ratio)[:2])
+    return objective(X, y, saga.coef_[0], saga.intercept_[0], C, l1_ratio), objective(X, y, coef, intercept, C, l1_ratio)
+
+
+def compare(X, y, n_splits):
+    saga_time, saga = timed(X, y, n_splits, MODEL_PARAMS)
+    path_time, path = timed(X, y, n_splits, PATH_MODEL_PARAMS)
+    print(f"{'solver':<8}{'seconds':>10}{'per split':>12}{'pooled AUC':>12}")
+    print(f"{'saga':<8}{saga_time:>10.2f}{saga_time / n_splits:>12.2f}{saga['pooled_auc']:>12.4f}")
+    print(f"{'path':<8}{path_time:>10.2f}{path_time / n_splits:>12.2f}{path['pooled_auc']:>12.4f}")
+    coef_diff = (saga["df_coefs"] - path["df_coefs"]).abs().to_numpy()
+    same_c = (saga["df_metrics"]["best C"] == path["df_metrics"]["best C"]).mean()
+    saga_objective, path_objective = objective_gap(X, y)
+    print(f"speedup: {saga_time / path_time:.1f}x, same best C in {same_c:.0%} of splits, "
+          f"max |coef difference| {coef_diff.max():.2e} (largest |coef| {saga['df_coefs'].abs().to_numpy().max():.2e})")
+    print(f"objective at C=1 (lower is better): saga {saga_objective:.4f}, path {path_objective:.4f}\n")
+
+
+def main():
+    n_splits = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    n_participants = int(sys.argv[2]) if len(sys.argv) > 2 else 180
+    X, y = make_smri_clinical(n_participants)
+    print(f"{n_participants} participants, {X.shape[1]} features, {n_splits} outer splits, "
+          f"{len(MODEL_PARAMS['Cs'])} Cs x {len(MODEL_PARAMS['l1_ratios'])} l1_ratios x {MODEL_PARAMS['cv']} inner folds\n")
+
+    print("raw features")
+    compare(X, y, n_splits)
+    print("standardized features")
+    compare((X - X.mean()) / X.std(), y, n_splits)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Benchmark and regression check: startup cost of `import baard`, measured with `python -X importtime` in fresh
+# interpreters. baard's own share (everything it imports apart from pandas and numpy, which every job needs anyway)
+# has to stay under BUDGET_MS, and none of the upload / plotting / dashboard libraries may be imported with it.
+# For comparison it also times importing those libraries, what `import baard` used to cost on top of pandas.
+#
+# usage: python benchmarks/bench_import_time.py [runs] [budget_ms]   (default: 5 100), exits 1 over budget
+
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+BUDGET_MS = 100
+BASE_MODULES = ["pandas", "numpy"]
+LAZY_MODULES = ["plotly", "gspread", "oauth2client", "upsetplot", "matplotlib"]
+LAZY_IMPORTS = ["plotly.express", "plotly.io", "plotly.graph_objects", "gspread", "oauth2client.service_account",
+                "upsetplot", "matplotlib.pyplot"]
+
+
+def import_times(code):
+    """
+    Runs code in a fresh interpreter with -X importtime.
+
+    Returns:
+        list: (depth, module, cumulative ms) per module in import order, depth 0 for the modules code imports itself.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True,
+                            text=True, check=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        # nested imports are indented by two spaces per level after the separator's space
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative_us) / 1000))
+    return entries
+
+
+def children(entries, parent):
+    # modules imported directly by a depth-0 module, (module, ms); importtime lists them before their parent
+    end = next(i for i, (depth, name, _) in enumerate(entries) if depth == 0 and name == parent)
+    start = max((i + 1 for i, (depth, _, _) in enumerate(entries[:end]) if depth == 0), default=0)
+    return [(name, ms) for depth, name, ms in entries[start:end] if depth == 1]
+
+
+def baard_times():
+    entries = import_times("import baard")
+    total = next(ms for depth, name, ms in entries if depth == 0 and name == "baard")
+    imported = children(entries, "baard")
+    own = total - sum(ms for name, ms in imported if name in BASE_MODULES)
+    return total, own, imported, {name for _, name, _ in entries}
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else BUDGET_MS
+
+    measured = [baard_times() for _ in range(runs)]
+    total = statistics.median(run[0] for run in measured)
+    own = statistics.median(run[1] for run in measured)
+    lazy = statistics.median(
+        sum(ms for depth, name, ms in import_times(f"import pandas, numpy; import {', '.join(LAZY_IMPORTS)}")
+            if depth == 0 and name in LAZY_IMPORTS)
+        for _ in range(runs))
+
+    print(f"median of {runs} fresh interpreters\n")
+    print(f"{'import':<46}{'ms':>8}")
+    print(f"{'baard':<46}{total:>8.0f}")
+    print(f"{'baard without pandas/numpy':<46}{own:>8.0f}   budget {budget:.0f}")
+    print(f"{'upload/plot libraries (loaded on first use)':<46}{lazy:>8.0f}")
+
+    _, _, imported, modules = measured[0]
+    slowest = sorted(imported, key=lambda item: -item[1])[:8]
+    print("\nslowest imports of baard: " + ", ".join(f"{name} {ms:.0f}" for name, ms in slowest))
+
+    loaded = sorted({name.split(".")[0] for name in modules} & set(LAZY_MODULES))
+    failures = []
+    if loaded:
+        failures.append(f"imported at startup: {', '.join(loaded)}")
+    if own > budget:
+        failures.append(f"baard without pandas/numpy takes {own:.0f} ms, budget {budget:.0f} ms")
+    if failures:
+        print("\nFAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
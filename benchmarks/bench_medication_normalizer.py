@@ -0,0 +1,88 @@
+# Benchmark: the notebook's clean_medication_string applied with .map (medication_form_clean.ipynb) vs
+# medication_normalizer (compiled patterns + LRU cache, and the unique-values batch API),
+# on a synthetic corpus of free-text medication entries where, like in the real data, most strings repeat.
+#
+# usage: python benchmarks/bench_medication_normalizer.py [n_entries]   (default: 1000000)
+
+import json
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+import medication_normalizer  # noqa: E402
+from medication_normalizer import normalize_medication, normalize_medication_series  # noqa: E402
+
+DRUGS = ["SERTRALINE", "ESCITALOPRAM", "BUPROPION", "ARIPIPRAZOLE", "VENLAFAXINE", "LITHIUM CARBONATE", "ATORVASTATIN",
+         "METFORMIN", "LEVOTHYROXINE", "AMLODIPINE", "VITAMIN D3", "FISH OIL", "ASPIRIN", "LISINOPRIL", "MIRTAZAPINE",
+         "POLYETHYLENE GLYCOL 3350", "TRAZODONE", "QUETIAPINE", "DONEPEZIL", "CALCIUM", "MAGNESIUM OXIDE"]
+DOSES = ["", "5 mg", "10mg", "50 MG", "150 mg", "0.5 MG", "1000 IU", "20 mg/5 mL", "81mg"]
+FORMS = ["", "TAB", "tablet", "CAPS", "XL", "ER", "EXTENDED-RELEASE", "SOLUTION", "(generic)"]
+FREQS = ["", "BID", "qhs", "PRN", "once daily", "QAM"]
+
+
+def make_corpus(n_entries, n_distinct=20000, seed=0):
+    rnd = random.Random(seed)
+    distinct = []
+    for _ in range(n_distinct):
+        parts = [rnd.choice(FORMS[6:8]) if rnd.random() < 0.1 else "", rnd.choice(DRUGS), rnd.choice(DOSES),
+                 rnd.choice(FORMS), rnd.choice(FREQS)]
+        entry = " ".join(part for part in parts if part)
+        if rnd.random() < 0.15:
+            entry += " + " + rnd.choice(DRUGS)
+        if rnd.random() < 0.3:
+            entry = entry.lower()
+        distinct.append(entry)
+    # a few entries make up most rows, like the real medication sheets
+    weights = [1 / (rank + 1) for rank in range(n_distinct)]
+    corpus = rnd.choices(distinct, weights=weights, k=n_entries)
+    for i in range(0, n_entries, 50):
+        corpus[i] = None
+    return pd.Series(corpus, dtype=object)
+
+
+def load_notebook_cleaner():
+    # the notebook cell that defines clean_medication_string, up to where it is applied to the dataframe
+    with open(os.path.join(ROOT, "medication_form_clean.ipynb")) as f:
+        notebook = json.load(f)
+    for cell in notebook["cells"]:
+        source = "".join(cell["source"])
+        if "def clean_medication_string" in source:
+            namespace = {}
+            exec("from typing import List\n" + source.split("# ---- apply to your df")[0], namespace)
+            return namespace["clean_medication_string"]
+    raise RuntimeError("clean_medication_string not found in medication_form_clean.ipynb")
+
+
+def time_it(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main(n_entries=1000000):
+    corpus = make_corpus(n_entries)
+    notebook_clean = load_notebook_cleaner()
+    print(f"{n_entries} entries, {corpus.nunique()} distinct")
+
+    old_time, old = time_it(lambda: corpus.map(notebook_clean))
+    medication_normalizer.normalize_medication.cache_clear()
+    cached_time, cached = time_it(lambda: corpus.map(normalize_medication))
+    medication_normalizer.normalize_medication.cache_clear()
+    batch_time, batch = time_it(lambda: normalize_medication_series(corpus))
+
+    same = old.equals(cached.map(list)) and old.equals(batch.map(list))
+    print(f"{'method':>36} {'seconds':>9} {'entries/s':>12} {'speedup':>8}")
+    for label, seconds in [("notebook .map(clean_medication_string)", old_time),
+                           ("cached .map(normalize_medication)", cached_time),
+                           ("normalize_medication_series", batch_time)]:
+        print(f"{label:>36} {seconds:>9.2f} {n_entries / seconds:>12,.0f} {old_time / seconds:>7.1f}x")
+    print(f"same output: {same}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
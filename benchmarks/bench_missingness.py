@@ -0,0 +1,100 @@
+# Benchmark: the issues list built per participant (list of missing columns per row, expanded to missing_var_N
+# columns, then df.apply(trim_to_missing_count, axis=1)) vs missingness.PresenceMatrix, plus per-site completeness and
+# UpSet counts (from_indicators + groupby vs upset_counts), on a synthetic master sheet.
+#
+# usage: python benchmarks/bench_missingness.py [n_rows] [n_columns]   (default: 2000 300)
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from missingness import PresenceMatrix  # noqa: E402
+
+
+def make_master(n_rows, n_columns, seed=0):
+    rnd = np.random.default_rng(seed)
+    site = rnd.choice(["UP", "UT", "WU", "UC", "CU"], n_rows)
+    values = rnd.normal(size=(n_rows, n_columns))
+    # a few percent missing everywhere, and whole blocks missing for participants without a scan
+    values[rnd.random(values.shape) < 0.03] = np.nan
+    values[rnd.random(n_rows) < 0.3, n_columns // 2:] = np.nan
+    df = pd.DataFrame(values, columns=[f"var{i}" for i in range(n_columns)])
+    df.insert(0, "site", site)
+    df.insert(0, "record_id", [f"{s}{10000 + i}" for i, s in enumerate(site)])
+    return df
+
+
+def trim_to_missing_count(row):
+    # as in baard.py
+    count = int(row['total_missing'])
+    return row[:2 + count]
+
+
+def issues_per_row(df, columns):
+    missing = df[columns].isna()
+    rows = [[record_id, int(row.sum())] + [col for col in columns if row[col]]
+            for record_id, (_, row) in zip(df["record_id"], missing.iterrows())]
+    n_wide = max(len(row) for row in rows) - 2
+    issues = pd.DataFrame(rows, columns=["record_id", "total_missing"] + [f"missing_var_{i}" for i in range(1, n_wide + 1)])
+    issues = issues[issues["total_missing"] > 0]
+    # apply with rows of different lengths sorts the columns, put them back
+    return issues.apply(trim_to_missing_count, axis=1)[issues.columns]
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_columns = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    df = make_master(n_rows, n_columns)
+    columns = [col for col in df.columns if col.startswith("var")]
+    print(f"{n_rows} rows x {n_columns} columns\n")
+
+    print(f"{'step':<36}{'seconds':>10}")
+    row_time, expected = timed(issues_per_row, df, columns)
+    print(f"{'per row + trim_to_missing_count':<36}{row_time:>10.3f}")
+    build_time, presence = timed(PresenceMatrix, df, columns)
+    print(f"{'PresenceMatrix (packed bits)':<36}{build_time:>10.3f}")
+    list_time, issues = timed(presence.issues_list)
+    print(f"{'  issues_list (long)':<36}{list_time:>10.3f}")
+    wide_time, wide = timed(presence.issues_wide)
+    print(f"{'  issues_wide':<36}{wide_time:>10.3f}   {row_time / (build_time + wide_time):.0f}x")
+    same = all([str(v) for v in a if pd.notna(v)] == [str(v) for v in b if pd.notna(v)]
+               for a, b in zip(expected.itertuples(index=False), wide.itertuples(index=False))) and len(expected) == len(wide)
+    print(f"{'  same issues list':<36}{str(same):>10}")
+
+    pandas_time, _ = timed(lambda: df[columns].notna().groupby(df["site"]).mean())
+    site_time, _ = timed(presence.site_completeness)
+    print(f"{'site completeness, pandas groupby':<36}{pandas_time:>10.3f}")
+    print(f"{'  site_completeness':<36}{site_time:>10.3f}")
+
+    groups = {f"block{i}": columns[i * 50:(i + 1) * 50] for i in range(min(6, n_columns // 50))}
+    try:
+        from upsetplot import from_indicators
+
+        def upset_pandas():
+            indicators = pd.DataFrame({name: df[cols].notna().all(axis=1) for name, cols in groups.items()})
+            return from_indicators(indicators).groupby(level=list(range(len(groups)))).size()
+
+        upset_time, _ = timed(upset_pandas)
+        print(f"{'UpSet counts, from_indicators':<36}{upset_time:>10.3f}")
+    except ImportError:
+        pass
+    counts_time, _ = timed(presence.upset_counts, groups)
+    print(f"{'  upset_counts':<36}{counts_time:>10.3f}")
+
+    print(f"\npresence matrix: {presence.bits.nbytes / 1e6:.2f} MB packed, "
+          f"{df[columns].isna().to_numpy().nbytes / 1e6:.2f} MB as bools; {len(issues)} missing values")
+
+
+if __name__ == "__main__":
+    main()
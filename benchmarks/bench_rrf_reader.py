@@ -0,0 +1,65 @@
+# Benchmark: MRCONSO tokenizing the way UMLSParser did it before (split every line, build the full 18 field dict, then
+# check the language filter against a list) vs RRFReader (chunked reads, partial split, filters on raw fields),
+# on synthetic MRCONSO files (see umls_fixture.py). Reports lines per second.
+#
+# usage: python benchmarks/bench_rrf_reader.py [n_rows ...]   (default: 1000000 5000000 10000000)
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from umlsparser.RRFReader import RRFReader, RRF_FIELDS  # noqa: E402
+from umls_fixture import write_fixture  # noqa: E402
+
+SIZES = [1000000, 5000000, 10000000]
+COLUMNS = ['CUI', 'LAT', 'TS', 'SAB', 'CODE', 'STR']
+
+
+def legacy_rows(path, language_filter):
+    # the loop of the old __parse_mrconso__, minus the concept building
+    for line in open(path):
+        line = line.split('|')
+        data = {
+            'CUI': line[0], 'LAT': line[1], 'TS': line[2], 'LUI': line[3], 'STT': line[4], 'SUI': line[5],
+            'ISPREF': line[6], 'AUI': line[7], 'SAUI': line[8], 'SCUI': line[9], 'SDUI': line[10], 'SAB': line[11],
+            'TTY': line[12], 'CODE': line[13], 'STR': line[14], 'SRL': line[15], 'SUPPRESS': line[16], 'CVF': line[17]
+        }
+        if len(language_filter) != 0 and data.get('LAT') not in language_filter:
+            continue
+        yield data
+
+
+def reader_rows(path, filters):
+    return RRFReader(path, RRF_FIELDS['MRCONSO'], COLUMNS, filters=filters)
+
+
+def time_rows(rows):
+    start = time.perf_counter()
+    n = sum(1 for _ in rows)
+    return n, time.perf_counter() - start
+
+
+def main(sizes=SIZES):
+    cases = [
+        ('no filter', [], {}),
+        ('LAT=ENG', ['ENG'], {'LAT': ['ENG']}),
+    ]
+    print(f"{'lines':>9} {'filter':>10} {'kept':>9} {'before (lines/s)':>17} {'after (lines/s)':>16} {'speedup':>8}")
+    for n_rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(write_fixture(tmp, n_rows), 'META', 'MRCONSO.RRF')
+            for label, language_filter, filters in cases:
+                kept_old, old_time = time_rows(legacy_rows(path, language_filter))
+                kept_new, new_time = time_rows(reader_rows(path, filters))
+                assert kept_old == kept_new
+                print(f"{n_rows:>9} {label:>10} {kept_new:>9} {n_rows / old_time:>17,.0f} {n_rows / new_time:>16,.0f} "
+                      f"{old_time / new_time:>7.1f}x")
+            # filters the old loop did not have at all
+            kept, new_time = time_rows(reader_rows(path, {'LAT': ['ENG'], 'SAB': ['RXNORM', 'MSH'], 'SUPPRESS': ['N']}))
+            print(f"{n_rows:>9} {'+SAB,SUPP':>10} {kept:>9} {'-':>17} {n_rows / new_time:>16,.0f}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
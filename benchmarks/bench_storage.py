@@ -0,0 +1,74 @@
+# Benchmark: the master sheet as CSV (pd.read_csv, how every modeling cell loads it) vs baard_storage Parquet and
+# Feather with explicit dtypes, on a synthetic master sheet: load time and memory of the whole table, and of the
+# 40 columns a model uses.
+#
+# usage: python benchmarks/bench_storage.py [n_rows] [n_imaging_columns]   (default: 2000 1000)
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from baard_storage import read_table, write_table  # noqa: E402
+
+
+def make_master(n_rows, n_imaging, seed=0):
+    rnd = np.random.default_rng(seed)
+    site = rnd.choice(["UP", "UT", "WU", "UC", "CU"], n_rows)
+    columns = {
+        "record_id": [f"{s}{10000 + i}" for i, s in enumerate(site)],
+        "site": site,
+        "medication_group": rnd.choice(["BUPROPION", "ARIPIPRAZOLE", np.nan], n_rows),
+        "age": rnd.normal(70, 6, n_rows).round(1),
+        "baseline_madrs": rnd.integers(10, 40, n_rows).astype(float),
+        "remission_status": np.where(rnd.random(n_rows) < 0.1, np.nan, rnd.integers(0, 2, n_rows)),
+        "gender": rnd.choice(["Male", "Female"], n_rows),
+    }
+    for flag in ["has_smri", "has_fmri", "has_dwi", "has_blood", "taking_bup", "taking_arp", "had_fall", "BMI_extreme"]:
+        columns[flag] = rnd.integers(0, 2, n_rows)
+    for week in [2, 4, 6, 8, 10]:
+        columns[f"on_bup_week{week}"] = rnd.integers(0, 2, n_rows)
+        columns[f"on_arp_week{week}"] = rnd.integers(0, 2, n_rows)
+    for i in range(n_imaging):
+        columns[f"region{i}_thickness"] = rnd.normal(2.5, 0.2, n_rows).round(5)
+    return pd.DataFrame(columns)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_imaging = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    master = make_master(n_rows, n_imaging)
+    model_columns = ["record_id", "remission_status", "age", "baseline_madrs"] + [f"region{i}_thickness" for i in range(36)]
+    print(f"{n_rows} rows x {master.shape[1]} columns, model reads {len(model_columns)} columns\n")
+
+    print(f"{'format':<10}{'MB on disk':>12}{'write s':>10}{'read all s':>12}{'MB in RAM':>11}{'read 40 s':>11}{'MB in RAM':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for extension in ("csv", "parquet", "feather"):
+            path = os.path.join(tmp, f"baard_master_sheet.{extension}")
+            if extension == "csv":
+                write_time, _ = timed(master.to_csv, path, index=False)
+                read_time, full = timed(pd.read_csv, path)
+                subset_time, subset = timed(pd.read_csv, path, usecols=model_columns)
+            else:
+                write_time, _ = timed(write_table, master, path)
+                read_time, full = timed(read_table, path)
+                subset_time, subset = timed(read_table, path, columns=model_columns)
+            print(f"{extension:<10}{os.path.getsize(path) / 1e6:>12.1f}{write_time:>10.3f}{read_time:>12.3f}"
+                  f"{full.memory_usage(deep=True).sum() / 1e6:>11.1f}{subset_time:>11.3f}"
+                  f"{subset.memory_usage(deep=True).sum() / 1e6:>11.2f}")
+        print("\nstored dtypes:", full.dtypes.astype(str).value_counts().to_dict())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Synthetic UMLS release for the umlsparser benchmarks: META/MRCONSO.RRF, META/MRDEF.RRF, META/MRSTY.RRF and NET/SRDEF
+# with the real column layout and roughly the real shape (about 4 MRCONSO rows per CUI, mostly English, a few
+# sources per concept, one or two semantic types per CUI). Content is random but deterministic for a given seed.
+#
+# usage: python benchmarks/umls_fixture.py <out_dir> <n_mrconso_rows>
+
+import os
+import random
+import sys
+
+LANGUAGES = ['ENG'] * 7 + ['SPA', 'FRE', 'GER', 'JPN', 'DUT']
+SOURCES = {
+    'ENG': ['MSH', 'RXNORM', 'SNOMEDCT_US', 'ICD10CM', 'NCI', 'MDR', 'LNC', 'CHV'],
+    'SPA': ['MDRSPA', 'SCTSPA', 'MSHSPA'],
+    'FRE': ['MDRFRE', 'MSHFRE'],
+    'GER': ['MDRGER'],
+    'JPN': ['MDRJPN'],
+    'DUT': ['MDRDUT'],
+}
+TERM_TYPES = ['PT', 'SY', 'IN', 'BN', 'PN', 'SCD', 'FN', 'LLT']
+WORDS = ['acid', 'aspirin', 'bupropion', 'aripiprazole', 'tablet', 'oral', 'pain', 'fever', 'heart', 'disease',
+         'chronic', 'vitamin', 'd3', 'oil', 'fish', 'sodium', 'chloride', 'mg', 'extended', 'release', 'injury',
+         'fracture', 'depression', 'major', 'episode', 'recurrent', 'blood', 'pressure', 'lipid', 'panel']
+TUIS = ['T{:03d}'.format(n) for n in range(1, 128)]
+ROWS_PER_CUI = 4
+
+
+def _name(rnd):
+    return ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 5))).title() + ' ' + str(rnd.randrange(1000))
+
+
+def write_fixture(base: str, n_rows: int, seed: int = 0) -> str:
+    """
+    Writes a synthetic UMLS release with n_rows MRCONSO rows to base (META and NET folders).
+    :return: base
+    """
+    rnd = random.Random(seed)
+    n_cui = max(1, n_rows // ROWS_PER_CUI)
+    os.makedirs(os.path.join(base, 'META'), exist_ok=True)
+    os.makedirs(os.path.join(base, 'NET'), exist_ok=True)
+
+    with open(os.path.join(base, 'META', 'MRCONSO.RRF'), 'w', encoding='utf-8') as f:
+        for i in range(n_rows):
+            # rows of a CUI are mostly adjacent, like in the real file
+            cui = 'C{:07d}'.format(min(i // ROWS_PER_CUI + rnd.randrange(-2, 3), n_cui - 1) if i > 8 else 0)
+            lat = rnd.choice(LANGUAGES)
+            sab = rnd.choice(SOURCES[lat])
+            code = '{}{}'.format(sab[:2], rnd.randrange(10 ** 6)) if rnd.random() > 0.05 else ''
+            f.write('|'.join([cui, lat, rnd.choice('PS'), 'L{:08d}'.format(i), 'PF', 'S{:08d}'.format(i), 'Y',
+                              'A{:08d}'.format(i), '', '', '', sab, rnd.choice(TERM_TYPES), code, _name(rnd), '0',
+                              rnd.choice('NNNNNNOEY'), '256']) + '|\n')
+
+    with open(os.path.join(base, 'META', 'MRDEF.RRF'), 'w', encoding='utf-8') as f:
+        for i in range(n_cui // 3):
+            cui = 'C{:07d}'.format(rnd.randrange(n_cui))
+            f.write('|'.join([cui, 'A{:08d}'.format(i), 'AT{}'.format(i), '', rnd.choice(['MSH', 'NCI', 'CSP', 'MSHFRE']),
+                              'Definition of ' + _name(rnd).lower(), 'N', '']) + '|\n')
+
+    with open(os.path.join(base, 'META', 'MRSTY.RRF'), 'w', encoding='utf-8') as f:
+        for c in range(n_cui):
+            for _ in range(rnd.choice([1, 1, 1, 2])):
+                f.write('|'.join(['C{:07d}'.format(c), rnd.choice(TUIS), 'A1.2', 'Some Type', 'AT{}'.format(c), '256'])
+                        + '|\n')
+
+    with open(os.path.join(base, 'NET', 'SRDEF'), 'w', encoding='utf-8') as f:
+        for tui in TUIS:
+            f.write('|'.join(['STY', tui, 'Type {}'.format(tui), 'A1.2', 'Definition of {}'.format(tui), '', '', '',
+                              'abr', '']) + '|\n')
+    return base
+
+
+if __name__ == '__main__':
+    write_fixture(sys.argv[1], int(sys.argv[2]))
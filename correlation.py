@@ -0,0 +1,268 @@
+# Correlation matrices of wide imaging tables (corr_master.csv, corr_fs.csv, corr_centile.csv: cortical thickness of
+# the three master sheet variants), computed as matrix products instead of pandas' pair-by-pair .corr().
+#
+# Columns are standardized once, missing values are handled with a mask so every pair still uses all the rows where
+# both columns have a value (pairwise deletion, like pandas), and wide tables are done in column blocks so the full
+# p x p result can be written straight to a memory-mapped .npy file. Results are stored as .npy (with the column
+# names in a .columns.json next to it) or .parquet, with a CSV export in the layout of the existing corr_*.csv files.
+#
+#   from correlation import dataframe_corr, save_corr, export_csv
+#   corr = dataframe_corr(master_df[thickness_vars])     # same values as master_df[thickness_vars].corr()
+#   save_corr("corr_master.parquet", corr)
+#   export_csv("corr_master.parquet", "corr_master.csv")
+
+
+import json
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# columns per block, a block pair is two (n_rows x BLOCK_SIZE) matrices and one BLOCK_SIZE x BLOCK_SIZE result
+BLOCK_SIZE = 2048
+METHODS = ("pearson", "spearman")
+
+
+######## preparing the data ###########
+
+def _as_matrix(data, method):
+    # float64 matrix with NaN for missing values, ranked per column for spearman
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+    frame = data if isinstance(data, pd.DataFrame) else pd.DataFrame(np.asarray(data, dtype=np.float64))
+    if method == "spearman":
+        # average ranks for ties, missing values stay missing
+        frame = frame.rank(method="average")
+    return frame.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _standardize(X):
+    # center and scale every column with its own (nan) mean and sd: correlations don't change, and the sums in
+    # the pairwise formulas stay small, which avoids cancellation for columns like volumes in mm3
+    mask = ~np.isnan(X)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # columns without any value
+        Z = X - np.nanmean(X, axis=0)
+        sd = np.sqrt(np.nanmean(Z * Z, axis=0))
+    Z /= np.where(sd > 0, sd, 1.0)
+    Z[~mask] = 0.0
+    return Z, mask.astype(np.float64), bool(mask.all())
+
+
+######## blocks ###########
+
+def _corr_block(Zx, Mx, Zy, My, complete, min_periods):
+    """
+    Correlation of every column of one block with every column of another.
+
+    Args:
+        Zx, Zy (np.ndarray): Standardized columns, 0 where missing.
+        Mx, My (np.ndarray): 1.0 where a value is present.
+        complete (bool): No missing values in either block.
+        min_periods (int): Minimum number of rows both columns need.
+
+    Returns:
+        tuple: r and pairwise row counts, (n_x_columns, n_y_columns).
+    """
+    if complete:
+        n = np.full((Zx.shape[1], Zy.shape[1]), float(Zx.shape[0]))
+        sxy = Zx.T @ Zy
+        sxx = np.broadcast_to((Zx * Zx).sum(axis=0)[:, None], n.shape)
+        syy = np.broadcast_to((Zy * Zy).sum(axis=0)[None, :], n.shape)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            r = sxy / np.sqrt(sxx * syy)
+    else:
+        # sums over the rows where both columns have a value, all as matrix products
+        n = Mx.T @ My
+        sx = Zx.T @ My
+        sy = Mx.T @ Zy
+        sxx = (Zx * Zx).T @ My
+        syy = Mx.T @ (Zy * Zy)
+        sxy = Zx.T @ Zy
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = sxy - sx * sy / n
+            var_x = sxx - sx * sx / n
+            var_y = syy - sy * sy / n
+            r = cov / np.sqrt(var_x * var_y)
+    # constant columns (and pairs with fewer than 2 rows) have no correlation
+    r[~np.isfinite(r) | (n < max(min_periods, 2))] = np.nan
+    np.clip(r, -1.0, 1.0, out=r)
+    return r, n
+
+
+def iter_corr_blocks(data, other=None, method="pearson", min_periods=1, block_size=BLOCK_SIZE):
+    """
+    Yields the correlation matrix block by block, for tables too wide to hold the whole result in memory.
+
+    Args:
+        data (pd.DataFrame or np.ndarray): Rows are participants, columns are variables.
+        other (pd.DataFrame or np.ndarray): Correlate data's columns with these (same rows), default data itself.
+        method (str): "pearson" or "spearman". For spearman with missing values each column is ranked over all its
+            values, while pandas re-ranks every pair over the rows both have (same result without missing values).
+        min_periods (int): Pairs with fewer rows in common get NaN.
+        block_size (int): Columns per block.
+
+    Yields:
+        tuple: (row slice, column slice, r block, pairwise count block).
+    """
+    X = _as_matrix(data, method)
+    Zx, Mx, complete_x = _standardize(X)
+    if other is None:
+        Zy, My, complete_y = Zx, Mx, complete_x
+    else:
+        Y = _as_matrix(other, method)
+        if Y.shape[0] != X.shape[0]:
+            raise ValueError(f"data has {X.shape[0]} rows, other has {Y.shape[0]}")
+        Zy, My, complete_y = _standardize(Y)
+
+    for i in range(0, Zx.shape[1], block_size):
+        rows = slice(i, min(i + block_size, Zx.shape[1]))
+        for j in range(0, Zy.shape[1], block_size):
+            cols = slice(j, min(j + block_size, Zy.shape[1]))
+            # without missing values in the block pair the masks aren't needed
+            complete = complete_x and complete_y or (Mx[:, rows].all() and My[:, cols].all())
+            r, n = _corr_block(Zx[:, rows], Mx[:, rows], Zy[:, cols], My[:, cols], complete, min_periods)
+            yield rows, cols, r, n
+
+
+######## full matrices ###########
+
+def corr_matrix(data, other=None, method="pearson", min_periods=1, block_size=BLOCK_SIZE, out=None):
+    """
+    Correlation matrix of the columns of data (or of data's columns with other's columns).
+
+    Args:
+        data, other, method, min_periods, block_size: See iter_corr_blocks.
+        out (np.ndarray): Array to write r into, e.g. a np.lib.format.open_memmap for results larger than memory.
+
+    Returns:
+        tuple: r (n_columns x n_other_columns) and the pairwise row counts (int32).
+    """
+    n_x = np.shape(data)[1]
+    n_y = n_x if other is None else np.shape(other)[1]
+    r = np.empty((n_x, n_y)) if out is None else out
+    counts = np.empty((n_x, n_y), dtype=np.int32)
+    for rows, cols, r_block, n_block in iter_corr_blocks(data, other, method, min_periods, block_size):
+        r[rows, cols] = r_block
+        counts[rows, cols] = n_block
+    if other is None:
+        # exactly 1 on the diagonal where a column has a correlation with itself (not constant, enough values)
+        diagonal = np.flatnonzero(np.isfinite(np.diagonal(r)))
+        r[diagonal, diagonal] = 1.0
+    return r, counts
+
+
+def dataframe_corr(df, other=None, method="pearson", min_periods=1, block_size=BLOCK_SIZE):
+    """
+    Drop-in for df.corr(method, min_periods) (numeric columns), or the cross-correlation with another frame.
+
+    Returns:
+        pd.DataFrame: Correlations labeled with the column names.
+    """
+    df = df.select_dtypes("number")
+    if other is not None:
+        other = other.select_dtypes("number")
+    r, _ = corr_matrix(df, other, method, min_periods, block_size)
+    return pd.DataFrame(r, index=df.columns, columns=(df if other is None else other).columns)
+
+
+def paired_corr(left, right, columns=None, on="record_id", method="pearson"):
+    """
+    Correlation of each variable with the same variable in another table, e.g. a thickness region in the master
+    sheet vs in the FreeSurfer or centile version (the corr_summary of the notebook), on the participants in both.
+
+    Returns:
+        pd.Series: r per column.
+    """
+    columns = list(columns) if columns is not None else [col for col in left.columns if col != on and col in right.columns]
+    aligned = left[[on] + columns].merge(right[[on] + columns], on=on, suffixes=("_left", "_right"))
+    X = _as_matrix(aligned[[f"{col}_left" for col in columns]], method)
+    Y = _as_matrix(aligned[[f"{col}_right" for col in columns]], method)
+    # only the diagonal of the cross-correlation: pairwise-complete rows per column pair, vectorized over columns
+    mask = ~(np.isnan(X) | np.isnan(Y))
+    n = mask.sum(axis=0)
+    X, Y = np.where(mask, X, 0.0), np.where(mask, Y, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        X -= np.where(mask, X.sum(axis=0) / n, 0.0)
+        Y -= np.where(mask, Y.sum(axis=0) / n, 0.0)
+        r = (X * Y).sum(axis=0) / np.sqrt((X * X).sum(axis=0) * (Y * Y).sum(axis=0))
+    r[n < 2] = np.nan
+    return pd.Series(np.clip(r, -1.0, 1.0), index=columns, name="r")
+
+
+######## storage ###########
+
+def _columns_path(path):
+    return os.path.splitext(path)[0] + ".columns.json"
+
+
+def save_corr(path, corr, dtype=np.float64):
+    """
+    Writes a correlation matrix to .npy (values, plus the row and column names in <name>.columns.json) or .parquet.
+
+    Args:
+        path (str): Output file, the format comes from the extension.
+        corr (pd.DataFrame): Correlation matrix.
+        dtype: Stored value type (np.float32 halves the size).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        np.save(path, corr.to_numpy(dtype=dtype))
+        with open(_columns_path(path), "w") as f:
+            json.dump({"index": [str(name) for name in corr.index], "columns": [str(name) for name in corr.columns]}, f)
+    elif extension == ".parquet":
+        corr.astype(dtype).rename(columns=str).to_parquet(path)
+    else:
+        raise ValueError(f"Unknown correlation file type {extension!r}, use .npy or .parquet (or export_csv)")
+
+
+def write_corr_npy(path, data, other=None, method="pearson", min_periods=1, block_size=BLOCK_SIZE, dtype=np.float32):
+    """
+    Computes the correlation matrix block by block straight into a memory-mapped .npy file, so the full result is
+    never held in memory (wide connectivity tables).
+
+    Returns:
+        np.memmap: The written matrix.
+    """
+    columns = list(data.columns) if isinstance(data, pd.DataFrame) else list(range(np.shape(data)[1]))
+    other_columns = columns if other is None else (list(other.columns) if isinstance(other, pd.DataFrame) else list(range(np.shape(other)[1])))
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(len(columns), len(other_columns)))
+    corr_matrix(data, other, method, min_periods, block_size, out=out)
+    out.flush()
+    with open(_columns_path(path), "w") as f:
+        json.dump({"index": [str(name) for name in columns], "columns": [str(name) for name in other_columns]}, f)
+    return out
+
+
+def read_corr(path, mmap=False):
+    """
+    Reads a matrix written by save_corr / write_corr_npy (or a corr_*.csv file).
+
+    Args:
+        path (str): .npy, .parquet or .csv file.
+        mmap (bool): Memory-map a .npy file instead of reading it.
+
+    Returns:
+        pd.DataFrame: The correlation matrix.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        values = np.load(path, mmap_mode="r" if mmap else None)
+        with open(_columns_path(path)) as f:
+            names = json.load(f)
+        return pd.DataFrame(values, index=names["index"], columns=names["columns"], copy=False)
+    if extension == ".parquet":
+        return pd.read_parquet(path)
+    if extension == ".csv":
+        return pd.read_csv(path, index_col=0)
+    raise ValueError(f"Unknown correlation file type {extension!r}")
+
+
+def export_csv(source, path, float_format=None):
+    """
+    Writes a correlation matrix (a DataFrame or a saved .npy/.parquet file) as CSV in the layout of corr_master.csv:
+    variable names as the first column and the header.
+    """
+    corr = read_corr(source) if isinstance(source, str) else source
+    corr.to_csv(path, float_format=float_format)
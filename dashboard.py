@@ -0,0 +1,273 @@
+# Static HTML dashboard of the master sheet: enrollment, modality coverage and remission by site and medication group.
+#
+# Instead of plotly figures that embed every participant row, the master sheet is first reduced to one table of
+# counts per site, medication group, modality (has_smri / has_fmri / has_dwi) and remission_status, and the bar and
+# heatmap panels are drawn from that. Only scatter panels send participant-level points (two columns each), as WebGL
+# traces above WEBGL_THRESHOLD points. The dashboard is a folder:
+#   index.html                 page layout and the loader, no data
+#   plotly-<version>.min.js    one plotly.js bundle, shared by every dashboard written to the folder
+#   data/<panel>.js            gzip-compressed figure JSON of each panel, fetched when the panel scrolls into view
+# The panel files are scripts (not fetched JSON) so the page also works opened straight from disk (file://).
+#
+#   from dashboard import build_dashboard
+#   build_dashboard(master_df, "dashboard/")      # open dashboard/index.html
+
+
+import base64
+import gzip
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+
+
+MODALITY_COLUMNS = ["has_smri", "has_fmri", "has_dwi", "has_blood"]
+GROUP_COLUMNS = ["site", "medication_group"]
+OUTCOME_COLUMN = "remission_status"
+
+WEBGL_THRESHOLD = 1000  # points in a scatter above which it is drawn with WebGL (svg gets slow past a few thousand)
+TEMPLATE = "plotly_white"
+COMPRESSION_LEVEL = 9
+
+
+######## aggregation ###########
+
+def aggregate_master(master_df, group_columns=GROUP_COLUMNS, modality_columns=MODALITY_COLUMNS,
+                     outcome_column=OUTCOME_COLUMN):
+    """
+    Participants per combination of site, medication group, modality flags and remission status, the table every
+    bar and heatmap panel is drawn from.
+
+    Columns missing from master_df are left out; missing values are kept as their own group ("missing" for the
+    groups, -1 for the flags and the outcome).
+
+    Returns:
+        pd.DataFrame: One row per combination with an n column.
+    """
+    groups = [col for col in group_columns if col in master_df.columns]
+    flags = [col for col in modality_columns + [outcome_column] if col in master_df.columns]
+    keys = pd.DataFrame({col: master_df[col].astype("string").fillna("missing") for col in groups})
+    for col in flags:
+        keys[col] = pd.to_numeric(master_df[col], errors="coerce").fillna(-1).astype(np.int8)
+    if not len(keys.columns):
+        return pd.DataFrame({"n": [len(master_df)]})
+    return keys.value_counts(sort=False).rename("n").reset_index()
+
+
+def _total(cube, by, where=None):
+    # participants per value of the by columns (optionally where a flag column is 1)
+    cube = cube if where is None else cube[cube[where] == 1]
+    return cube.groupby(by, observed=True)["n"].sum()
+
+
+######## panels ###########
+# each panel function takes the aggregated cube (and the master sheet for the scatters) and returns a figure, or None
+# when the columns it needs aren't there
+
+def enrollment_panel(cube, master_df):
+    if not {"site", "medication_group"} <= set(cube.columns):
+        return None
+    counts = _total(cube, ["site", "medication_group"]).unstack(fill_value=0)
+    fig = go.Figure([go.Bar(name=str(group), x=counts.index, y=counts[group]) for group in counts.columns])
+    return fig.update_layout(barmode="stack", title="Participants per site and medication group",
+                             yaxis_title="participants")
+
+
+def modality_panel(cube, master_df):
+    flags = [col for col in MODALITY_COLUMNS if col in cube.columns]
+    if "site" not in cube.columns or not flags:
+        return None
+    total = _total(cube, "site")
+    fig = go.Figure([
+        go.Bar(name=flag.removeprefix("has_"), x=total.index,
+               y=(_total(cube, "site", where=flag).reindex(total.index, fill_value=0) / total).round(4),
+               customdata=_total(cube, "site", where=flag).reindex(total.index, fill_value=0),
+               hovertemplate="%{x}: %{y:.0%} (%{customdata})")
+        for flag in flags
+    ])
+    return fig.update_layout(barmode="group", title="Data available per site", yaxis_tickformat=".0%")
+
+
+def remission_panel(cube, master_df):
+    if not {"site", "medication_group", OUTCOME_COLUMN} <= set(cube.columns):
+        return None
+    known = cube[cube[OUTCOME_COLUMN] >= 0]
+    remitted = _total(known, ["medication_group", "site"], where=OUTCOME_COLUMN).unstack(fill_value=0)
+    total = _total(known, ["medication_group", "site"]).unstack(fill_value=0)
+    remitted = remitted.reindex_like(total).fillna(0)
+    rate = (remitted / total.where(total > 0)).round(4)
+    fig = go.Figure(go.Heatmap(z=rate.to_numpy(), x=rate.columns, y=rate.index, colorscale="Blues", zmin=0, zmax=1,
+                               customdata=total.to_numpy(), texttemplate="%{z:.0%}",
+                               hovertemplate="%{y} at %{x}: %{z:.0%} of %{customdata}<extra></extra>"))
+    return fig.update_layout(title="Remission rate by medication group and site")
+
+
+def scatter_figure(df, x, y, color=None, title=None, webgl_threshold=None):
+    """
+    Scatter of two columns (one trace per color value), only the plotted columns are sent, as float32, with WebGL
+    traces when there are more than webgl_threshold points (default WEBGL_THRESHOLD).
+
+    Returns:
+        go.Figure
+    """
+    webgl_threshold = WEBGL_THRESHOLD if webgl_threshold is None else webgl_threshold
+    data = df[[x, y] + ([color] if color else [])].dropna(subset=[x, y])
+    trace_type = go.Scattergl if len(data) > webgl_threshold else go.Scatter
+    groups = data.groupby(data[color].astype("string").fillna("missing")) if color else [(None, data)]
+    fig = go.Figure([
+        trace_type(x=part[x].to_numpy(dtype=np.float32), y=part[y].to_numpy(dtype=np.float32), mode="markers",
+                   name=str(name) if name is not None else y, marker={"size": 5, "opacity": 0.6})
+        for name, part in groups
+    ])
+    return fig.update_layout(title=title or f"{y} vs {x}", xaxis_title=x, yaxis_title=y,
+                             legend_title=color)
+
+
+def madrs_panel(cube, master_df):
+    if not {"baseline_madrs", "week10_madrs"} <= set(master_df.columns):
+        return None
+    return scatter_figure(master_df, "baseline_madrs", "week10_madrs",
+                          color=OUTCOME_COLUMN if OUTCOME_COLUMN in master_df.columns else None,
+                          title="MADRS at baseline and week 10")
+
+
+PANELS = [
+    ("enrollment", enrollment_panel),
+    ("modalities", modality_panel),
+    ("remission", remission_panel),
+    ("madrs", madrs_panel),
+]
+
+
+######## writing ###########
+
+def panel_payload(fig):
+    # figure JSON without the template (the page has it once), gzip-compressed and base64 encoded for a script file
+    spec = json.loads(pio.to_json(fig, validate=False))
+    spec.get("layout", {}).pop("template", None)
+    raw = json.dumps(spec, separators=(",", ":")).encode()
+    return base64.b64encode(gzip.compress(raw, COMPRESSION_LEVEL, mtime=0)).decode("ascii"), len(raw)
+
+
+def write_plotlyjs(out_dir):
+    # one bundle per plotly.js version, only written when it isn't in the folder yet
+    name = f"plotly-{get_plotlyjs_version()}.min.js"
+    path = os.path.join(out_dir, name)
+    if not os.path.exists(path):
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            f.write(get_plotlyjs())
+        os.replace(f"{path}.tmp", path)
+    return name
+
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+.panel {{ height: 480px; margin-bottom: 2em; }}
+#timings {{ color: #888; font-size: small; }}
+</style>
+<script src="{plotlyjs}"></script>
+</head>
+<body>
+<h1>{title}</h1>
+{panels}
+<p id="timings"></p>
+<script>
+window.BAARD_PANELS = {{}};
+window.BAARD_RENDER_MS = {{}};
+const TEMPLATE = {template};
+
+// panel data is a gzip + base64 string set by data/<name>.js, added as a script so file:// pages work too
+function loadScript(src) {{
+  return new Promise((resolve, reject) => {{
+    const script = document.createElement("script");
+    script.src = src;
+    script.onload = resolve;
+    script.onerror = reject;
+    document.head.appendChild(script);
+  }});
+}}
+
+async function inflate(text) {{
+  const bytes = Uint8Array.from(atob(text), c => c.charCodeAt(0));
+  const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("gzip"));
+  return JSON.parse(await new Response(stream).text());
+}}
+
+async function render(div) {{
+  const name = div.dataset.panel;
+  const start = performance.now();
+  await loadScript(div.dataset.src);
+  const spec = await inflate(window.BAARD_PANELS[name]);
+  delete window.BAARD_PANELS[name];
+  spec.layout.template = TEMPLATE;
+  await Plotly.newPlot(div, spec.data, spec.layout, {{responsive: true}});
+  window.BAARD_RENDER_MS[name] = performance.now() - start;
+  document.getElementById("timings").textContent = "render ms: " +
+    Object.entries(window.BAARD_RENDER_MS).map(([k, v]) => k + " " + v.toFixed(0)).join(", ");
+}}
+
+const observer = new IntersectionObserver(entries => {{
+  for (const entry of entries) {{
+    if (entry.isIntersecting) {{
+      observer.unobserve(entry.target);
+      render(entry.target);
+    }}
+  }}
+}}, {{rootMargin: "200px"}});
+document.querySelectorAll(".panel").forEach(div => observer.observe(div));
+</script>
+</body>
+</html>
+"""
+
+
+def build_dashboard(master_df, out_dir, panels=PANELS, title="BAARD dashboard"):
+    """
+    Writes the dashboard folder (see the module header).
+
+    Args:
+        master_df (pd.DataFrame): Master sheet.
+        out_dir (str): Output folder (created if missing), e.g. next to the master sheets.
+        panels (list): (name, function) pairs, see PANELS. A function gets the aggregated table and the master
+            sheet and returns a figure (or None to skip the panel).
+        title (str): Page title.
+
+    Returns:
+        pd.DataFrame: One row per written file: file, bytes (on disk) and json_bytes (uncompressed panel data).
+    """
+    os.makedirs(os.path.join(out_dir, "data"), exist_ok=True)
+    cube = aggregate_master(master_df)
+    plotlyjs = write_plotlyjs(out_dir)
+
+    files, divs = [], []
+    for name, panel in panels:
+        fig = panel(cube, master_df)
+        if fig is None:
+            continue
+        payload, json_bytes = panel_payload(fig)
+        rel_path = f"data/{name}.js"
+        with open(os.path.join(out_dir, rel_path), "w", encoding="ascii") as f:
+            f.write(f'window.BAARD_PANELS["{name}"] = "{payload}";\n')
+        files.append((rel_path, json_bytes))
+        divs.append(f'<div class="panel" id="{name}" data-panel="{name}" data-src="{rel_path}"></div>')
+
+    template = json.loads(pio.to_json(go.Figure(layout={"template": TEMPLATE}), validate=False))["layout"]["template"]
+    template = json.dumps(template, separators=(",", ":"))
+    with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(PAGE.format(title=title, plotlyjs=plotlyjs, panels="\n".join(divs), template=template))
+
+    rows = [("index.html", 0), (plotlyjs, 0)] + files
+    return pd.DataFrame({
+        "file": [path for path, _ in rows],
+        "bytes": [os.path.getsize(os.path.join(out_dir, path)) for path, _ in rows],
+        "json_bytes": [json_bytes for _, json_bytes in rows],
+    })
@@ -0,0 +1,200 @@
+# Feature-set sweeps of the remission models, the loops over feature_set_names in baard_log_regression.ipynb
+# (one SNP at a time on top of the clinical model, the neurocognitive tests, ...) as one scheduled run.
+#
+# The data is prepared once for all feature sets (numeric coercion, one dropna over every column used, so all
+# feature sets are evaluated on the same participants and the same splits). Every outer split is standardized once
+# over all columns, and each feature set takes its columns from that shared matrix instead of redoing
+# split/scale per feature set. All (feature set, split) fits go to one pool of worker processes.
+#
+#   from feature_sweep import run_sweep, single_feature_sets, roc_results_dict
+#   base = ["age", "sex", "edu_lvl", "baseline_madrs"]
+#   sweep = run_sweep(df, single_feature_sets(base, snp_cols), n_splits=10, threshold=0.35,
+#                     model_params=dict(MODEL_PARAMS, Cs=10, cv=4, l1_ratios=[0.1]))
+#   sweep["summary"]                  # one row per feature set
+#   roc_results = roc_results_dict(sweep)  # {name: {"fpr", "tpr", "auc"}} like the notebook
+
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from remission_cv import (METRIC_DTYPES, N_SPLITS, PRED_DTYPES, RANDOM_STATE, TEST_SIZE, THRESHOLD, fit_split,
+                          make_splits, pooled_roc, split_seeds)
+
+
+######## feature sets ###########
+
+def single_feature_sets(base, candidates, baseline_name="Clinical only"):
+    """
+    The base model plus one candidate at a time (the genetics cell), and the base model alone.
+
+    Args:
+        base (list): Columns of every model, e.g. ["age", "sex", "edu_lvl", "baseline_madrs"].
+        candidates (list): Columns to add one at a time.
+        baseline_name (str): Name of the base-only model (None leaves it out).
+
+    Returns:
+        dict: feature set name -> columns.
+    """
+    feature_sets = {candidate: list(base) + [candidate] for candidate in candidates}
+    if baseline_name is not None:
+        feature_sets[baseline_name] = list(base)
+    return feature_sets
+
+
+def prepare_sweep_data(df, feature_sets, target="remission_status", id_col="record_id"):
+    """
+    Numeric matrix of every column used by any feature set, rows with a missing value in any of them dropped once.
+
+    Returns:
+        tuple: X (np.ndarray, float64), columns (list, the column order of X), y (np.ndarray), record_ids (np.ndarray).
+    """
+    columns = list(dict.fromkeys(col for cols in feature_sets.values() for col in cols))
+    missing = [col for col in columns + [target] if col not in df.columns]
+    if missing:
+        raise KeyError(f"Columns not in the data: {', '.join(missing)}")
+
+    # to_numeric like the notebook does for mini_addtl_q1 / mini_6, for every feature column at once
+    data = df[columns].apply(pd.to_numeric, errors="coerce")
+    data[target] = df[target]
+    keep = data.notna().all(axis=1).to_numpy()
+    record_ids = df[id_col].to_numpy()[keep] if id_col in df.columns else np.flatnonzero(keep)
+    return data.loc[keep, columns].to_numpy(dtype=np.float64), columns, data.loc[keep, target].astype(int).to_numpy(), record_ids
+
+
+######## shared split cache ###########
+
+def scaled_split_cache(X, splits, scale=True):
+    """
+    One standardized copy of X per outer split, scaled with the mean and sd of that split's training rows
+    (StandardScaler fitted on the train part, applied to all rows).
+
+    Returns:
+        np.ndarray: (n_splits, n_rows, n_columns), float64. Sent to the workers once as a memory map.
+    """
+    cache = np.empty((len(splits),) + X.shape)
+    for i, (train_idx, _) in enumerate(splits):
+        if not scale:
+            cache[i] = X
+            continue
+        mean = X[train_idx].mean(axis=0)
+        sd = X[train_idx].std(axis=0)
+        cache[i] = (X - mean) / np.where(sd > 0, sd, 1.0)
+    return cache
+
+
+def _fit_cached(cache, split_index, column_index, y, train_idx, test_idx, seed, threshold, model_params):
+    # runs in the workers; only the feature set's columns of the shared matrix are taken
+    X = cache[split_index][:, column_index]
+    return fit_split(X, y, train_idx, test_idx, split_index + 1, seed, threshold, model_params)
+
+
+######## sweep ###########
+
+def run_sweep(df, feature_sets, target="remission_status", id_col="record_id", threshold=THRESHOLD, n_splits=N_SPLITS,
+              test_size=TEST_SIZE, random_state=RANDOM_STATE, model_params=None, splits=None, scale=True, n_jobs=-1,
+              verbose=0):
+    """
+    Repeated cross-validation of every feature set on the same participants and the same outer splits.
+
+    Args:
+        df (pd.DataFrame): Master sheet (or a subset of it, e.g. one medication group).
+        feature_sets (dict): Name -> list of columns, see single_feature_sets.
+        target (str): 0/1 outcome column.
+        id_col (str): Participant id column for the predictions table.
+        threshold, n_splits, test_size, random_state, model_params, splits: See remission_cv.run_outer_loop.
+        scale (bool): Standardize with each split's training rows (False fits the raw values like the notebook).
+        n_jobs (int): Worker processes for all (feature set, split) fits together (-1: all cores).
+        verbose (int): joblib progress messages.
+
+    Returns:
+        dict of pd.DataFrame:
+            summary: one row per feature set (n_features, pooled_auc, balanced threshold, mean fold metrics),
+            roc: pooled ROC points of every feature set (feature_set, fpr, tpr, threshold),
+            metrics: per-fold metrics with a feature_set column,
+            coefs: feature_set, iteration, feature, coef (long form, feature sets have different columns),
+            preds: out-of-fold predictions with a feature_set column.
+    """
+    if not feature_sets:
+        raise ValueError("No feature sets given")
+    X, columns, y, record_ids = prepare_sweep_data(df, feature_sets, target, id_col)
+    if splits is None:
+        splits = make_splits(y, n_splits, test_size, random_state)
+    seeds = split_seeds(len(splits), random_state)
+    cache = scaled_split_cache(X, splits, scale)
+
+    position = {col: i for i, col in enumerate(columns)}
+    names = list(feature_sets)
+    column_indexes = [np.array([position[col] for col in feature_sets[name]]) for name in names]
+
+    # feature set major, so the results come back grouped by feature set in split order
+    jobs = [(name_index, split_index) for name_index in range(len(names)) for split_index in range(len(splits))]
+    results = Parallel(n_jobs=n_jobs, backend="loky", verbose=verbose)(
+        delayed(_fit_cached)(cache, split_index, column_indexes[name_index], y, *splits[split_index],
+                             seeds[split_index], threshold, model_params)
+        for name_index, split_index in jobs
+    )
+
+    feature_set_dtype = pd.CategoricalDtype(names, ordered=True)
+    metrics, coefs, preds, roc, summary = [], [], [], [], []
+    for name_index, name in enumerate(names):
+        set_results = results[name_index * len(splits):(name_index + 1) * len(splits)]
+        iterations = np.arange(1, len(set_results) + 1)
+
+        set_metrics = pd.DataFrame([result["metrics"] for result in set_results], columns=list(METRIC_DTYPES))
+        metrics.append(set_metrics.assign(feature_set=name))
+
+        coef_matrix = np.vstack([result["coefs"] for result in set_results])
+        coefs.append(pd.DataFrame({
+            "feature_set": name,
+            "iteration": np.repeat(iterations, coef_matrix.shape[1]),
+            "feature": np.tile(feature_sets[name], len(set_results)),
+            "coef": coef_matrix.ravel(),
+        }))
+
+        test_idx = np.concatenate([result["test_idx"] for result in set_results])
+        y_score = np.concatenate([result["y_score"] for result in set_results])
+        preds.append(pd.DataFrame({
+            "feature_set": name,
+            "iteration": np.repeat(iterations, [len(result["test_idx"]) for result in set_results]),
+            "record_id": record_ids[test_idx],
+            "y_true": y[test_idx],
+            "y_score": y_score,
+            "y_pred": np.concatenate([result["y_pred"] for result in set_results]),
+        }))
+
+        pooled = pooled_roc(y[test_idx], y_score)
+        roc.append(pd.DataFrame({"feature_set": name, "fpr": pooled["fpr"], "tpr": pooled["tpr"],
+                                 "threshold": pooled["thresholds"]}))
+        summary.append({
+            "feature_set": name,
+            "n_features": len(feature_sets[name]),
+            "pooled_auc": pooled["pooled_auc"],
+            "balanced_threshold": pooled["balanced_threshold"],
+            "balanced_sensitivity": pooled["balanced_sensitivity"],
+            "balanced_specificity": pooled["balanced_specificity"],
+            **set_metrics[["Accuracy", "Sensitivity", "Specificity", "AUC", "Balanced Accuracy", "best C"]]
+            .mean().add_prefix("mean ").to_dict(),
+        })
+
+    def typed(frames, dtypes):
+        frame = pd.concat(frames, ignore_index=True)
+        frame = frame[["feature_set"] + [col for col in frame.columns if col != "feature_set"]]
+        return frame.astype({"feature_set": feature_set_dtype, **dtypes})
+
+    return {
+        "summary": typed([pd.DataFrame(summary)], {"n_features": "int32"}),
+        "roc": typed(roc, {}),
+        "metrics": typed(metrics, METRIC_DTYPES),
+        "coefs": typed(coefs, {"iteration": "int32", "feature": "category"}),
+        "preds": typed(preds, PRED_DTYPES),
+    }
+
+
+def roc_results_dict(sweep):
+    # the notebook's roc_results: {feature set: {"fpr", "tpr", "auc"}}, for the ROC plots
+    auc = sweep["summary"].set_index("feature_set")["pooled_auc"]
+    return {
+        name: {"fpr": points["fpr"].to_numpy(), "tpr": points["tpr"].to_numpy(), "auc": auc[name]}
+        for name, points in sweep["roc"].groupby("feature_set", observed=True, sort=False)
+    }
@@ -0,0 +1,399 @@
+# Diff-based Google Sheets sync, the "sync" mode of upload_to_gsheet (issues list, master sheet exports).
+#
+# Instead of clearing the worksheet and sending the whole DataFrame as one update, the values of the last upload are
+# kept in a local snapshot; a new upload is compared with it and only the cells that changed are sent, grouped into
+# rectangular ranges and split over several batch_update calls, each retried with exponential backoff when Sheets
+# answers with a quota (429) or server (5xx) error. The authorized client is created once per credentials file.
+#
+# Everything after opening the worksheet works on any object with the few worksheet methods used here, so the sync can
+# be tested with InMemoryWorksheet, without network access:
+#
+#   ws = InMemoryWorksheet()
+#   sync_worksheet(ws, issues_df, "snapshots/issues.json")
+#   ws.get_all_values()
+
+
+import json
+import math
+import os
+import random
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+SCOPE = [
+    'https://spreadsheets.google.com/feeds', # feeds
+    'https://www.googleapis.com/auth/spreadsheets', # google sheets
+    'https://www.googleapis.com/auth/drive.file', # files in drive
+    'https://www.googleapis.com/auth/drive' # google drive
+]
+SNAPSHOT_DIR = os.path.join(os.path.expanduser("~"), ".baard", "gsheet_snapshots")
+
+MAX_CELLS_PER_REQUEST = 50_000  # keeps each batch_update well under the request size limit
+MERGE_GAP = 3  # unchanged cells between two changed runs of a row that are re-sent to make one range of them
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0  # seconds, doubled on every retry (plus jitter), capped at BACKOFF_MAX
+BACKOFF_MAX = 64.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+######## client ###########
+
+@lru_cache(maxsize=None)
+def _authorized_client(creds_path, mtime):
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    creds = ServiceAccountCredentials.from_json_keyfile_name(creds_path, SCOPE)
+    return gspread.authorize(creds)
+
+
+def get_client(creds_path):
+    """
+    Authorized gspread client for a service account JSON key, created once per key file (and again if the file changes).
+    """
+    creds_path = os.path.abspath(creds_path)
+    return _authorized_client(creds_path, os.path.getmtime(creds_path))
+
+
+def open_worksheet(client, spreadsheet_name, worksheet_name, rows=1000, cols=26):
+    # open or create the spreadsheet and the worksheet, like upload_to_gsheet
+    import gspread
+
+    try:
+        sheet = client.open(spreadsheet_name)
+    except gspread.SpreadsheetNotFound:
+        sheet = client.create(spreadsheet_name)
+    try:
+        return sheet.worksheet(worksheet_name)
+    except gspread.WorksheetNotFound:
+        return sheet.add_worksheet(title=worksheet_name, rows=str(rows), cols=str(cols))
+
+
+######## cell grid ###########
+
+def _cell(value):
+    # a value Sheets (and the JSON snapshot) can take: missing -> empty cell, numpy scalars -> python
+    if value is None or value is pd.NA or value is pd.NaT:
+        return ""
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return float(value) if math.isfinite(value) else ("" if math.isnan(value) else str(value))
+    if isinstance(value, str):
+        return value
+    return str(value)
+
+
+def dataframe_grid(df):
+    """
+    Header row + data rows of a DataFrame as sheet cell values.
+
+    Returns:
+        list: Rows of cell values.
+    """
+    values = df.astype(object).to_numpy()
+    cells = np.frompyfunc(_cell, 1, 1)(values) if values.size else values
+    return [[_cell(col) for col in df.columns]] + cells.tolist()
+
+
+def _as_array(grid, shape):
+    # grid padded with empty cells to shape
+    array = np.full(shape, "", dtype=object)
+    for i, row in enumerate(grid):
+        array[i, :len(row)] = row
+    return array
+
+
+def a1(row, col):
+    # 1-based row/col to A1 notation
+    letters = ""
+    while col:
+        col, rest = divmod(col - 1, 26)
+        letters = chr(65 + rest) + letters
+    return f"{letters}{row}"
+
+
+def _split_block(values, row, col, max_cells):
+    # one block of values (2D array, top-left cell at 0-based row/col) as ranges of at most max_cells cells: bands of
+    # max_cells // width rows, and rows wider than max_cells cut into pieces of max_cells columns.
+    # Yields (row, col, update) with the 0-based top-left cell of each range, in row order
+    n_rows, width = values.shape
+    piece = max(1, min(width, max_cells))
+    rows_per_band = max(1, max_cells // piece)
+    for top in range(0, n_rows, rows_per_band):
+        bottom = min(top + rows_per_band, n_rows)
+        for left in range(0, width, piece):
+            right = min(left + piece, width)
+            yield row + top, col + left, {
+                "range": f"{a1(row + top + 1, col + left + 1)}:{a1(row + bottom, col + right)}",
+                "values": values[top:bottom, left:right].tolist(),
+            }
+
+
+def grid_ranges(grid, max_cells=MAX_CELLS_PER_REQUEST):
+    """
+    The whole grid as bands of full rows of at most max_cells cells, for a full upload (rows wider than max_cells
+    are cut into pieces).
+
+    Returns:
+        list: {"range", "values"} dicts for batch_update.
+    """
+    width = max((len(row) for row in grid), default=0)
+    if not width:
+        return []
+    values = _as_array(grid, (len(grid), width))
+    return [update for _, _, update in _split_block(values, 0, 0, max_cells)]
+
+
+def diff_ranges(old_grid, new_grid, merge_gap=MERGE_GAP, max_cells=MAX_CELLS_PER_REQUEST):
+    """
+    Rectangular ranges covering every cell that differs between two grids (cells only in the old grid are cleared).
+
+    Changed cells are grouped into runs per row (runs at most merge_gap cells apart become one), and runs with the
+    same columns on consecutive rows into one block. Blocks of more than max_cells cells are split like in
+    grid_ranges, so every range fits in one request.
+
+    Returns:
+        list: {"range": "B3:D7", "values": [[...], ...]} dicts for batch_update, in row order.
+    """
+    shape = (max(len(old_grid), len(new_grid)),
+             max(max((len(row) for row in old_grid), default=0), max((len(row) for row in new_grid), default=0)))
+    if 0 in shape:
+        return []
+    old, new = _as_array(old_grid, shape), _as_array(new_grid, shape)
+    # compare with types, so 1 and "1" or 1 and True count as different
+    changed = (old != new) | (np.frompyfunc(type, 1, 1)(old) != np.frompyfunc(type, 1, 1)(new))
+
+    blocks = {}  # (first col, last col) -> list of [first row, last row]
+    for row in np.flatnonzero(changed.any(axis=1)):
+        edges = np.diff(np.concatenate([[0], changed[row].view(np.int8), [0]]))
+        starts, stops = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        # close small gaps: a run continues if the next one starts within merge_gap cells, so a merged run ends
+        # where the last run before the next kept start ends
+        keep = np.concatenate([[True], starts[1:] - stops[:-1] > merge_gap])
+        starts, stops = starts[keep], np.concatenate([stops[:-1][keep[1:]], stops[-1:]])
+        for start, stop in zip(starts, stops):
+            runs = blocks.setdefault((start, stop), [])
+            if runs and runs[-1][1] == row - 1:
+                runs[-1][1] = row
+            else:
+                runs.append([row, row])
+
+    ranges = []
+    for (start, stop), runs in blocks.items():
+        for first, last in runs:
+            ranges.extend(_split_block(new[first:last + 1, start:stop], first, start, max_cells))
+    return [update for _, _, update in sorted(ranges, key=lambda item: item[:2])]
+
+
+def chunk_updates(updates, max_cells=MAX_CELLS_PER_REQUEST):
+    # split the ranges over several requests of at most max_cells cells (ranges from grid_ranges / diff_ranges with
+    # the same max_cells are never bigger than that)
+    chunk, cells = [], 0
+    for update in updates:
+        size = sum(len(row) for row in update["values"])
+        if chunk and cells + size > max_cells:
+            yield chunk
+            chunk, cells = [], 0
+        chunk.append(update)
+        cells += size
+    if chunk:
+        yield chunk
+
+
+######## retries ###########
+
+def _status_code(error):
+    # HTTP status of a gspread APIError (or anything with a status_code), None for other errors
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", getattr(error, "status_code", None))
+
+
+def with_backoff(call, max_retries=MAX_RETRIES, base=BACKOFF_BASE, cap=BACKOFF_MAX, sleep=time.sleep):
+    """
+    Runs call(), retrying quota and server errors with exponential backoff and jitter. Other errors are raised at once.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return call()
+        except Exception as e:
+            if _status_code(e) not in RETRY_STATUS or attempt == max_retries:
+                raise
+            sleep(min(cap, base * 2 ** attempt) * (0.5 + random.random() / 2))
+
+
+######## sync ###########
+
+def snapshot_path(spreadsheet_name, worksheet_name, snapshot_dir=SNAPSHOT_DIR):
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in f"{spreadsheet_name}__{worksheet_name}")
+    return os.path.join(snapshot_dir, f"{safe}.json")
+
+
+def _read_snapshot(path):
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)["values"]
+    except (OSError, ValueError, KeyError):
+        # a broken snapshot just means a full upload
+        return None
+
+
+def _write_snapshot(path, grid):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"values": grid}, f)
+    os.replace(tmp_path, path)
+
+
+def sync_worksheet(worksheet, df, snapshot, full=False, max_cells=MAX_CELLS_PER_REQUEST, max_retries=MAX_RETRIES,
+                   sleep=time.sleep):
+    """
+    Brings a worksheet up to date with a DataFrame, sending only the cells that changed since the last sync.
+
+    Without a snapshot (first upload, or full=True) the worksheet is cleared and written in chunks. The snapshot is
+    only updated once every chunk went through; if a chunk fails for good the snapshot is removed, so the next sync
+    rewrites everything instead of trusting a half-updated sheet.
+
+    Args:
+        worksheet: gspread Worksheet (or InMemoryWorksheet).
+        df (pd.DataFrame): Table to upload, header included.
+        snapshot (str): Path of the local snapshot of this worksheet.
+        full (bool): Ignore the snapshot (e.g. after the sheet was edited by hand).
+        max_cells (int): Cells per batch_update request.
+        max_retries (int): Retries per request for quota/server errors.
+        sleep: Used between retries (tests pass a no-op).
+
+    Returns:
+        dict: mode ("full" or "diff"), cells and ranges sent, requests made.
+    """
+    grid = dataframe_grid(df)
+    old_grid = None if full else _read_snapshot(snapshot)
+    n_rows, n_cols = len(grid), max(len(row) for row in grid)
+
+    def retried(call):
+        return with_backoff(call, max_retries=max_retries, sleep=sleep)
+
+    try:
+        if old_grid is None:
+            mode = "full"
+            retried(worksheet.clear)
+            updates = grid_ranges(grid, max_cells)
+        else:
+            mode = "diff"
+            updates = diff_ranges(old_grid, grid, max_cells=max_cells)
+
+        if worksheet.row_count < n_rows or worksheet.col_count < n_cols:
+            retried(lambda: worksheet.resize(rows=max(worksheet.row_count, n_rows), cols=max(worksheet.col_count, n_cols)))
+
+        requests = 0
+        for chunk in chunk_updates(updates, max_cells):
+            retried(lambda: worksheet.batch_update(chunk, value_input_option="RAW"))
+            requests += 1
+    except Exception:
+        if os.path.exists(snapshot):
+            os.remove(snapshot)
+        raise
+
+    _write_snapshot(snapshot, grid)
+    return {
+        "mode": mode,
+        "cells": sum(len(row) for update in updates for row in update["values"]),
+        "ranges": len(updates),
+        "requests": requests,
+    }
+
+
+def sync_to_gsheet(df, spreadsheet_name, worksheet_name, creds_path, snapshot_dir=SNAPSHOT_DIR, full=False,
+                   max_cells=MAX_CELLS_PER_REQUEST):
+    """
+    Diff-based upload of a DataFrame to a worksheet, see sync_worksheet. Opens (or creates) the spreadsheet and
+    worksheet with the cached client.
+
+    Returns:
+        dict: See sync_worksheet.
+    """
+    client = get_client(creds_path)
+    worksheet = with_backoff(lambda: open_worksheet(client, spreadsheet_name, worksheet_name,
+                                                    rows=len(df) + 1, cols=len(df.columns)))
+    return sync_worksheet(worksheet, df, snapshot_path(spreadsheet_name, worksheet_name, snapshot_dir), full=full,
+                          max_cells=max_cells)
+
+
+######## in-memory worksheet ###########
+
+class SheetsAPIError(Exception):
+    # stands in for gspread's APIError in InMemoryWorksheet
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _parse_a1(cell):
+    letters = "".join(c for c in cell if c.isalpha())
+    col = 0
+    for letter in letters:
+        col = col * 26 + ord(letter.upper()) - 64
+    return int(cell[len(letters):]), col
+
+
+class InMemoryWorksheet:
+    """
+    The part of gspread's Worksheet that sync_worksheet uses, backed by a dict of cells.
+
+    Args:
+        rows, cols (int): Grid size.
+        failures (list): Status codes to raise on the next batch_update calls, one per call (e.g. [429, 429]).
+    """
+
+    def __init__(self, rows=1000, cols=26, failures=None):
+        self.row_count = rows
+        self.col_count = cols
+        self.cells = {}
+        self.failures = list(failures or [])
+        self.calls = []
+        self.ranges = []  # every range written, in order
+
+    def clear(self):
+        self.calls.append(("clear",))
+        self.cells.clear()
+
+    def resize(self, rows=None, cols=None):
+        self.calls.append(("resize", rows, cols))
+        self.row_count = rows if rows is not None else self.row_count
+        self.col_count = cols if cols is not None else self.col_count
+        self.cells = {(r, c): v for (r, c), v in self.cells.items() if r <= self.row_count and c <= self.col_count}
+
+    def batch_update(self, data, value_input_option="RAW"):
+        self.calls.append(("batch_update", len(data), sum(len(row) for update in data for row in update["values"])))
+        if self.failures:
+            raise SheetsAPIError(self.failures.pop(0))
+        for update in data:
+            self.ranges.append(update["range"])
+            first, last = update["range"].split(":")
+            row, col = _parse_a1(first)
+            last_row, last_col = _parse_a1(last)
+            if last_row > self.row_count or last_col > self.col_count:
+                raise SheetsAPIError(400)
+            for i, values in enumerate(update["values"]):
+                for j, value in enumerate(values):
+                    if value == "":
+                        self.cells.pop((row + i, col + j), None)
+                    else:
+                        self.cells[(row + i, col + j)] = value
+
+    def get_all_values(self):
+        # rows up to the last filled cell, like gspread (values as they were written, not formatted as text)
+        if not self.cells:
+            return []
+        n_rows = max(r for r, _ in self.cells)
+        n_cols = max(c for _, c in self.cells)
+        return [[self.cells.get((r, c), "") for c in range(1, n_cols + 1)] for r in range(1, n_rows + 1)]
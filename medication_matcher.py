@@ -0,0 +1,295 @@
+# Fuzzy matching of cleaned medication names (see medication_normalizer.py) to UMLS concepts.
+#
+# Instead of scoring every query against every UMLS name, the matcher keeps a candidate index of drug names only
+# (drug semantic types, sources like RXNORM) with character trigram blocking: a query is only scored against names
+# that share enough trigrams with it. Queries are scored in batches with rapidfuzz.process.cdist, which runs on
+# several threads. The index is built once and saved to disk.
+#
+#   umls = UMLSParser.from_index("umls_2025AA.sqlite")
+#   matcher = MedicationMatcher.from_umls(umls)
+#   matcher.save("medication_matcher.npz")
+#   ...
+#   matcher = MedicationMatcher.load("medication_matcher.npz")
+#   matches = matcher.match(OPT_medications["clean_medication"].dropna().unique(), k=3)
+
+
+import json
+import math
+import unicodedata
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+
+# semantic types of drugs and what patients take as medication (vitamins, supplements, elements like lithium)
+DRUG_SEMANTIC_TYPES = {
+    "T109": "Organic Chemical",
+    "T116": "Amino Acid, Peptide, or Protein",
+    "T121": "Pharmacologic Substance",
+    "T123": "Biologically Active Substance",
+    "T125": "Hormone",
+    "T126": "Enzyme",
+    "T127": "Vitamin",
+    "T129": "Immunologic Factor",
+    "T195": "Antibiotic",
+    "T196": "Element, Ion, or Isotope",
+    "T197": "Inorganic Chemical",
+    "T200": "Clinical Drug",
+}
+DRUG_SOURCES = ("RXNORM",)
+
+NGRAM = 3
+INDEX_FORMAT_VERSION = 1
+
+
+######## helpers ###########
+
+def normalize_name(name):
+    # same form as medication_normalizer output: NFKC, upper case, single spaces
+    return " ".join(unicodedata.normalize("NFKC", name).upper().split())
+
+
+def name_ngrams(name, n=NGRAM):
+    # padded so that short names and word starts/ends get their own grams
+    padded = f" {name} "
+    return {padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))}
+
+
+def _csr(keys, values, n_keys):
+    # group values by key: returns (offsets, values sorted by key), values of key k are values[offsets[k]:offsets[k+1]]
+    keys = np.asarray(keys, dtype=np.int64)
+    values = np.asarray(values, dtype=np.int32)
+    order = np.argsort(keys, kind="stable")
+    offsets = np.zeros(n_keys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n_keys), out=offsets[1:])
+    return offsets, values[order]
+
+
+def _pack_strings(strings):
+    # newline separated utf-8, so the index can be saved without pickling
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _unpack_strings(packed):
+    text = packed.tobytes().decode("utf-8")
+    return text.split("\n") if text else []
+
+
+######## matcher ###########
+
+class MedicationMatcher:
+    """
+    Candidate index of UMLS drug names for fuzzy matching medication names to CUIs.
+
+    Args:
+        names (list): Name of each (name, CUI) pair.
+        cuis (list): CUI of each pair, same length as names.
+        meta (dict): Anything to keep with the index (filters it was built with), saved along with it.
+    """
+
+    def __init__(self, names, cuis, meta=None):
+        if len(names) != len(cuis):
+            raise ValueError("names and cuis must have the same length")
+        self.meta = dict(meta or {})
+
+        # unique normalized names are the choices for rapidfuzz, each pointing to one or more CUIs
+        name_ids = {}
+        pair_names, pair_cuis, seen = [], [], set()
+        cui_ids = {}
+        for name, cui in zip(names, cuis):
+            name = normalize_name(name)
+            if not name:
+                continue
+            name_id = name_ids.setdefault(name, len(name_ids))
+            cui_id = cui_ids.setdefault(cui, len(cui_ids))
+            if (name_id, cui_id) not in seen:
+                seen.add((name_id, cui_id))
+                pair_names.append(name_id)
+                pair_cuis.append(cui_id)
+        self.names = list(name_ids)
+        self.cuis = list(cui_ids)
+        self.name_cui_offsets, self.name_cuis = _csr(pair_names, pair_cuis, len(self.names))
+        self._build_ngram_index()
+
+    def _build_ngram_index(self):
+        gram_ids = {}
+        keys, values = [], []
+        for name_id, name in enumerate(self.names):
+            for gram in name_ngrams(name):
+                keys.append(gram_ids.setdefault(gram, len(gram_ids)))
+                values.append(name_id)
+        self.gram_ids = gram_ids
+        self.gram_offsets, self.gram_names = _csr(keys, values, len(gram_ids))
+
+    @classmethod
+    def from_umls(cls, umls, semantic_types=DRUG_SEMANTIC_TYPES, sources=DRUG_SOURCES, languages=("ENG",)):
+        """
+        Builds the index from a UMLSParser (parsed or opened with UMLSParser.from_index).
+
+        Args:
+            umls (UMLSParser): Parsed UMLS.
+            semantic_types (collection): TUIs to keep (default: DRUG_SEMANTIC_TYPES), None keeps all.
+            sources (collection): Keep concepts with a code in one of these sources (default: RXNORM), None keeps all.
+                To keep only the names from these sources, parse with UMLSParser(..., source_filter=[...]).
+            languages (collection): Languages of the names to index.
+
+        Returns:
+            MedicationMatcher
+        """
+        tuis = set(semantic_types) if semantic_types is not None else None
+        sources = set(sources) if sources is not None else None
+        names, cuis = [], []
+        for cui, concept in umls.get_concepts().items():
+            if tuis is not None and concept.get_tui() not in tuis:
+                continue
+            if sources is not None and sources.isdisjoint(concept.get_source_ids()):
+                continue
+            for language in languages:
+                for name in concept.get_names_for_language(language):
+                    names.append(name)
+                    cuis.append(cui)
+        meta = {
+            "semantic_types": sorted(tuis) if tuis is not None else None,
+            "sources": sorted(sources) if sources is not None else None,
+            "languages": list(languages),
+        }
+        return cls(names, cuis, meta)
+
+    ######## blocking ###########
+
+    def candidates(self, query, min_gram_overlap=0.3, max_candidates=2000):
+        """
+        Names sharing enough trigrams with a query (the blocking step).
+
+        Args:
+            query (str): Medication name.
+            min_gram_overlap (float): Share of the query's trigrams a name must have to be a candidate.
+            max_candidates (int): Keep at most this many, the ones with the most shared trigrams.
+
+        Returns:
+            np.ndarray: Sorted name ids.
+        """
+        query_grams = name_ngrams(normalize_name(query))
+        grams = [self.gram_ids[gram] for gram in query_grams if gram in self.gram_ids]
+        if not grams:
+            return np.empty(0, dtype=np.int32)
+        postings = np.concatenate([self.gram_names[self.gram_offsets[g]:self.gram_offsets[g + 1]] for g in grams])
+        name_ids, shared = np.unique(postings, return_counts=True)
+        keep = shared >= max(1, math.ceil(min_gram_overlap * len(query_grams)))
+        name_ids, shared = name_ids[keep], shared[keep]
+        if len(name_ids) > max_candidates:
+            # most shared trigrams first, ties by name id so the cut is deterministic
+            top = np.lexsort((name_ids, -shared))[:max_candidates]
+            name_ids = np.sort(name_ids[top])
+        return name_ids.astype(np.int32)
+
+    ######## matching ###########
+
+    def match(self, queries, k=5, scorer=fuzz.WRatio, score_cutoff=0, batch_size=64, workers=-1,
+              min_gram_overlap=0.3, max_candidates=2000):
+        """
+        Top-k CUIs for each query.
+
+        Queries are scored in batches: one rapidfuzz.process.cdist call per batch, against the union of the batch's
+        candidates, then every query only keeps the scores of its own candidates, so results don't depend on the
+        batch size. A CUI's score is the best score of its names.
+
+        Args:
+            queries (list or pd.Series): Cleaned medication names; duplicates are only scored once.
+            k (int): Number of CUIs to return per query.
+            scorer: rapidfuzz scorer (default fuzz.WRatio).
+            score_cutoff (float): Drop matches scoring below this.
+            batch_size (int): Queries per cdist call.
+            workers (int): Threads for cdist (-1: all cores).
+            min_gram_overlap (float), max_candidates (int): Blocking settings, see candidates().
+
+        Returns:
+            pd.DataFrame: query, rank (1 = best), cui, name (best matching name of that CUI), score.
+                Queries without a match don't appear.
+        """
+        unique_queries = list(dict.fromkeys(q for q in queries if isinstance(q, str) and q.strip()))
+        # similar queries share candidates, scoring them in sorted order keeps the union per batch small
+        sorted_queries = sorted(unique_queries, key=normalize_name)
+        results = {}
+        for start in range(0, len(unique_queries), batch_size):
+            batch = sorted_queries[start:start + batch_size]
+            candidates = [self.candidates(q, min_gram_overlap, max_candidates) for q in batch]
+            union = np.unique(np.concatenate(candidates)) if any(len(c) for c in candidates) else np.empty(0, np.int32)
+            if not len(union):
+                continue
+
+            scores = process.cdist([normalize_name(q) for q in batch], [self.names[i] for i in union], scorer=scorer,
+                                   workers=workers, dtype=np.float32)
+            for row, (query, own) in enumerate(zip(batch, candidates)):
+                if not len(own):
+                    continue
+                own_scores = scores[row, np.searchsorted(union, own)]
+                results[query] = self._top_cuis(query, own, own_scores, k, score_cutoff)
+
+        # back in the order the queries came in
+        rows = [row for query in unique_queries for row in results.get(query, [])]
+        return pd.DataFrame(rows, columns=["query", "rank", "cui", "name", "score"])
+
+    def match_one(self, query, k=5, **kwargs):
+        """
+        Returns:
+            list: (cui, name, score) tuples, best first.
+        """
+        matches = self.match([query], k=k, **kwargs)
+        return list(zip(matches["cui"], matches["name"], matches["score"]))
+
+    def _top_cuis(self, query, name_ids, scores, k, score_cutoff):
+        rows = []
+        seen = set()
+        # best score first, ties by name id
+        for i in np.lexsort((name_ids, -scores)):
+            score = float(scores[i])
+            if score < score_cutoff or len(rows) == k:
+                break
+            name_id = name_ids[i]
+            for cui_id in self.name_cuis[self.name_cui_offsets[name_id]:self.name_cui_offsets[name_id + 1]]:
+                if cui_id in seen:
+                    continue
+                seen.add(cui_id)
+                rows.append((query, len(rows) + 1, self.cuis[cui_id], self.names[name_id], score))
+                if len(rows) == k:
+                    break
+        return rows
+
+    ######## persistence ###########
+
+    def save(self, path):
+        """
+        Saves the index to a .npz file (no pickles), load it back with MedicationMatcher.load.
+        """
+        gram_list = sorted(self.gram_ids, key=self.gram_ids.get)
+        meta = dict(self.meta, format_version=INDEX_FORMAT_VERSION, ngram=NGRAM)
+        np.savez_compressed(
+            path,
+            meta=_pack_strings([json.dumps(meta)]),
+            names=_pack_strings(self.names),
+            cuis=_pack_strings(self.cuis),
+            grams=_pack_strings(gram_list),
+            name_cui_offsets=self.name_cui_offsets,
+            name_cuis=self.name_cuis,
+            gram_offsets=self.gram_offsets,
+            gram_names=self.gram_names,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(_unpack_strings(data["meta"])[0])
+            if meta.get("format_version") != INDEX_FORMAT_VERSION or meta.get("ngram") != NGRAM:
+                raise ValueError(f"{path} was saved by a different version of the matcher, please rebuild it")
+            matcher = cls.__new__(cls)
+            matcher.meta = {key: value for key, value in meta.items() if key not in ("format_version", "ngram")}
+            matcher.names = _unpack_strings(data["names"])
+            matcher.cuis = _unpack_strings(data["cuis"])
+            matcher.gram_ids = {gram: i for i, gram in enumerate(_unpack_strings(data["grams"]))}
+            matcher.name_cui_offsets = data["name_cui_offsets"]
+            matcher.name_cuis = data["name_cuis"]
+            matcher.gram_offsets = data["gram_offsets"]
+            matcher.gram_names = data["gram_names"]
+        return matcher
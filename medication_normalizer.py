@@ -0,0 +1,167 @@
+# Medication string normalizer, the clean_medication_string step of medication_form_clean.ipynb as an importable module.
+#
+# Same output as the notebook, but the regexes are compiled once at import, raw strings are cached (most free-text
+# entries repeat across participants and weeks), and normalize_medication_series only cleans each unique value once.
+#
+#   from medication_normalizer import normalize_medication_series
+#   OPT_medications["clean_ingredients"] = normalize_medication_series(OPT_medications["medication"])  # tuples
+#   OPT_medications["clean_medication"] = normalize_medication_series(OPT_medications["medication"], join=True)
+
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+######## regex vocab (same as the notebook) ###########
+
+UNITS = r"(mcg|μg|ug|mg|g|gram|ml|mL|l|iu|units?|meq|mmol|%)"
+FORM_WORDS = r"(tab(let)?s?|cap(s|sules)?|susp(ension)?|sol(ution)?|syrup|drops?|spray|neb|cream|ointment|gel|patch|lozenge|supp(ository)?|inhaler|powder|granules?)"
+ROUTE_WORDS = r"(po|oral|iv|im|sc|subcut(an(eous)?)?|sl|subling(ual)?|top(ical)?|ophth(al)?|otic|nasal|intranasal|inhal(ed|ation)?|rectal|vaginal|transderm(al)?|buccal)"
+FREQ_WORDS = r"(qd|od|qam|qpm|qhs|bid|tid|qid|q\d+h|q\d+hr|qod|prn|stat|hs|am|pm)"
+REL_WORDS = r"(xr|sr|dr|er|cr|la|xl|ir)"
+SALT_WORDS = r"(hcl|hydrochloride|hydrobromide|succinate|tartrate|maleate|mesylate|besylate|acetate|phosphate|sulfate|lactate|nitrate|carbonate|sodium|potassium|calcium|magnesium)"
+
+DROP_TOKENS = {
+    "TAB", "TABS", "TABLET", "TABLETS", "CAP", "CAPS", "CAPSULE", "CAPSULES",
+    "SOLUTION", "SUSP", "SUSPENSION", "SYRUP", "DROPS", "INJECTION", "TOPICAL",
+    "PATCH", "CREAM", "OINTMENT", "GEL",
+    "PRN", "BID", "TID", "QID", "QD", "OD", "QHS", "QAM", "QPM", "HS", "AM", "PM",
+    "PO", "IV", "IM", "SC", "SL", "SUBLINGUAL", "INHALER", "NEB", "NASAL",
+    "XR", "SR", "ER", "CR", "LA", "XL", "IR",
+}
+
+LEADING_MODIFIERS = {
+    "EXTENDED", "RELEASE", "EXTENDED-RELEASE", "SUSTAINED", "CONTROLLED",
+    "DELAYED", "IMMEDIATE", "PROLONGED", "ENTERIC", "COATED", "CHEWABLE",
+    "LONG", "ACTING", "ORAL"  # sometimes appears as fluff
+}
+
+
+######## compiled patterns ###########
+
+PARENTHETICAL_RE = re.compile(r"\([^)]*\)")
+# in the notebook's rf-string "{0,1}" was formatted into the text "(0, 1)", kept as is so results don't change
+DOSE_UNIT_RE = re.compile(rf"\b\d+(\.\d+)?\s*(/(0, 1)\s*\d+(\.\d+)?\s*)*{UNITS}\b")
+RATIO_RE = re.compile(r"\b\d+(\.\d+)?\s*/\s*\d+(\.\d+)?\b")
+NUMBER_RE = re.compile(r"\b\d+(\.\d+)?\b")  # stray numbers
+# the five keyword vocabularies in one pass. Like in the notebook they are lowercase and run on the upper-cased
+# string, so they only catch leftovers that upper() doesn't touch; kept as they are so results don't change
+KEYWORDS_RE = re.compile(r"\b(?:" + "|".join([FORM_WORDS, ROUTE_WORDS, FREQ_WORDS, REL_WORDS, SALT_WORDS]) + r")\b")
+DISALLOWED_RE = re.compile(r"[^\w\s\+\/&-]")  # allow hyphen in things like EXTENDED-RELEASE
+WHITESPACE_RE = re.compile(r"\s+")
+SPLIT_RE = re.compile(r"\s*(?:/|&|\+)\s*")
+
+# raw strings kept in the normalize_medication cache
+CACHE_SIZE = 1 << 16
+
+
+######## normalizer ###########
+
+def _tokenize_med(raw):
+    s = "" if not isinstance(raw, str) else raw
+    s = unicodedata.normalize("NFKC", s).upper().strip()
+    if not s:
+        return []
+    s = PARENTHETICAL_RE.sub(" ", s)
+    s = DOSE_UNIT_RE.sub(" ", s)
+    s = RATIO_RE.sub(" ", s)
+    s = NUMBER_RE.sub(" ", s)
+    s = KEYWORDS_RE.sub(" ", s)
+    s = s.replace("+", " + ").replace("/", " / ").replace("&", " & ")
+    s = DISALLOWED_RE.sub(" ", s)
+    s = WHITESPACE_RE.sub(" ", s).strip()
+    if not s:
+        return []
+    return SPLIT_RE.split(s)
+
+
+def _strip_leading_modifiers(words):
+    # remove only leading fluff tokens
+    i = 0
+    while i < len(words) and (words[i] in LEADING_MODIFIERS or words[i] in DROP_TOKENS):
+        i += 1
+    return words[i:]
+
+
+def clean_medication_string(raw) -> List[str]:
+    """
+    Returns a list of cleaned ingredient-like tokens (uncached, see normalize_medication).
+    - Removes dose/form/route/release/salts
+    - Splits combos on /, +, &
+    - Strips *leading* modifiers but preserves legitimate multiword ingredients
+    - De-dupes while preserving order
+
+    Args:
+        raw (str): Free-text medication entry; anything that isn't a string gives [].
+
+    Returns:
+        list: Cleaned ingredient names, e.g. "EXTENDED-RELEASE BUPROPION XL + Vitamin D3" -> ["BUPROPION", "VITAMIN D3"]
+    """
+    out = []
+    for tok in _tokenize_med(raw):
+        # remove generic noise tokens at the start, and any standalone DROP_TOKENS left in the middle
+        words = _strip_leading_modifiers(tok.split())
+        words = [w for w in words if w not in DROP_TOKENS]
+        if words:
+            # the full remaining phrase is kept (NOT just the last word), so 'FISH OIL' doesn't become 'OIL'. The
+            # notebook's PROTECT_REGEXES check kept matching phrases the same way, so it isn't carried over
+            out.append(" ".join(words))
+
+    # de-duplicate while preserving order
+    return list(dict.fromkeys(out))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _normalize_cached(raw: str) -> Tuple[str, ...]:
+    return tuple(clean_medication_string(raw))
+
+
+def normalize_medication(raw) -> Tuple[str, ...]:
+    """
+    Cached clean_medication_string. Keeps the last CACHE_SIZE raw strings (LRU), see normalize_medication.cache_info().
+
+    Returns:
+        tuple: Cleaned ingredient names (a tuple, so the cached value can't be changed by the caller).
+    """
+    if not isinstance(raw, str):
+        return ()
+    return _normalize_cached(raw)
+
+
+normalize_medication.cache_info = _normalize_cached.cache_info
+normalize_medication.cache_clear = _normalize_cached.cache_clear
+
+
+def join_ingredients(ingredients):
+    # the clean_medication column of the notebook
+    return " + ".join(ingredients) if ingredients else pd.NA
+
+
+def normalize_medication_series(values, join=False):
+    """
+    Normalizes a whole column, cleaning each unique raw value once and mapping the results back.
+
+    Args:
+        values (pd.Series or list): Raw medication strings; missing values give () (or NA with join=True).
+        join (bool): Return the " + " joined names (notebook's clean_medication) instead of the names (clean_ingredients).
+
+    Returns:
+        pd.Series: Same index as values; tuples of ingredient names (shared between equal raw values, so they are
+        tuples rather than lists), or joined strings / pd.NA.
+    """
+    values = values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+
+    cleaned = np.empty(len(uniques) + 1, dtype=object)
+    for i, raw in enumerate(uniques):
+        ingredients = normalize_medication(raw)
+        # set one by one, numpy would unpack a list of equal length tuples into a 2D array
+        cleaned[i] = join_ingredients(ingredients) if join else ingredients
+    cleaned[-1] = pd.NA if join else ()
+    # code -1 (missing) picks the trailing value
+    return pd.Series(cleaned[codes], index=values.index, name=values.name, dtype=object)
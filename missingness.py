@@ -0,0 +1,262 @@
+# Missingness of the master sheet for the issues list and the coverage (UpSet) plots, from one presence matrix.
+#
+# Which values are present is computed once, column by column, and kept as a packed bit array (one bit per
+# participant and variable, 1 = present). Everything else comes from that matrix with array operations instead of a
+# loop over participants:
+#   issues_list          record_id, variable, position: one row per missing value (long form, ready to upload)
+#   issues_wide          the old record_id, total_missing, missing_var_1..N layout (what trim_to_missing_count did)
+#   variable_completeness / site_completeness
+#   indicators / upset_counts  inputs for upsetplot (from_indicators / UpSet)
+#
+#   from missingness import PresenceMatrix
+#   presence = PresenceMatrix(master_df, columns=issue_vars)
+#   upload_to_gsheet(presence.issues_list(), "BAARD issues", "missing", creds_path, sync=True)
+#   UpSet(presence.upset_counts({"sMRI": ["has_smri"], "blood": ["IL-6"]})).plot()
+
+
+import numpy as np
+import pandas as pd
+
+
+# bits set in every byte value, to count present values in packed rows without unpacking them
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.int32)
+
+ROW_BLOCK = 65_536  # rows unpacked at a time for per-variable sums
+
+
+######## presence ###########
+
+def _present(values):
+    # present = not NA, and for text columns not empty or only spaces (blank form fields)
+    present = values.notna().to_numpy()
+    if values.dtype == object or pd.api.types.is_string_dtype(values):
+        text = values[present].astype(str).str.strip()
+        present[np.flatnonzero(present)[(text == "").to_numpy()]] = False
+    return present
+
+
+def packed_presence(df, columns):
+    """
+    Presence of every value of df[columns] as packed bits.
+
+    Returns:
+        np.ndarray: uint8 (n_rows, ceil(n_columns / 8)), bit j of row i (big-endian, like np.packbits) is 1 when
+        column j has a value in row i. Padding bits are 0.
+    """
+    packed = np.zeros((len(df), (len(columns) + 7) // 8), dtype=np.uint8)
+    # packing 8 columns at a time keeps the unpacked part small for wide sheets
+    for start in range(0, len(columns), 8):
+        block = np.column_stack([_present(df[col]) for col in columns[start:start + 8]])
+        packed[:, start // 8] = np.packbits(block, axis=1)[:, 0]
+    return packed
+
+
+class PresenceMatrix:
+    """
+    Packed presence bits of a set of master sheet columns, with the record_ids and sites of the rows.
+
+    Args:
+        df (pd.DataFrame): Master sheet.
+        columns (list): Variables to check (default: every column except id_col and site_col).
+        id_col (str): Participant id column.
+        site_col (str): Site column (None: no site completeness; missing from df: the first two letters of the id,
+            like add_site_column).
+    """
+
+    def __init__(self, df, columns=None, id_col="record_id", site_col="site"):
+        if columns is None:
+            columns = [col for col in df.columns if col not in (id_col, site_col)]
+        missing = [col for col in columns if col not in df.columns]
+        if missing:
+            raise KeyError(f"Columns not in the data: {', '.join(map(str, missing))}")
+        self.columns = list(columns)
+        self.record_ids = df[id_col].to_numpy() if id_col in df.columns else df.index.to_numpy()
+        if site_col is None:
+            self.sites = None
+        elif site_col in df.columns:
+            self.sites = df[site_col].to_numpy()
+        else:
+            self.sites = pd.Series(self.record_ids).astype(str).str[:2].str.upper().to_numpy()
+        self.bits = packed_presence(df, self.columns)
+
+    @property
+    def shape(self):
+        return len(self.record_ids), len(self.columns)
+
+    def present(self, rows=slice(None)):
+        # unpacked bool presence of some rows, (n_rows, n_columns)
+        return np.unpackbits(self.bits[rows], axis=1, count=len(self.columns)).view(bool)
+
+    def _column_index(self, columns):
+        position = {col: i for i, col in enumerate(self.columns)}
+        return np.array([position[col] for col in columns], dtype=np.intp)
+
+    ######## per participant ###########
+
+    def missing_counts(self):
+        # missing values per participant, straight from the packed bytes
+        return len(self.columns) - POPCOUNT[self.bits].sum(axis=1)
+
+    def issues_list(self, only_missing=True):
+        """
+        Missing variables of every participant in long form, in column order.
+
+        Args:
+            only_missing (bool): Leave out participants with nothing missing (False gives them a row with an empty
+                variable, so every participant is listed).
+
+        Returns:
+            pd.DataFrame: record_id, total_missing, position (1..total_missing) and variable.
+        """
+        rows, cols = [], []
+        for start in range(0, self.shape[0], ROW_BLOCK):
+            # nonzero walks the block row by row, so the variables come out in column order per participant
+            block_rows, block_cols = np.nonzero(~self.present(slice(start, start + ROW_BLOCK)))
+            rows.append(block_rows + start)
+            cols.append(block_cols)
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.intp)
+        cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.intp)
+
+        counts = self.missing_counts()
+        # position within the participant: index minus the index of the participant's first missing value
+        first = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        issues = pd.DataFrame({
+            "record_id": self.record_ids[rows],
+            "total_missing": counts[rows].astype(np.int32),
+            "position": (np.arange(len(rows)) - first[rows] + 1).astype(np.int32),
+            "variable": pd.Categorical.from_codes(cols, categories=self.columns),
+        })
+        if not only_missing:
+            complete = np.flatnonzero(counts == 0)
+            issues = pd.concat([issues, pd.DataFrame({
+                "record_id": self.record_ids[complete],
+                "total_missing": np.zeros(len(complete), dtype=np.int32),
+                "position": np.zeros(len(complete), dtype=np.int32),
+                "variable": pd.Categorical.from_codes(np.full(len(complete), -1), categories=self.columns),
+            })])
+            order = np.argsort(np.concatenate([rows, complete]), kind="stable")
+            issues = issues.iloc[order].reset_index(drop=True)
+        return issues
+
+    def issues_wide(self):
+        """
+        The issues list in the old layout: record_id, total_missing, missing_var_1..missing_var_N, one row per
+        participant with something missing and empty cells after their last missing variable.
+
+        Returns:
+            pd.DataFrame
+        """
+        issues = self.issues_list()
+        n_wide = int(issues["total_missing"].max()) if len(issues) else 0
+        participants = issues.drop_duplicates("record_id")
+        # every (participant, position) cell is written once through the row index of the participant
+        grid = np.full((len(participants), n_wide), None, dtype=object)
+        row_of = np.repeat(np.arange(len(participants)), participants["total_missing"].to_numpy())
+        grid[row_of, issues["position"].to_numpy() - 1] = issues["variable"].astype(object).to_numpy()
+        wide = pd.DataFrame(grid, columns=[f"missing_var_{i}" for i in range(1, n_wide + 1)])
+        wide.insert(0, "total_missing", participants["total_missing"].to_numpy())
+        wide.insert(0, "record_id", participants["record_id"].to_numpy())
+        return wide
+
+    ######## per variable and site ###########
+
+    def present_counts(self):
+        # participants with a value, per variable
+        counts = np.zeros(len(self.columns), dtype=np.int64)
+        for start in range(0, self.shape[0], ROW_BLOCK):
+            counts += self.present(slice(start, start + ROW_BLOCK)).sum(axis=0)
+        return counts
+
+    def variable_completeness(self):
+        """
+        Returns:
+            pd.DataFrame: variable, n_present, n_missing and completeness (fraction present), in column order.
+        """
+        present = self.present_counts()
+        n_rows = self.shape[0]
+        return pd.DataFrame({
+            "variable": self.columns,
+            "n_present": present,
+            "n_missing": n_rows - present,
+            "completeness": present / n_rows if n_rows else np.nan,
+        })
+
+    def site_completeness(self, long=False):
+        """
+        Fraction of participants of each site with a value, per variable.
+
+        Args:
+            long (bool): site, variable, n_participants, n_present, completeness rows instead of a site x variable
+                table.
+
+        Returns:
+            pd.DataFrame
+        """
+        if self.sites is None:
+            raise ValueError("No site column, create the PresenceMatrix with site_col")
+        codes, sites = pd.factorize(pd.Series(self.sites), sort=True, use_na_sentinel=False)
+        # per-site sums as one product of a site indicator matrix with the presence bits, in row blocks
+        present = np.zeros((len(sites), len(self.columns)))
+        for start in range(0, self.shape[0], ROW_BLOCK):
+            block = self.present(slice(start, start + ROW_BLOCK))
+            onehot = np.zeros((len(sites), len(block)))
+            onehot[codes[start:start + len(block)], np.arange(len(block))] = 1.0
+            present += onehot @ block
+        n_participants = np.bincount(codes, minlength=len(sites))
+        completeness = present / n_participants[:, None]
+        sites = pd.Index(sites, name="site")
+        if not long:
+            return pd.DataFrame(completeness, index=sites, columns=pd.Index(self.columns, name="variable"))
+        return pd.DataFrame({
+            "site": np.repeat(sites, len(self.columns)),
+            "variable": np.tile(self.columns, len(sites)),
+            "n_participants": np.repeat(n_participants, len(self.columns)),
+            "n_present": present.ravel().astype(np.int64),
+            "completeness": completeness.ravel(),
+        })
+
+    ######## UpSet ###########
+
+    def _group_presence(self, groups, how):
+        # one bool column per group: present when all (or any) of its columns are
+        if groups is None:
+            groups = {col: [col] for col in self.columns}
+        elif not isinstance(groups, dict):
+            groups = {col: [col] for col in groups}
+        if how not in ("all", "any"):
+            raise ValueError(f"how must be 'all' or 'any', got {how!r}")
+        present = self.present()
+        reduce = np.all if how == "all" else np.any
+        return {name: reduce(present[:, self._column_index(cols)], axis=1) for name, cols in groups.items()}
+
+    def indicators(self, groups=None, how="all"):
+        """
+        Presence indicators for upsetplot.from_indicators.
+
+        Args:
+            groups (dict or list): Set name -> columns (e.g. {"sMRI": ["has_smri"], "blood": BLOOD_MARKER_COLS}),
+                or a list of columns used as their own sets (default: every column).
+            how (str): A participant is in a set when "all" (or "any") of its columns have a value.
+
+        Returns:
+            pd.DataFrame: bool, one column per set, indexed by record_id.
+        """
+        return pd.DataFrame(self._group_presence(groups, how), index=pd.Index(self.record_ids, name="record_id"))
+
+    def upset_counts(self, groups=None, how="all"):
+        """
+        Participants per combination of sets, the Series UpSet plots (same as from_indicators(...) counted per
+        combination), computed by encoding each participant's combination as one integer.
+
+        Returns:
+            pd.Series: Counts indexed by a MultiIndex of bools, one level per set.
+        """
+        sets = self._group_presence(groups, how)
+        names = list(sets)
+        if len(names) > 62:
+            raise ValueError(f"At most 62 sets, got {len(names)}")
+        weights = np.left_shift(np.int64(1), np.arange(len(names), dtype=np.int64))
+        codes = np.column_stack(list(sets.values())).astype(np.int64) @ weights if names else np.zeros(len(self.record_ids), dtype=np.int64)
+        combinations, counts = np.unique(codes, return_counts=True)
+        index = pd.MultiIndex.from_arrays([(combinations & weight) > 0 for weight in weights], names=names)
+        return pd.Series(counts, index=index, name="participants").sort_index()
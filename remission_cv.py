@@ -0,0 +1,263 @@
+# Repeated cross-validation of the remission models, the run_outer_loop of baard_log_regression.ipynb as a module.
+#
+# Same model, splits and metrics as the notebook, but the outer splits run in parallel worker processes (joblib/loky),
+# every split gets its own seed derived from random_state (so the results don't depend on n_jobs or on the order the
+# workers finish in), and the results come back as typed tables.
+#
+#   from remission_cv import run_outer_loop, print_summary
+#   res_all = run_outer_loop(df[feature_names], df["remission_status"], record_ids=df["record_id"])
+#   print_summary(res_all)
+#   res_all["df_coefs"].mean()
+
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.linear_model import LogisticRegressionCV
+from sklearn.metrics import roc_auc_score, roc_curve
+from sklearn.model_selection import StratifiedShuffleSplit
+
+from elasticnet_path import ElasticNetPathCV
+
+
+######## defaults (same as the notebook) ###########
+
+N_SPLITS = 50
+TEST_SIZE = 0.20
+RANDOM_STATE = 42
+THRESHOLD = 0.27  # threshold where sensitivity and specificity are about balanced
+
+MODEL_PARAMS = {
+    "penalty": "elasticnet",
+    "solver": "saga",
+    "Cs": np.arange(0.5, 15.5, 0.5).tolist(),
+    "cv": 3,
+    "l1_ratios": [0.5],
+    "scoring": "neg_log_loss",
+    "max_iter": 1_000_000,
+}
+# same model fitted over a warm-started regularization path (see elasticnet_path.py), same coefficients within tolerance
+PATH_MODEL_PARAMS = dict(MODEL_PARAMS, solver="path", max_iter=100_000)
+
+# dtypes of the result tables
+METRIC_DTYPES = {
+    "iteration": "int32",
+    "TP": "int32", "FP": "int32", "TN": "int32", "FN": "int32",
+    "Accuracy": "float64",
+    "Sensitivity": "float64",
+    "Specificity": "float64",
+    "AUC": "float64",
+    "Balanced Accuracy": "float64",
+    "best C": "float64",
+    "best l1_ratio": "float64",
+}
+PRED_DTYPES = {
+    "iteration": "int32",
+    "record_id": "category",  # every participant shows up in many iterations
+    "y_true": "int8",
+    "y_score": "float64",  # probability of remission
+    "y_pred": "int8",
+}
+
+
+######## splits and seeds ###########
+
+def make_splits(y, n_splits=N_SPLITS, test_size=TEST_SIZE, random_state=RANDOM_STATE):
+    """
+    The outer StratifiedShuffleSplit of the notebook, generated up front so every worker gets the same splits.
+
+    Returns:
+        list: (train_idx, test_idx) arrays, one pair per iteration.
+    """
+    sss = StratifiedShuffleSplit(n_splits=n_splits, test_size=test_size, random_state=random_state)
+    y = np.asarray(y)
+    return list(sss.split(np.zeros((len(y), 1)), y))
+
+
+def split_seeds(n_splits, random_state=RANDOM_STATE):
+    # one independent seed per iteration (for saga's shuffling), derived from random_state only
+    return [int(seq.generate_state(1)[0]) for seq in np.random.SeedSequence(random_state).spawn(n_splits)]
+
+
+######## one outer split ###########
+
+def confusion_counts(y_true, y_pred):
+    # tn, fp, fn, tp like confusion_matrix(...).ravel(), also when a class is missing from the fold
+    y_true = np.asarray(y_true).astype(bool)
+    y_pred = np.asarray(y_pred).astype(bool)
+    tp = int(np.count_nonzero(y_true & y_pred))
+    fp = int(np.count_nonzero(~y_true & y_pred))
+    fn = int(np.count_nonzero(y_true & ~y_pred))
+    tn = len(y_true) - tp - fp - fn
+    return tn, fp, fn, tp
+
+
+def fold_metrics(iteration, y_true, y_score, y_pred, best_c, best_l1_ratio):
+    """
+    The per-fold metrics row of the notebook.
+
+    Returns:
+        dict: iteration, TP/FP/TN/FN, Accuracy, Sensitivity, Specificity, AUC, Balanced Accuracy, best C, best l1_ratio.
+    """
+    tn, fp, fn, tp = confusion_counts(y_true, y_pred)
+    sensitivity = tp / (tp + fn) if (tp + fn) else 0.0
+    specificity = tn / (tn + fp) if (tn + fp) else 0.0
+    return {
+        "iteration": iteration,
+        "TP": tp, "FP": fp, "TN": tn, "FN": fn,
+        "Accuracy": (tp + tn) / (tp + tn + fp + fn),
+        "Sensitivity": sensitivity,
+        "Specificity": specificity,
+        "AUC": roc_auc_score(y_true, y_score),
+        "Balanced Accuracy": (sensitivity + specificity) / 2,
+        "best C": best_c,
+        "best l1_ratio": best_l1_ratio,
+    }
+
+
+def fit_split(X, y, train_idx, test_idx, iteration, seed, threshold=THRESHOLD, model_params=None):
+    """
+    Fits the model on one outer split and scores its test set. Runs in the worker processes.
+
+    Args:
+        X (np.ndarray): Features, all rows.
+        y (np.ndarray): 0/1 remission status, all rows.
+        train_idx, test_idx (np.ndarray): Row positions of the split.
+        iteration (int): 1-based iteration number.
+        seed (int): random_state of the model for this split.
+        threshold (float): Score threshold for y_pred.
+        model_params (dict): LogisticRegressionCV arguments (default: MODEL_PARAMS); solver="path" fits
+            ElasticNetPathCV instead.
+
+    Returns:
+        dict: metrics (dict), coefs (np.ndarray), test_idx, y_score and y_pred (np.ndarray).
+    """
+    params = dict(MODEL_PARAMS if model_params is None else model_params)
+    params.setdefault("random_state", seed)
+    # the outer splits already use every core, threads inside a worker would only compete with the other workers
+    params.setdefault("n_jobs", 1)
+    clf = ElasticNetPathCV(**params) if params.get("solver") == "path" else LogisticRegressionCV(**params)
+    clf.fit(X[train_idx], y[train_idx])
+
+    y_test = y[test_idx]
+    y_score = clf.predict_proba(X[test_idx])[:, 1]
+    y_pred = (y_score >= threshold).astype(np.int8)
+    best_l1_ratio = clf.l1_ratio_[0] if clf.l1_ratio_[0] is not None else np.nan
+    return {
+        "metrics": fold_metrics(iteration, y_test, y_score, y_pred, clf.C_[0], best_l1_ratio),
+        "coefs": clf.coef_.ravel(),
+        "test_idx": test_idx,
+        "y_score": y_score,
+        "y_pred": y_pred,
+    }
+
+
+######## repeated cross-validation ###########
+
+def pooled_roc(y_true, y_score):
+    """
+    ROC curve of the pooled out-of-fold predictions and the threshold where sensitivity ~ specificity.
+
+    Returns:
+        dict: fpr, tpr, thresholds (np.ndarray), pooled_auc, balanced_threshold, and the sensitivity and
+        specificity at that threshold.
+    """
+    fpr, tpr, thresholds = roc_curve(y_true, y_score)
+    specificity = 1 - fpr
+    best_idx = int(np.argmin(np.abs(tpr - specificity)))
+    return {
+        "fpr": fpr,
+        "tpr": tpr,
+        "thresholds": thresholds,
+        "pooled_auc": roc_auc_score(y_true, y_score),
+        "balanced_threshold": thresholds[best_idx],
+        "balanced_sensitivity": tpr[best_idx],
+        "balanced_specificity": specificity[best_idx],
+    }
+
+
+def run_outer_loop(X, y, feature_names=None, record_ids=None, threshold=THRESHOLD, n_splits=N_SPLITS,
+                   test_size=TEST_SIZE, random_state=RANDOM_STATE, model_params=None, splits=None, n_jobs=-1,
+                   verbose=0):
+    """
+    Repeated stratified shuffle split evaluation of the elastic-net logistic regression, outer splits in parallel.
+
+    The results only depend on the data and random_state: the splits are made up front and every iteration gets its
+    own seed, so n_jobs=1 and n_jobs=-1 give the same tables.
+
+    Args:
+        X (pd.DataFrame or np.ndarray): Features (rows without missing values, like the notebook's dropna()).
+        y (pd.Series or np.ndarray): Remission status (0/1).
+        feature_names (list): Coefficient column names (default: X's columns, or x0, x1, ...).
+        record_ids (pd.Series or np.ndarray): Id of each row for the predictions table (default: row positions).
+        threshold (float): Score threshold for the per-fold confusion counts.
+        n_splits, test_size, random_state: Outer StratifiedShuffleSplit settings.
+        model_params (dict): LogisticRegressionCV arguments (default: MODEL_PARAMS), or PATH_MODEL_PARAMS for the
+            warm-started path solver. random_state and n_jobs are filled in per split unless given.
+        splits (list): Use these (train_idx, test_idx) pairs instead of making them, e.g. to compare feature sets
+            on the exact same splits.
+        n_jobs (int): Worker processes (-1: all cores).
+        verbose (int): joblib progress messages.
+
+    Returns:
+        dict: Same keys as the notebook's run_outer_loop plus the pooled ROC curve:
+            df_metrics (one row per iteration, METRIC_DTYPES),
+            df_coefs (iteration x feature),
+            df_preds (out-of-fold predictions, PRED_DTYPES),
+            pooled_auc, balanced_threshold, balanced_sensitivity, balanced_specificity, fpr, tpr, thresholds.
+    """
+    if feature_names is None:
+        feature_names = list(X.columns) if isinstance(X, pd.DataFrame) else [f"x{i}" for i in range(np.shape(X)[1])]
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y).astype(int)
+    if len(feature_names) != X.shape[1]:
+        raise ValueError(f"{len(feature_names)} feature names for {X.shape[1]} columns")
+    record_ids = np.arange(len(y)) if record_ids is None else np.asarray(record_ids)
+
+    if splits is None:
+        splits = make_splits(y, n_splits, test_size, random_state)
+    seeds = split_seeds(len(splits), random_state)
+
+    # loky processes; joblib memory-maps X for the workers instead of sending a copy with every task
+    results = Parallel(n_jobs=n_jobs, backend="loky", verbose=verbose)(
+        delayed(fit_split)(X, y, train_idx, test_idx, iteration, seed, threshold, model_params)
+        for iteration, ((train_idx, test_idx), seed) in enumerate(zip(splits, seeds), start=1)
+    )
+
+    iterations = np.arange(1, len(results) + 1)
+    df_metrics = pd.DataFrame([result["metrics"] for result in results], columns=list(METRIC_DTYPES)).astype(METRIC_DTYPES)
+    df_coefs = pd.DataFrame(np.vstack([result["coefs"] for result in results]), columns=list(feature_names),
+                            index=pd.Index(iterations, name="iteration", dtype="int32"))
+
+    test_idx = np.concatenate([result["test_idx"] for result in results])
+    y_score = np.concatenate([result["y_score"] for result in results])
+    df_preds = pd.DataFrame({
+        "iteration": np.repeat(iterations, [len(result["test_idx"]) for result in results]),
+        "record_id": record_ids[test_idx],
+        "y_true": y[test_idx],
+        "y_score": y_score,
+        "y_pred": np.concatenate([result["y_pred"] for result in results]),
+    }).astype(PRED_DTYPES)
+
+    return {
+        "df_metrics": df_metrics,
+        "df_coefs": df_coefs,
+        "df_preds": df_preds,
+        **pooled_roc(df_preds["y_true"].to_numpy(), y_score),
+    }
+
+
+def print_summary(result):
+    # the prints of the notebook's run_outer_loop
+    df_metrics = result["df_metrics"]
+    print(f"\nBalanced Sensitivity/Specificity threshold (pooled): {result['balanced_threshold']:.3f}")
+    print(f"Sensitivity: {result['balanced_sensitivity']:.3f}, Specificity: {result['balanced_specificity']:.3f}")
+    print(f"Average Balanced Accuracy: {df_metrics['Balanced Accuracy'].mean():.3f}")
+
+    print("\nAverage Coefficients:")
+    for feature, coef in result["df_coefs"].mean().items():
+        print(f"{feature}: {coef:.3f}")
+
+    print(f"\nPooled AUC: {result['pooled_auc']:.3f}")
+    print("\nAverage per-fold metrics:")
+    print(df_metrics[["Accuracy", "Sensitivity", "Specificity", "AUC", "best C", "best l1_ratio"]].mean())
@@ -0,0 +1,137 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from gsheet_sync import InMemoryWorksheet, SheetsAPIError, a1, diff_ranges, sync_worksheet
+
+
+def no_sleep(seconds):
+    pass
+
+
+class DiffRangesTest(unittest.TestCase):
+
+    def test_sparse_row_sends_only_changed_cells(self):
+        old = [list("abcdefghijkl")]
+        new = [["A"] + list("bcdefghij") + ["K", "l"]]
+        updates = diff_ranges(old, new)
+        self.assertEqual([update["range"] for update in updates], ["A1:A1", "K1:K1"])
+        self.assertEqual([update["values"] for update in updates], [[["A"]], [["K"]]])
+
+    def test_close_runs_are_merged(self):
+        old = [list("abcdefghijkl")]
+        new = [["A", "b", "c", "D"] + list("efghijkl")]
+        self.assertEqual([update["range"] for update in diff_ranges(old, new, merge_gap=3)], ["A1:D1"])
+        self.assertEqual([update["range"] for update in diff_ranges(old, new, merge_gap=1)], ["A1:A1", "D1:D1"])
+
+    def test_three_runs_with_one_merge(self):
+        old = [list("abcdefghijkl")]
+        new = [["A", "b", "C"] + list("defghi") + ["J", "k", "l"]]
+        self.assertEqual([update["range"] for update in diff_ranges(old, new, merge_gap=1)], ["A1:C1", "J1:J1"])
+
+    def test_same_columns_on_consecutive_rows_make_one_block(self):
+        old = [["id", "x", "y"], [1, 2, 3], [4, 5, 6], [7, 8, 9]]
+        new = [["id", "x", "y"], [1, 20, 3], [4, 50, 6], [7, 8, 9]]
+        updates = diff_ranges(old, new)
+        self.assertEqual([update["range"] for update in updates], ["B2:B3"])
+        self.assertEqual(updates[0]["values"], [[20], [50]])
+
+    def test_type_change_and_cleared_cells(self):
+        old = [["a", "b"], [1, 2], [3, 4]]
+        new = [["a", "b"], ["1", 2]]
+        self.assertEqual([update["range"] for update in diff_ranges(old, new)], ["A2:A2", "A3:B3"])
+
+    def test_a1(self):
+        self.assertEqual([a1(1, 1), a1(3, 27), a1(2, 702), a1(2, 703)], ["A1", "AA3", "ZZ2", "AAA2"])
+
+
+class SyncWorksheetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.snapshot = os.path.join(self.tmp.name, "sheet.json")
+        self.df = pd.DataFrame({"record_id": [f"UP{i}" for i in range(6)], "a": range(6), "b": list("abcdef"),
+                                "c": [0.5] * 6})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_full_then_diff(self):
+        worksheet = InMemoryWorksheet(rows=10, cols=4)
+        result = sync_worksheet(worksheet, self.df, self.snapshot, sleep=no_sleep)
+        self.assertEqual(result["mode"], "full")
+        self.assertEqual(worksheet.ranges, ["A1:D7"])
+
+        changed = self.df.copy()
+        changed.loc[2, "a"] = 99
+        changed.loc[2, "c"] = 1.5
+        changed.loc[5, "b"] = "z"
+        worksheet.ranges.clear()
+        result = sync_worksheet(worksheet, changed, self.snapshot, sleep=no_sleep)
+        self.assertEqual(result["mode"], "diff")
+        self.assertEqual(worksheet.ranges, ["B4:D4", "C7:C7"])
+        self.assertEqual(worksheet.get_all_values(), [list(changed.columns)] + changed.values.tolist())
+
+        worksheet.ranges.clear()
+        result = sync_worksheet(worksheet, changed, self.snapshot, sleep=no_sleep)
+        self.assertEqual((result["cells"], result["requests"], worksheet.ranges), (0, 0, []))
+
+    def test_retries_quota_errors(self):
+        worksheet = InMemoryWorksheet(rows=10, cols=4, failures=[429, 503])
+        sync_worksheet(worksheet, self.df, self.snapshot, sleep=no_sleep)
+        self.assertEqual([call[0] for call in worksheet.calls].count("batch_update"), 3)
+        self.assertEqual(worksheet.get_all_values(), [list(self.df.columns)] + self.df.values.tolist())
+
+    def test_permanent_error_drops_snapshot(self):
+        worksheet = InMemoryWorksheet(rows=10, cols=4)
+        sync_worksheet(worksheet, self.df, self.snapshot, sleep=no_sleep)
+        worksheet.failures = [400]
+        with self.assertRaises(SheetsAPIError):
+            sync_worksheet(worksheet, self.df.assign(a=1), self.snapshot, sleep=no_sleep)
+        self.assertFalse(os.path.exists(self.snapshot))
+        self.assertEqual(sync_worksheet(worksheet, self.df.assign(a=1), self.snapshot, sleep=no_sleep)["mode"], "full")
+
+    def test_chunks_respect_max_cells(self):
+        worksheet = InMemoryWorksheet(rows=10, cols=4)
+        result = sync_worksheet(worksheet, self.df, self.snapshot, max_cells=8, sleep=no_sleep)
+        self.assertEqual(result["requests"], 4)
+        self.assertEqual(worksheet.ranges, ["A1:D2", "A3:D4", "A5:D6", "A7:D7"])
+
+    def test_diff_chunks_respect_max_cells(self):
+        worksheet = InMemoryWorksheet(rows=10, cols=4)
+        sync_worksheet(worksheet, self.df, self.snapshot, sleep=no_sleep)
+
+        # a recomputed column is one 6x1 block, sent as bands of 4 rows
+        worksheet.ranges.clear()
+        changed = self.df.assign(a=self.df["a"] + 1)
+        result = sync_worksheet(worksheet, changed, self.snapshot, max_cells=4, sleep=no_sleep)
+        self.assertEqual(result["mode"], "diff")
+        self.assertEqual(worksheet.ranges, ["B2:B5", "B6:B7"])
+
+        # every data cell changed: one 6x3 block (record_id stays), at most 8 cells per request
+        worksheet.ranges.clear()
+        worksheet.calls.clear()
+        changed = changed.assign(a=changed["a"] + 1, b=changed["b"] + "x", c=changed["c"] + 1)
+        result = sync_worksheet(worksheet, changed, self.snapshot, max_cells=8, sleep=no_sleep)
+        self.assertEqual(worksheet.ranges, ["B2:D3", "B4:D5", "B6:D7"])
+        self.assertEqual([call[2] for call in worksheet.calls if call[0] == "batch_update"], [6, 6, 6])
+        self.assertEqual(worksheet.get_all_values(), [list(changed.columns)] + changed.values.tolist())
+
+    def test_rows_wider_than_max_cells_are_split(self):
+        worksheet = InMemoryWorksheet(rows=10, cols=4)
+        sync_worksheet(worksheet, self.df.head(1), self.snapshot, max_cells=3, sleep=no_sleep)
+        self.assertEqual(worksheet.ranges, ["A1:C1", "D1:D1", "A2:C2", "D2:D2"])
+
+        worksheet.ranges.clear()
+        worksheet.calls.clear()
+        changed = self.df.head(1).assign(record_id="XX0", a=5, b="q", c=2.5)
+        sync_worksheet(worksheet, changed, self.snapshot, max_cells=3, sleep=no_sleep)
+        self.assertEqual(worksheet.ranges, ["A2:C2", "D2:D2"])
+        self.assertTrue(all(call[2] <= 3 for call in worksheet.calls if call[0] == "batch_update"))
+        self.assertEqual(worksheet.get_all_values(), [list(changed.columns)] + changed.values.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from baard_storage import read_table, storage_dtypes, write_table
+
+
+class StorageDtypesTest(unittest.TestCase):
+
+    def test_float32_only_where_values_survive(self):
+        df = pd.DataFrame({
+            "large_volume": [1, 2, 2 ** 24 + 1],       # integer not exactly representable in float32
+            "small_volume": [1, 2, 3],
+            "huge_thickness": [1e39, 1.0, 2.0],         # overflows float32
+            "lh_thickness": [2.5, 2.25, np.nan],
+        })
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            dtypes = storage_dtypes(df)
+        self.assertEqual(dtypes, {"small_volume": "float32", "lh_thickness": "float32"})
+        self.assertIn("large_volume", str(caught[0].message))
+        self.assertIn("huge_thickness", str(caught[0].message))
+
+    def test_round_trip_keeps_values(self):
+        df = pd.DataFrame({
+            "record_id": ["UP1", "UT2", "WU3"],
+            "has_smri": [1, 0, np.nan],
+            "large_volume": [1, 2, 2 ** 24 + 1],
+            "lh_thickness": [2.5, 2.25, np.nan],
+        })
+        with tempfile.TemporaryDirectory() as tmp, warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            path = os.path.join(tmp, "master.parquet")
+            write_table(df, path)
+            result = read_table(path)
+        self.assertEqual(result["large_volume"].tolist(), df["large_volume"].tolist())
+        self.assertEqual(result["lh_thickness"].dtype, np.float32)
+        self.assertEqual(str(result["has_smri"].dtype), "Int8")
+        self.assertEqual(result["record_id"].astype(str).tolist(), df["record_id"].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
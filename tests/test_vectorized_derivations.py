@@ -0,0 +1,93 @@
+import random
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from baard import (classify_medication, classify_medication_vectorized, compute_remission_status,
+                   compute_remission_status_vectorized, compute_response_delta, compute_response_delta_vectorized)
+
+WEEKS = [2, 4, 6, 8, 10]
+
+
+def random_scores(rnd, n_rows, low, high, missing=0.4):
+    # integer scores, a share of them missing, a few zeros (baselines of 0 skip the scale in the response delta)
+    return [np.nan if rnd.random() < missing else rnd.choice([0, low, high, rnd.randint(low, high)])
+            for _ in range(n_rows)]
+
+
+def random_master(seed, n_rows=400):
+    rnd = random.Random(seed)
+    meds = [None, np.nan, "", "  ", "BUPROPION", "bupropion ", " Bupropion", "ARIPIPRAZOLE", "aripiprazole",
+            "SERTRALINE", "other"]
+    df = pd.DataFrame({
+        "record_id": [f"UP{i}" for i in range(n_rows)],
+        "baseline_madrs": random_scores(rnd, n_rows, 5, 45),
+        "week10_madrs": random_scores(rnd, n_rows, 0, 40),
+        "baseline_phq9": random_scores(rnd, n_rows, 3, 27),
+        "week10_phq9": random_scores(rnd, n_rows, 0, 27),
+        "week8_phq9": random_scores(rnd, n_rows, 0, 27),
+        "week6_phq9": random_scores(rnd, n_rows, 0, 27),
+    })
+    # scores on the cut-offs (MADRS 10, PHQ9 4) and just above them
+    df.loc[:9, "week10_madrs"] = [10, 11, np.nan, np.nan, np.nan, np.nan, 10, np.nan, np.nan, np.nan]
+    df.loc[:9, "week10_phq9"] = [np.nan, np.nan, 4, 5, np.nan, np.nan, 4, np.nan, np.nan, np.nan]
+    df.loc[:9, "week8_phq9"] = [np.nan, np.nan, np.nan, np.nan, 4, np.nan, 5, 5, np.nan, np.nan]
+    df.loc[:9, "week6_phq9"] = [np.nan, np.nan, np.nan, np.nan, 9, 4, np.nan, 3, 5, np.nan]
+    for week in WEEKS:
+        for slot in (1, 2):
+            df[f"week{week}_med{slot}"] = pd.Series([rnd.choice(meds) for _ in range(n_rows)], dtype=object)
+    # rows with nothing but no medications / one medication / augmentation / switch patterns
+    med_cols = [f"week{week}_med{slot}" for week in WEEKS for slot in (1, 2)]
+    df.loc[0, med_cols] = None
+    df.loc[1, med_cols] = "BUPROPION"
+    df.loc[2, med_cols] = [None] * 4 + ["BUPROPION", "ARIPIPRAZOLE"] + [None] * 4
+    df.loc[3, med_cols] = ["ARIPIPRAZOLE", None, "BUPROPION", None] + [None] * 6
+    df.loc[4, med_cols] = ["aripiprazole", "bupropion"] + [None] * 8
+    return df
+
+
+def row_wise(df, func):
+    return df.apply(func, axis=1)
+
+
+class VectorizedDerivationsTest(unittest.TestCase):
+
+    def assert_same(self, expected, result):
+        np.testing.assert_array_equal(result.isna().to_numpy(), expected.isna().to_numpy())
+        present = expected.notna().to_numpy()
+        self.assertEqual(result.to_numpy()[present].tolist(), expected.to_numpy()[present].tolist())
+
+    def test_remission_status(self):
+        for seed in range(5):
+            df = random_master(seed)
+            self.assert_same(row_wise(df, compute_remission_status), compute_remission_status_vectorized(df))
+
+    def test_response_delta(self):
+        for seed in range(5):
+            df = random_master(seed)
+            self.assert_same(row_wise(df, compute_response_delta), compute_response_delta_vectorized(df))
+
+    def test_medication_classification(self):
+        for seed in range(5):
+            df = random_master(seed)
+            expected = row_wise(df, classify_medication)
+            self.assertEqual(classify_medication_vectorized(df).tolist(), expected.tolist())
+
+    def test_missing_columns(self):
+        # row.get() gives None for a column that isn't there, the vectorized versions treat it as all missing
+        df = random_master(0).drop(columns=["week10_madrs", "baseline_phq9", "week6_med2", "week10_med1"])
+        self.assert_same(row_wise(df, compute_remission_status), compute_remission_status_vectorized(df))
+        self.assert_same(row_wise(df, compute_response_delta), compute_response_delta_vectorized(df))
+        self.assertEqual(classify_medication_vectorized(df).tolist(), row_wise(df, classify_medication).tolist())
+
+    def test_cut_offs(self):
+        df = random_master(0)
+        status = compute_remission_status_vectorized(df)
+        # MADRS first, then PHQ9 at week 10, 8, 6; all missing stays missing
+        self.assertEqual(status[:9].tolist(), [1, 0, 1, 0, 1, 1, 1, 0, 0])
+        self.assertTrue(np.isnan(status[9]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+from operator import itemgetter
+from typing import Callable, Collection, Dict, Iterator, List, Optional, Tuple
+
+# field names of the RRF files, in file order
+RRF_FIELDS = {
+    'MRCONSO': ['CUI', 'LAT', 'TS', 'LUI', 'STT', 'SUI', 'ISPREF', 'AUI', 'SAUI', 'SCUI', 'SDUI', 'SAB', 'TTY', 'CODE',
+                'STR', 'SRL', 'SUPPRESS', 'CVF'],
+    'MRDEF': ['CUI', 'AUI', 'ATUI', 'SATUI', 'SAB', 'DEF', 'SUPPRESS', 'CVF'],
+    'MRSTY': ['CUI', 'TUI', 'STN', 'STY', 'ATUI', 'CVF'],
+    'SRDEF': ['RT', 'UI', 'STY_RL', 'STN_RTN', 'DEF', 'EX', 'UN', 'NH', 'ABR', 'RIN'],
+}
+
+# bytes read per chunk
+BUFFER_SIZE = 1 << 24
+
+
+class RRFReader:
+    """
+    Streams the rows of an RRF file as tuples of the selected columns.
+
+    The file is read in large binary chunks that are decoded and split into lines at once. Every line is only split
+    as far as the last needed column, and the filters are checked on those raw fields, so rows that are filtered out
+    never become dicts or objects.
+    """
+
+    def __init__(self, path: str, fields: List[str], columns: List[str],
+                 filters: Optional[Dict[str, Collection[str]]] = None, buffer_size: int = BUFFER_SIZE,
+                 progress: Optional[Callable[[int], None]] = None, start: int = 0, end: Optional[int] = None):
+        """
+        :param path: Path to the RRF file
+        :param fields: All field names of the file in order, e.g. RRF_FIELDS['MRCONSO']
+        :param columns: Field names to return for each row, in this order
+        :param filters: Field name -> allowed values; a row is kept when every filtered field has an allowed value.
+        Empty or None values mean no filtering on that field.
+        :param buffer_size: Bytes to read at a time
+        :param progress: Called with the number of bytes read for each chunk
+        :param start: Byte offset to start reading at, must be the start of a line (see line_aligned_ranges)
+        :param end: Byte offset to stop reading at, must be the start of a line or the end of the file (None: end of file)
+        """
+        self.path = path
+        self.columns = list(columns)
+        self.buffer_size = buffer_size
+        self.progress = progress
+        self.start = start
+        self.end = end
+        unknown = [name for name in list(columns) + list(filters or {}) if name not in fields]
+        if unknown:
+            raise ValueError('Unknown RRF field(s) {} for {}'.format(', '.join(unknown), path))
+        self.__column_indexes = [fields.index(name) for name in columns]
+        self.__filters = [(fields.index(name), frozenset(allowed)) for name, allowed in (filters or {}).items() if allowed]
+        # split a line only as far as needed, the rest of it stays one string
+        self.__max_split = max(self.__column_indexes + [index for index, _ in self.__filters]) + 1
+
+    def __iter_lines__(self) -> Iterator[List[str]]:
+        tail = b''
+        with open(self.path, 'rb') as f:
+            f.seek(self.start)
+            remaining = -1 if self.end is None else self.end - self.start
+            while remaining != 0:
+                chunk = f.read(self.buffer_size if remaining < 0 else min(self.buffer_size, remaining))
+                remaining = remaining - len(chunk) if remaining > 0 else remaining
+                if not chunk:
+                    break
+                if self.progress is not None:
+                    self.progress(len(chunk))
+                end = chunk.rfind(b'\n')
+                if end == -1:
+                    tail += chunk
+                    continue
+                text = (tail + chunk[:end]).decode('utf-8')
+                tail = chunk[end + 1:]
+                if '\r' in text:
+                    text = text.replace('\r\n', '\n')
+                yield text.split('\n')
+        if tail.strip():
+            yield [tail.decode('utf-8').rstrip('\r')]
+
+    def __iter__(self) -> Iterator[Tuple[str, ...]]:
+        max_split = self.__max_split
+        # itemgetter of one index returns the value itself, not a tuple
+        indexes = self.__column_indexes
+        get_columns = itemgetter(*indexes) if len(indexes) > 1 else lambda fields: (fields[indexes[0]],)
+        filters = self.__filters
+        for lines in self.__iter_lines__():
+            for line in lines:
+                if not line:
+                    continue
+                fields = line.split('|', max_split)
+                for index, allowed in filters:
+                    if fields[index] not in allowed:
+                        break
+                else:
+                    yield get_columns(fields)
+
+
+
+def line_aligned_ranges(path: str, n_ranges: int) -> List[Tuple[int, int]]:
+    """
+    Splits a file into about n_ranges byte ranges of similar size whose boundaries fall on line starts,
+    so every line belongs to exactly one range.
+    :param path: Path to the file
+    :param n_ranges: Number of ranges wanted (fewer are returned for small files)
+    :return: List of (start, end) byte offsets in file order, covering the whole file
+    """
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, n_ranges):
+            offset = size * i // n_ranges
+            if offset <= boundaries[-1]:
+                continue
+            # move to the start of the next line
+            f.seek(offset - 1)
+            f.readline()
+            offset = f.tell()
+            if boundaries[-1] < offset < size:
+                boundaries.append(offset)
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
@@ -0,0 +1,303 @@
+import json
+import logging
+import os
+import sqlite3
+import unicodedata
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Tuple
+
+from tqdm import tqdm
+
+from umlsparser.model.Concept import Concept
+from umlsparser.model.SemanticType import SemanticType
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+BATCH_SIZE = 50000
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE mrconso (cui TEXT, lat TEXT, ts TEXT, sab TEXT, code TEXT, str TEXT, norm_str TEXT);
+CREATE TABLE mrdef (cui TEXT, def TEXT, sab TEXT);
+CREATE TABLE mrsty (cui TEXT, tui TEXT);
+CREATE TABLE srdef (tui TEXT PRIMARY KEY, rt TEXT, name TEXT, def TEXT);
+CREATE TABLE concepts (cui TEXT PRIMARY KEY);
+"""
+
+# indexes are created after the bulk insert, which is a lot faster than keeping them up to date row by row
+INDEXES = """
+CREATE INDEX mrconso_cui ON mrconso (cui);
+CREATE INDEX mrconso_sab_code ON mrconso (sab, code);
+CREATE INDEX mrconso_norm_str ON mrconso (norm_str);
+CREATE INDEX mrdef_cui ON mrdef (cui);
+CREATE INDEX mrsty_cui ON mrsty (cui);
+CREATE INDEX mrsty_tui ON mrsty (tui);
+"""
+
+
+def normalize_string(value: str) -> str:
+    """
+    Normalizes a concept name for lookups: unicode NFKC, case folded and whitespace collapsed.
+    :param value: Name as found in MRCONSO.RRF (STR)
+    :return: Normalized name
+    """
+    return ' '.join(unicodedata.normalize('NFKC', value).casefold().split())
+
+
+def compile_index(path: str, index_path: str, language_filter: list = []) -> str:
+    """
+    Compiles the UMLS RRF files into a single SQLite index that UMLSParser.from_index can open lazily.
+    This is a one-time step per UMLS release (and language filter), parsing does not have to happen again afterwards.
+    :param path: Basepath to UMLS data files
+    :param index_path: File to write the index to (overwritten if it exists)
+    :param language_filter: List of languages with three-letter style language codes (if empty, no filtering will be applied)
+    :return: index_path
+    """
+    from umlsparser.UMLSParser import UMLS_sources_by_language
+
+    paths = {
+        'MRCONSO': os.path.join(path, 'META', 'MRCONSO.RRF'),
+        'MRDEF': os.path.join(path, 'META', 'MRDEF.RRF'),
+        'MRSTY': os.path.join(path, 'META', 'MRSTY.RRF'),
+        'SRDEF': os.path.join(path, 'NET', 'SRDEF'),
+    }
+    source_filter = set()
+    for language in language_filter:
+        source_filter.update(UMLS_sources_by_language.get(language))
+    language_filter_set = set(language_filter)
+
+    tmp_path = index_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    connection.execute('PRAGMA journal_mode=OFF')
+    connection.execute('PRAGMA synchronous=OFF')
+    connection.executescript(SCHEMA)
+
+    def insert_rows(table, placeholders, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                connection.executemany('INSERT INTO {} VALUES ({})'.format(table, placeholders), batch)
+                batch = []
+        if batch:
+            connection.executemany('INSERT INTO {} VALUES ({})'.format(table, placeholders), batch)
+
+    def mrconso_rows():
+        with open(paths['MRCONSO'], encoding='utf-8') as f:
+            for line in tqdm(f, desc='Indexing UMLS concepts (MRCONSO.RRF)'):
+                line = line.split('|')
+                if language_filter_set and line[1] not in language_filter_set:
+                    continue
+                yield line[0], line[1], line[2], line[11], line[13], line[14], normalize_string(line[14])
+
+    def mrdef_rows():
+        with open(paths['MRDEF'], encoding='utf-8') as f:
+            for line in tqdm(f, desc='Indexing UMLS definitions (MRDEF.RRF)'):
+                line = line.split('|')
+                if language_filter_set and line[4] not in source_filter:
+                    continue
+                yield line[0], line[5], line[4]
+
+    def mrsty_rows():
+        with open(paths['MRSTY'], encoding='utf-8') as f:
+            for line in tqdm(f, desc='Indexing UMLS semantic types (MRSTY.RRF)'):
+                line = line.split('|')
+                yield line[0], line[1]
+
+    def srdef_rows():
+        with open(paths['SRDEF'], encoding='utf-8') as f:
+            for line in tqdm(f, desc='Indexing UMLS semantic net definitions (SRDEF)'):
+                line = line.split('|')
+                yield line[1], line[0], line[2], line[4]
+
+    insert_rows('mrconso', '?, ?, ?, ?, ?, ?, ?', mrconso_rows())
+    insert_rows('mrdef', '?, ?, ?', mrdef_rows())
+    insert_rows('mrsty', '?, ?', mrsty_rows())
+    connection.executemany('INSERT OR REPLACE INTO srdef VALUES (?, ?, ?, ?)', srdef_rows())
+
+    # same concept order as UMLSParser: first seen in MRCONSO, then MRDEF, then MRSTY
+    for table in ['mrconso', 'mrdef', 'mrsty']:
+        connection.execute('INSERT OR IGNORE INTO concepts (cui) SELECT cui FROM {} ORDER BY rowid'.format(table))
+    connection.executescript(INDEXES)
+    connection.executemany('INSERT INTO meta VALUES (?, ?)', [
+        ('format_version', str(INDEX_FORMAT_VERSION)),
+        ('language_filter', json.dumps(list(language_filter))),
+        ('source_path', os.path.abspath(path)),
+    ])
+    connection.commit()
+    connection.close()
+    os.replace(tmp_path, index_path)
+    logger.info('Wrote UMLS index to {}'.format(index_path))
+    return index_path
+
+
+class LazyConceptMap(Mapping):
+    """
+    Read-only dict of CUI -> Concept backed by a compiled UMLS index.
+    Concepts are only built when they are looked up; looked up concepts are kept, iterating over items()/values()
+    builds concepts batch by batch without keeping them.
+    """
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.__connection = connection
+        self.__cache = {}
+        self.__length = None
+
+    def __load_many__(self, cuis: List[str], subquery: str = None, params: tuple = ()) -> Dict[str, Concept]:
+        # rows are selected with cui IN (placeholders), or IN (subquery) for large batches
+        if subquery is None:
+            subquery, params = ', '.join('?' * len(cuis)), tuple(cuis)
+        concepts = {}
+        for cui in cuis:
+            concepts[cui] = Concept(cui)
+        for cui, lat, ts, sab, code, string in self.__connection.execute(
+                'SELECT cui, lat, ts, sab, code, str FROM mrconso WHERE cui IN ({}) ORDER BY rowid'.format(subquery), params):
+            concepts[cui].__add_mrconso_row__(lat, ts, sab, code, string)
+        for cui, definition, sab in self.__connection.execute(
+                'SELECT cui, def, sab FROM mrdef WHERE cui IN ({}) ORDER BY rowid'.format(subquery), params):
+            concepts[cui].__add_mrdef_data__({'DEF': definition, 'SAB': sab})
+        for cui, tui in self.__connection.execute(
+                'SELECT cui, tui FROM mrsty WHERE cui IN ({}) ORDER BY rowid'.format(subquery), params):
+            concepts[cui].__add_mrsty_data__({'TUI': tui})
+        for concept in concepts.values():
+            concept.__freeze__()
+        return concepts
+
+    def __getitem__(self, cui: str) -> Concept:
+        concept = self.__cache.get(cui)
+        if concept is None:
+            if cui not in self:
+                raise KeyError(cui)
+            concept = self.__load_many__([cui])[cui]
+            self.__cache[cui] = concept
+        return concept
+
+    def __contains__(self, cui) -> bool:
+        if cui in self.__cache:
+            return True
+        return self.__connection.execute('SELECT 1 FROM concepts WHERE cui = ?', (cui,)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for (cui,) in self.__connection.execute('SELECT cui FROM concepts ORDER BY rowid'):
+            yield cui
+
+    def __len__(self) -> int:
+        if self.__length is None:
+            self.__length = self.__connection.execute('SELECT COUNT(*) FROM concepts').fetchone()[0]
+        return self.__length
+
+    def iter_batches(self, batch_size: int = 500) -> Iterator[Dict[str, Concept]]:
+        """
+        Builds all concepts in index order, batch_size at a time, without caching them.
+        :param batch_size: Number of concepts per batch
+        :return: Iterator of dicts CUI -> Concept
+        """
+        cursor = self.__connection.execute('SELECT cui FROM concepts ORDER BY rowid')
+        while True:
+            cuis = [row[0] for row in cursor.fetchmany(batch_size)]
+            if not cuis:
+                break
+            yield self.__load_many__(cuis)
+
+    def position_range(self) -> Tuple[int, int]:
+        """
+        :return: (first, last) position of the concepts in the index (SQLite rowids), for use with load_range
+        """
+        first, last = self.__connection.execute('SELECT MIN(rowid), MAX(rowid) FROM concepts').fetchone()
+        return first or 0, last or -1
+
+    def load_range(self, start: int, stop: int) -> Dict[str, Concept]:
+        """
+        Builds the concepts at positions start <= position < stop in index order, without caching them.
+        Lets several processes work on separate parts of the index.
+        :return: dict CUI -> Concept
+        """
+        subquery = 'SELECT cui FROM concepts WHERE rowid >= ? AND rowid < ?'
+        cuis = [row[0] for row in self.__connection.execute(subquery + ' ORDER BY rowid', (start, stop))]
+        return self.__load_many__(cuis, subquery, (start, stop))
+
+    def items(self) -> Iterator[Tuple[str, Concept]]:
+        for batch in self.iter_batches():
+            yield from batch.items()
+
+    def values(self) -> Iterator[Concept]:
+        for batch in self.iter_batches():
+            yield from batch.values()
+
+
+class UMLSIndex:
+    """
+    Opens a UMLS index written by compile_index. Opening is near-instant, nothing is parsed up front.
+    """
+
+    def __init__(self, index_path: str):
+        if not os.path.exists(index_path):
+            raise FileNotFoundError('No UMLS index at {}, create one with umlsparser.tools.compile_index'.format(index_path))
+        self.index_path = index_path
+        self.connection = sqlite3.connect('file:{}?mode=ro'.format(index_path), uri=True)
+        meta = dict(self.connection.execute('SELECT key, value FROM meta'))
+        if int(meta.get('format_version', 0)) != INDEX_FORMAT_VERSION:
+            raise ValueError('UMLS index {} has format version {}, expected {}. Please recompile it.'.format(
+                index_path, meta.get('format_version'), INDEX_FORMAT_VERSION))
+        self.language_filter = json.loads(meta['language_filter'])
+        self.source_path = meta.get('source_path')
+        self.concepts = LazyConceptMap(self.connection)
+
+    def __batched__(self, sql: str, values: list, fixed: tuple = ()) -> Iterator[tuple]:
+        # sql has one {} for the IN placeholders, SQLite allows a limited number of parameters per statement
+        values = list(dict.fromkeys(values))
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            yield from self.connection.execute(sql.format(', '.join('?' * len(batch))), fixed + tuple(batch))
+
+    def cuis_for_codes(self, sab: str, codes: List[str]) -> Dict[str, List[str]]:
+        """
+        :return: code -> CUIs that have this (SAB, CODE) in MRCONSO, in concept order (only codes that were found)
+        """
+        found = {}
+        for code, cui in self.__batched__(
+                'SELECT DISTINCT m.code, m.cui FROM mrconso m JOIN concepts c ON c.cui = m.cui '
+                'WHERE m.sab = ? AND m.code IN ({}) ORDER BY c.rowid', codes, (sab,)):
+            found.setdefault(code, []).append(cui)
+        return found
+
+    def cuis_for_normalized_names(self, names: List[str]) -> Dict[str, List[str]]:
+        """
+        :param names: Names already normalized with normalize_string
+        :return: name -> CUIs with this name, in concept order (only names that were found)
+        """
+        found = {}
+        for name, cui in self.__batched__(
+                'SELECT DISTINCT m.norm_str, m.cui FROM mrconso m JOIN concepts c ON c.cui = m.cui '
+                'WHERE m.norm_str IN ({}) ORDER BY c.rowid', names):
+            found.setdefault(name, []).append(cui)
+        return found
+
+    def cuis_for_tuis(self, tuis: List[str]) -> Dict[str, List[str]]:
+        """
+        :return: TUI -> CUIs, in concept order (only TUIs that were found). Like Concept.get_tui, a concept's TUI is
+        the last one listed for it in MRSTY.RRF.
+        """
+        found = {}
+        for tui, cui in self.__batched__(
+                'SELECT m.tui, m.cui FROM mrsty m JOIN concepts c ON c.cui = m.cui WHERE m.tui IN ({}) '
+                'AND m.rowid = (SELECT MAX(rowid) FROM mrsty WHERE cui = m.cui) ORDER BY c.rowid', tuis):
+            found.setdefault(tui, []).append(cui)
+        return found
+
+    def load_semantic_types(self) -> Dict[str, SemanticType]:
+        """
+        :return: A dictionary of all UMLS semantic types with TUI being the key (small, so loaded at once).
+        """
+        semantic_types = {}
+        for tui, rt, name, definition in self.connection.execute('SELECT tui, rt, name, def FROM srdef ORDER BY rowid'):
+            semantic_type = SemanticType(tui)
+            semantic_type.__add_srdef_data__({'RT': rt, 'STY_RL': name, 'DEF': definition})
+            semantic_types[tui] = semantic_type
+        return semantic_types
+
+    def close(self):
+        self.connection.close()
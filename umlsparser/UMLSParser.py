@@ -1,9 +1,11 @@
 import logging
 import os
-from typing import Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Optional
 
 from tqdm import tqdm
 
+from umlsparser.RRFReader import RRFReader, RRF_FIELDS, line_aligned_ranges
 from umlsparser.model.Concept import Concept
 from umlsparser.model.SemanticType import SemanticType
 
@@ -29,13 +31,69 @@ UMLS_sources_by_language = {
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+MRCONSO_COLUMNS = ['CUI', 'LAT', 'TS', 'SAB', 'CODE', 'STR']
+
+# byte ranges per worker process, more than one so that the workers finish at about the same time
+RANGES_PER_WORKER = 4
+
+PROGRESS_DESCRIPTIONS = {
+    'MRCONSO': 'Parsing UMLS concepts (MRCONSO.RRF)',
+    'MRDEF': 'Parsing UMLS definitions (MRDEF.RRF)',
+    'MRSTY': 'Parsing UMLS semantic types (MRSTY.RRF)',
+    'SRDEF': 'Parsing UMLS semantic net definitions (SRDEF)',
+}
+
+
+class TqdmProgress:
+    """
+    Default progress hook of UMLSParser: one tqdm bar per file.
+    A progress hook is called as hook(file, bytes_done, bytes_total), file being 'MRCONSO', 'MRDEF', 'MRSTY' or 'SRDEF'.
+    """
+
+    def __init__(self):
+        self.__bars = {}
+
+    def __call__(self, name: str, done: int, total: int):
+        bar = self.__bars.get(name)
+        if bar is None:
+            bar = self.__bars[name] = tqdm(total=total, unit='B', unit_scale=True, desc=PROGRESS_DESCRIPTIONS.get(name, name))
+        bar.update(done - bar.n)
+        if done >= total:
+            bar.close()
+            del self.__bars[name]
+
+
+def _add_mrconso_rows(concepts: Dict[str, Concept], rows) -> Dict[str, Concept]:
+    for cui, lat, ts, sab, code, string in rows:
+        concept = concepts.get(cui)
+        if concept is None:
+            concept = concepts[cui] = Concept(cui)
+        concept.__add_mrconso_row__(lat, ts, sab, code, string)
+    return concepts
+
+
+def _parse_mrconso_range(path: str, filters: dict, start: int, end: int) -> Dict[str, Concept]:
+    """
+    Worker process part of the parallel parse: builds the (partial) concepts of one byte range of MRCONSO.RRF.
+    """
+    reader = RRFReader(path, RRF_FIELDS['MRCONSO'], MRCONSO_COLUMNS, filters=filters, start=start, end=end)
+    return _add_mrconso_rows({}, reader)
+
 
 class UMLSParser:
 
-    def __init__(self, path: str, language_filter: list = []):
+    def __init__(self, path: str, language_filter: list = [], source_filter: list = [], term_type_filter: list = [],
+                 suppress_filter: list = [], workers: Optional[int] = 1,
+                 progress: Optional[Callable[[str, int, int], None]] = None):
         """
         :param path: Basepath to UMLS data files
         :param languages: List of languages with three-letter style language codes (if empty, no filtering will be applied)
+        :param source_filter: Sources (SAB) to keep from MRCONSO.RRF and MRDEF.RRF, e.g. ['RXNORM'] (if empty, all)
+        :param term_type_filter: Term types (TTY) to keep from MRCONSO.RRF, e.g. ['IN', 'PT'] (if empty, all)
+        :param suppress_filter: SUPPRESS values to keep, e.g. ['N'] to drop suppressed names (if empty, all)
+        :param workers: Number of processes to parse MRCONSO.RRF with (1: in this process, None: one per CPU).
+        The result is the same as with a single process.
+        :param progress: Hook called as progress(file, bytes_done, bytes_total) while parsing (default: tqdm bars)
         """
         logger.info("Initialising UMLSParser for basepath {}".format(path))
         if language_filter:
@@ -49,108 +107,223 @@ class UMLSParser:
             'SRDEF': os.path.join(path, 'NET', 'SRDEF'),
         }
         self.language_filter = language_filter
+        self.source_filter = source_filter
+        self.term_type_filter = term_type_filter
+        self.suppress_filter = suppress_filter
+        self.workers = workers or os.cpu_count()
+        self.progress = progress if progress is not None else TqdmProgress()
+        self.index = None
+        self.__reverse_indexes = {}
         self.concepts = {}
         self.semantic_types = {}
         self.__parse_mrconso__()
         self.__parse_mrdef__()
         self.__parse_mrsty__()
         self.__parse_srdef__()
+        for concept in self.concepts.values():
+            concept.__freeze__()
+
+    @classmethod
+    def from_index(cls, index_path: str) -> 'UMLSParser':
+        """
+        Opens a UMLS index compiled with umlsparser.tools.compile_index instead of parsing the RRF files.
+        Startup is near-instant, concepts are loaded from the index when they are accessed.
+        :param index_path: Path to the compiled index
+        :return: UMLSParser with the same getters as a parsed one
+        """
+        from umlsparser.UMLSIndex import UMLSIndex
+
+        logger.info("Opening UMLS index {}".format(index_path))
+        index = UMLSIndex(index_path)
+        parser = cls.__new__(cls)
+        parser.paths = {'INDEX': index_path}
+        parser.language_filter = index.language_filter
+        parser.source_filter = []
+        parser.term_type_filter = []
+        parser.suppress_filter = []
+        parser.workers = 1
+        parser.progress = None
+        parser.index = index
+        parser.__reverse_indexes = {}
+        parser.concepts = index.concepts
+        parser.semantic_types = index.load_semantic_types()
+        return parser
 
     def __get_or_add_concept__(self, cui: str) -> Concept:
-        concept = self.concepts.get(cui, Concept(cui))
-        self.concepts[cui] = concept
+        concept = self.concepts.get(cui)
+        if concept is None:
+            concept = self.concepts[cui] = Concept(cui)
         return concept
 
     def __get_or_add_semantic_type__(self, tui: str) -> SemanticType:
-        semantic_type = self.semantic_types.get(tui, SemanticType(tui))
-        self.semantic_types[tui] = semantic_type
+        semantic_type = self.semantic_types.get(tui)
+        if semantic_type is None:
+            semantic_type = self.semantic_types[tui] = SemanticType(tui)
         return semantic_type
 
+    def __rows__(self, name: str, columns: list, filters: dict = None):
+        """
+        Rows of one of the RRF files (see RRFReader), reporting progress to the progress hook.
+        """
+        path = self.paths[name]
+        total = os.path.getsize(path)
+        done = 0
+
+        def update(n_bytes):
+            nonlocal done
+            done += n_bytes
+            self.progress(name, done, total)
+
+        yield from RRFReader(path, RRF_FIELDS[name], columns, filters=filters, progress=update)
+        if done < total or total == 0:
+            self.progress(name, total, total)
+
     def __parse_mrconso__(self):
-        for line in tqdm(open(self.paths['MRCONSO']), desc='Parsing UMLS concepts (MRCONSO.RRF)'):
-            line = line.split('|')
-            data = {
-                'CUI': line[0],
-                'LAT': line[1],  # language of term
-                'TS': line[2],  # term status
-                'LUI': line[3],
-                'STT': line[4],
-                'SUI': line[5],
-                'ISPREF': line[6],
-                'AUI': line[7],
-                'SAUI': line[8],
-                'SCUI': line[9],
-                'SDUI': line[10],
-                'SAB': line[11],  # source abbreviation
-                'TTY': line[12],
-                'CODE': line[13],  # Unique Identifier or code for string in source
-                'STR': line[14],  # description string
-                'SRL': line[15],
-                'SUPPRESS': line[16],
-                'CVF': line[17]
-            }
-            if len(self.language_filter) != 0 and data.get('LAT') not in self.language_filter:
-                continue
-            concept = self.__get_or_add_concept__(data.get('CUI'))
-            concept.__add_mrconso_data__(data)
+        filters = {
+            'LAT': self.language_filter,  # language of term
+            'SAB': self.source_filter,  # source abbreviation
+            'TTY': self.term_type_filter,
+            'SUPPRESS': self.suppress_filter,
+        }
+        if self.workers > 1:
+            self.__parse_mrconso_parallel__(filters)
+        else:
+            _add_mrconso_rows(self.concepts, self.__rows__('MRCONSO', MRCONSO_COLUMNS, filters))
         logger.info('Found {} unique CUIs'.format(len(self.concepts.keys())))
 
+    def __parse_mrconso_parallel__(self, filters: dict):
+        """
+        Parses line aligned byte ranges of MRCONSO.RRF in worker processes. The partial concepts are merged in file
+        order, so concept order, names and codes come out exactly as in the serial parse.
+        """
+        path = self.paths['MRCONSO']
+        total = os.path.getsize(path)
+        ranges = line_aligned_ranges(path, self.workers * RANGES_PER_WORKER)
+        logger.info('Parsing MRCONSO.RRF in {} ranges with {} workers'.format(len(ranges), self.workers))
+        done = 0
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(_parse_mrconso_range, path, filters, start, end) for start, end in ranges]
+            for (start, end), future in zip(ranges, futures):
+                for cui, partial in future.result().items():
+                    concept = self.concepts.get(cui)
+                    if concept is None:
+                        self.concepts[cui] = partial
+                    else:
+                        concept.__merge__(partial)
+                done += end - start
+                self.progress('MRCONSO', done, total)
+        if total == 0:
+            self.progress('MRCONSO', total, total)
+
     def __parse_mrdef__(self):
-        source_filter = []
+        source_filter = set()
         for language in self.language_filter:
-            for source in UMLS_sources_by_language.get(language):
-                source_filter.append(source)
-
-        for line in tqdm(open(self.paths['MRDEF']), desc='Parsing UMLS definitions (MRDEF.RRF)'):
-            line = line.split('|')
-            data = {
-                'CUI': line[0],
-                'AUI': line[1],
-                'ATUI': line[2],
-                'SATUI': line[3],
-                'SAB': line[4],  # source
-                'DEF': line[5],  # definition
-                'SUPPRESS': line[6],
-                'CVF': line[7]
-            }
-            if len(self.language_filter) != 0 and data.get('SAB') not in source_filter:
-                continue
-            concept = self.__get_or_add_concept__(data.get('CUI'))
-            concept.__add_mrdef_data__(data)
+            source_filter.update(UMLS_sources_by_language.get(language))
+        if source_filter and self.source_filter:
+            source_filter &= set(self.source_filter)
+            if not source_filter:
+                logger.info('No definition sources left after filtering, skipping MRDEF.RRF')
+                return
+        else:
+            source_filter = source_filter or set(self.source_filter)
+
+        for cui, sab, definition in self.__rows__('MRDEF', ['CUI', 'SAB', 'DEF'],
+                                                  {'SAB': source_filter, 'SUPPRESS': self.suppress_filter}):
+            concept = self.__get_or_add_concept__(cui)
+            concept.__add_mrdef_data__({'DEF': definition, 'SAB': sab})
 
     def __parse_mrsty__(self):
-        for line in tqdm(open(self.paths['MRSTY']), desc='Parsing UMLS semantic types (MRSTY.RRF)'):
-            line = line.split('|')
-            data = {
-                'CUI': line[0],
-                'TUI': line[1],
-                'STN': line[2],  # empty in MRSTY.RRF ?
-                'STY': line[3],  # empty in MRSTY.RRF ?
-                'ATUI': line[4],  # empty in MRSTY.RRF ?
-                'CVF': line[5]  # empty in MRSTY.RRF ?
-            }
-            concept = self.__get_or_add_concept__(data.get('CUI'))
-            concept.__add_mrsty_data__(data)
+        for cui, tui in self.__rows__('MRSTY', ['CUI', 'TUI']):
+            concept = self.__get_or_add_concept__(cui)
+            concept.__add_mrsty_data__({'TUI': tui})
 
     def __parse_srdef__(self):
-        for line in tqdm(open(self.paths['SRDEF']), desc='Parsing UMLS semantic net definitions (SRDEF)'):
-            line = line.split('|')
-            data = {
-                'RT': line[0],  # Semantic Type (STY) or Relation (RL)
-                'UI': line[1],  # Identifier
-                'STY_RL': line[2],  # Name of STY / RL
-                'STN_RTN': line[3],  # Tree Number of STY / RL
-                'DEF': line[4],  # Definition of STY / RL
-                'EX': line[5],  # Examples of Metathesaurus concepts
-                'UN': line[6],  # Usage note for STY assignment
-                'NH': line[7],  # STY and descendants allow the non-human flag
-                'ABR': line[8],  # Abbreviation of STY / RL
-                'RIN': line[9]  # Inverse of the RL
-            }
-            semantic_type = self.__get_or_add_semantic_type__(data['UI'])
-            semantic_type.__add_srdef_data__(data)
+        for rt, ui, name, definition in self.__rows__('SRDEF', ['RT', 'UI', 'STY_RL', 'DEF']):
+            # RT: Semantic Type (STY) or Relation (RL), STY_RL: Name of STY / RL, DEF: Definition of STY / RL
+            semantic_type = self.__get_or_add_semantic_type__(ui)
+            semantic_type.__add_srdef_data__({'RT': rt, 'STY_RL': name, 'DEF': definition})
         logger.info('Found {} unique TUIs'.format(len(self.semantic_types.keys())))
 
+    def __reverse_index__(self, kind: str) -> Dict:
+        """
+        Reverse index of the parsed concepts, built on first use: 'code' ((SAB, CODE) -> CUIs), 'name' (normalized
+        name -> CUIs) or 'tui' (TUI -> CUIs). CUIs are in concept order.
+        """
+        reverse_index = self.__reverse_indexes.get(kind)
+        if reverse_index is not None:
+            return reverse_index
+        from umlsparser.UMLSIndex import normalize_string
+
+        logger.info('Building {} -> CUI index'.format(kind))
+        reverse_index = {}
+        for cui, concept in self.concepts.items():
+            if kind == 'code':
+                keys = [(sab, code) for sab, codes in concept.get_source_ids().items() for code in codes]
+            elif kind == 'name':
+                keys = {normalize_string(name) for lang in concept.get_languages()
+                        for name in concept.get_names_for_language(lang)}
+            else:
+                keys = [concept.get_tui()] if concept.get_tui() is not None else []
+            for key in keys:
+                reverse_index.setdefault(key, []).append(cui)
+        self.__reverse_indexes[kind] = reverse_index
+        return reverse_index
+
+    def get_cuis_for_code(self, sab: str, code: str) -> list:
+        """
+        :param sab: Source abbreviation, e.g. 'ICD10CM' or 'RXNORM'
+        :param code: Code in that source (CODE field of MRCONSO.RRF)
+        :return: CUIs of the concepts carrying this code (empty if none)
+        """
+        return self.get_cuis_for_codes(sab, [code])[code]
+
+    def get_cuis_for_codes(self, sab: str, codes: list) -> Dict[str, list]:
+        """
+        Batch version of get_cuis_for_code for many codes of one source.
+        :return: Dict code -> CUIs for every code asked for
+        """
+        if self.index is not None:
+            found = self.index.cuis_for_codes(sab, codes)
+            return {code: list(found.get(code, [])) for code in codes}
+        reverse_index = self.__reverse_index__('code')
+        return {code: list(reverse_index.get((sab, code), [])) for code in codes}
+
+    def get_cuis_for_name(self, name: str) -> list:
+        """
+        :param name: Concept name, matched after normalization (unicode NFKC, case folded, whitespace collapsed)
+        :return: CUIs of the concepts with this name in any of the parsed languages (empty if none)
+        """
+        return self.get_cuis_for_names([name])[name]
+
+    def get_cuis_for_names(self, names: list) -> Dict[str, list]:
+        """
+        Batch version of get_cuis_for_name.
+        :return: Dict name (as given) -> CUIs for every name asked for
+        """
+        from umlsparser.UMLSIndex import normalize_string
+
+        normalized = {name: normalize_string(name) for name in names}
+        if self.index is not None:
+            found = self.index.cuis_for_normalized_names(list(normalized.values()))
+        else:
+            found = self.__reverse_index__('name')
+        return {name: list(found.get(normalized_name, [])) for name, normalized_name in normalized.items()}
+
+    def get_cuis_for_tui(self, tui: str) -> list:
+        """
+        :param tui: Semantic Type Identifier, e.g. 'T121'
+        :return: CUIs of the concepts with this semantic type (see Concept.get_tui)
+        """
+        return self.get_cuis_for_tuis([tui])[tui]
+
+    def get_cuis_for_tuis(self, tuis: list) -> Dict[str, list]:
+        """
+        Batch version of get_cuis_for_tui.
+        :return: Dict TUI -> CUIs for every TUI asked for
+        """
+        found = self.index.cuis_for_tuis(tuis) if self.index is not None else self.__reverse_index__('tui')
+        return {tui: list(found.get(tui, [])) for tui in tuis}
+
     def get_concepts(self) -> Dict[str, Concept]:
         """
         :return: A dictionary of all detected UMLS concepts with CUI being the key.
@@ -1,24 +1,47 @@
-import collections
-from dataclasses import dataclass
-from typing import Set, Tuple, Dict
+import sys
+from collections import defaultdict
+from typing import Set, Tuple, Dict, Optional, FrozenSet
+
+
+def _add(store: Optional[dict], key: str, value) -> dict:
+    """
+    Adds value under key to a dict of insertion-ordered sets (dict -> dict with None values).
+    A frozen store (dict -> tuple/frozenset) is opened up again first.
+    """
+    if store is None:
+        store = {}
+    values = store.get(key)
+    if values is None:
+        values = store[key] = {}
+    elif not isinstance(values, dict):
+        values = store[key] = dict.fromkeys(values)
+    values[value] = None
+    return store
 
 
-@dataclass(init=False, repr=True, eq=True)
 class Concept:
+    """
+    A UMLS concept (CUI). Built up while parsing and frozen afterwards: names are stored as tuples, source codes and
+    definitions as frozensets, and the language / source / TUI codes are interned so they are shared between all
+    concepts. Empty collections are not stored at all.
+    """
+    __slots__ = ('__cui', '__tui', '__preferred_names', '__all_names', '__definitions', '__source_ids')
     __cui: str
     __tui: str
-    __preferred_names: Dict[str, Set[str]]
-    __all_names: Dict[str, Set[str]]
-    __definitions: Set[Tuple[str, str]]
-    __source_ids: Dict[str, Set[str]]
+    # lang -> names, None while empty
+    __preferred_names: Optional[Dict[str, Tuple[str, ...]]]
+    __all_names: Optional[Dict[str, Tuple[str, ...]]]
+    __definitions: Optional[FrozenSet[Tuple[str, str]]]
+    # source (SAB) -> codes, None while empty
+    __source_ids: Optional[Dict[str, FrozenSet[str]]]
 
     def __init__(self, cui: str):
         self.__cui = cui
         self.__tui = None
-        self.__preferred_names = collections.defaultdict(set)
-        self.__all_names = collections.defaultdict(set)
-        self.__definitions = set()
-        self.__source_ids = collections.defaultdict(set)
+        self.__preferred_names = None
+        self.__all_names = None
+        self.__definitions = None
+        self.__source_ids = None
 
     def __add_mrconso_data__(self, data: dict):
         """
@@ -26,17 +49,63 @@ class Concept:
         :param data: certain fields out of an MRCONSO.RRF file (lat, str)
         :return:
         """
-        self.__all_names[data['LAT']].add(data['STR'])
-        if data['TS'] == 'P':
-            self.__preferred_names[data['LAT']].add(data['STR'])
-        if data['SAB'] != '' and data['CODE'] != '':
-            self.__source_ids[data['SAB']].add(data['CODE'])
+        self.__add_mrconso_row__(data['LAT'], data['TS'], data['SAB'], data['CODE'], data['STR'])
+
+    def __add_mrconso_row__(self, lat: str, ts: str, sab: str, code: str, string: str):
+        """
+        Same as __add_mrconso_data__ for the raw fields, so parsing does not have to build a dict per row.
+        """
+        lat = sys.intern(lat)
+        self.__all_names = _add(self.__all_names, lat, string)
+        if ts == 'P':
+            self.__preferred_names = _add(self.__preferred_names, lat, string)
+        if sab != '' and code != '':
+            self.__source_ids = _add(self.__source_ids, sys.intern(sab), code)
 
     def __add_mrdef_data__(self, data: dict):
-        self.__definitions.add((data.get('DEF'), data.get('SAB')))
+        definition = (data.get('DEF'), sys.intern(data.get('SAB')) if data.get('SAB') is not None else None)
+        if self.__definitions is None:
+            self.__definitions = {}
+        elif not isinstance(self.__definitions, dict):
+            self.__definitions = dict.fromkeys(self.__definitions)
+        self.__definitions[definition] = None
 
     def __add_mrsty_data__(self, data: dict):
-        self.__tui = data.get('TUI')
+        tui = data.get('TUI')
+        self.__tui = sys.intern(tui) if tui is not None else None
+
+    def __merge__(self, other: 'Concept'):
+        """
+        Adds everything from another (partial) concept with the same CUI, used to combine the parallel parse.
+        The result is the same as if the rows of other had been added to self after its own.
+        :param other: Concept with the same CUI
+        """
+        for lang, names in (other.__all_names or {}).items():
+            for name in names:
+                self.__all_names = _add(self.__all_names, lang, name)
+        for lang, names in (other.__preferred_names or {}).items():
+            for name in names:
+                self.__preferred_names = _add(self.__preferred_names, lang, name)
+        for sab, codes in (other.__source_ids or {}).items():
+            for code in codes:
+                self.__source_ids = _add(self.__source_ids, sab, code)
+        for definition in (other.__definitions or ()):
+            self.__add_mrdef_data__({'DEF': definition[0], 'SAB': definition[1]})
+        if other.__tui is not None:
+            self.__tui = other.__tui
+
+    def __freeze__(self):
+        """
+        Converts the parse-time collections to their compact read-only form. Called by UMLSParser after parsing.
+        """
+        if self.__all_names is not None:
+            self.__all_names = {lang: tuple(names) for lang, names in self.__all_names.items()}
+        if self.__preferred_names is not None:
+            self.__preferred_names = {lang: tuple(names) for lang, names in self.__preferred_names.items()}
+        if self.__source_ids is not None:
+            self.__source_ids = {sab: frozenset(codes) for sab, codes in self.__source_ids.items()}
+        if self.__definitions is not None:
+            self.__definitions = frozenset(self.__definitions)
 
     def get_preferred_names_for_language(self, lang: str) -> list:
         """
@@ -44,7 +113,7 @@ class Concept:
        :param lang: Language
        :return: Set of names
        """
-        return list(self.__preferred_names.get(lang, []))
+        return list((self.__preferred_names or {}).get(lang, []))
 
     def get_names_for_language(self, lang: str) -> list:
         """
@@ -52,14 +121,20 @@ class Concept:
        :param lang: Language
        :return: Set of names
        """
-        return list(self.__all_names.get(lang, []))
+        return list((self.__all_names or {}).get(lang, []))
+
+    def get_languages(self) -> list:
+        """
+        :return: Languages this concept has names in (see get_names_for_language)
+        """
+        return list(self.__all_names or {})
 
     def get_definitions(self) -> Set[Tuple[str, str]]:
         """
         Returns all found definitions for this concept.
-        :return: Set of tuples (definition, source)
+        :return: Set of tuples (definition, source), a new set on every call (the concept keeps a frozenset)
         """
-        return self.__definitions
+        return set(self.__definitions or ())
 
     def get_cui(self) -> str:
         """
@@ -76,9 +151,36 @@ class Concept:
     def get_source_ids(self) -> Dict[str, Set[str]]:
         """
         This returns a list of all found codes. Be aware that the codes are determined after the language filter!
-        :return: Dict of all unique ids for all sources
+        :return: Dict of all unique ids for all sources, a new defaultdict(set) on every call (a source without
+            codes gives an empty set)
         """
-        return self.__source_ids
+        source_ids = defaultdict(set)
+        for sab, codes in (self.__source_ids or {}).items():
+            source_ids[sab] = set(codes)
+        return source_ids
+
+    def __state__(self) -> tuple:
+        # order-insensitive view of the concept, used for == (same as comparing the sets of the old dataclass)
+        def as_sets(store):
+            return {key: frozenset(values) for key, values in (store or {}).items()}
+        return (self.__cui, self.__tui, as_sets(self.__preferred_names), as_sets(self.__all_names),
+                frozenset(self.__definitions or ()), as_sets(self.__source_ids))
+
+    def __getstate__(self):
+        # a plain tuple pickles a lot faster than the default dict of slot names (parallel parsing sends every concept)
+        return self.__cui, self.__tui, self.__preferred_names, self.__all_names, self.__definitions, self.__source_ids
+
+    def __setstate__(self, state):
+        self.__cui, self.__tui, self.__preferred_names, self.__all_names, self.__definitions, self.__source_ids = state
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.__state__() == other.__state__()
+
+    def __repr__(self):
+        return 'Concept(cui={!r}, tui={!r}, preferred_names={!r}, all_names={!r}, definitions={!r}, source_ids={!r})'.format(
+            self.__cui, self.__tui, self.__preferred_names, self.__all_names, self.__definitions, self.__source_ids)
 
     def __hash__(self):
-        return hash(self.__cui)
\ No newline at end of file
+        return hash(self.__cui)
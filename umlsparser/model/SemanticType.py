@@ -1,9 +1,12 @@
-from dataclasses import dataclass
+import sys
 from typing import Dict
 
 
-@dataclass(init=False, repr=True, eq=True)
 class SemanticType:
+    """
+    A UMLS semantic type or relation from SRDEF. Slotted like Concept, the type (STY / RL) is interned.
+    """
+    __slots__ = ('__tui', '__type', '__definition', '__name')
     """TUI (field UI of SRDEF)"""
     __tui: str
     """Type of SemanticType STY / RL (field RT of SRDEF)"""
@@ -20,7 +23,7 @@ class SemanticType:
         self.__name: str = ''
 
     def __add_srdef_data__(self, data: Dict):
-        self.__type = data.get('RT')
+        self.__type = sys.intern(data['RT']) if data.get('RT') is not None else None
         self.__name = data.get('STY_RL')
         self.__definition = data.get('DEF')
 
@@ -36,5 +39,15 @@ class SemanticType:
         """
         return self.__definition
 
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return (self.__tui, self.__type, self.__definition, self.__name) == \
+               (other.__tui, other.__type, other.__definition, other.__name)
+
+    def __repr__(self):
+        return 'SemanticType(tui={!r}, type={!r}, definition={!r}, name={!r})'.format(
+            self.__tui, self.__type, self.__definition, self.__name)
+
     def __hash__(self):
         return hash(self.__tui)
@@ -0,0 +1,50 @@
+import pickle
+import unittest
+from collections import defaultdict
+
+from umlsparser.model.Concept import Concept
+
+
+def make_concept(freeze=True):
+    concept = Concept('C0000001')
+    concept.__add_mrconso_row__('ENG', 'P', 'MSH', 'D001', 'aspirin')
+    concept.__add_mrconso_row__('ENG', 'S', 'RXNORM', '1191', 'acetylsalicylic acid')
+    concept.__add_mrconso_row__('ENG', 'S', 'MSH', 'D002', 'ASA')
+    concept.__add_mrdef_data__({'DEF': 'a salicylate', 'SAB': 'MSH'})
+    if freeze:
+        concept.__freeze__()
+    return concept
+
+
+class ConceptGetterTest(unittest.TestCase):
+
+    def test_source_ids_is_a_defaultdict_of_sets(self):
+        for freeze in (False, True):
+            source_ids = make_concept(freeze).get_source_ids()
+            self.assertIsInstance(source_ids, defaultdict)
+            self.assertEqual(dict(source_ids), {'MSH': {'D001', 'D002'}, 'RXNORM': {'1191'}})
+            self.assertTrue(all(type(codes) is set for codes in source_ids.values()))
+            self.assertEqual(source_ids['SNOMEDCT_US'], set())
+
+    def test_definitions_is_a_set(self):
+        for freeze in (False, True):
+            definitions = make_concept(freeze).get_definitions()
+            self.assertIs(type(definitions), set)
+            self.assertEqual(definitions, {('a salicylate', 'MSH')})
+        self.assertEqual(Concept('C0000002').get_definitions(), set())
+        self.assertIs(type(Concept('C0000002').get_definitions()), set)
+
+    def test_changing_the_result_leaves_the_concept_alone(self):
+        concept = make_concept()
+        concept.get_source_ids()['MSH'].add('D999')
+        concept.get_definitions().add(('other', 'MSH'))
+        self.assertEqual(concept.get_source_ids()['MSH'], {'D001', 'D002'})
+        self.assertEqual(len(concept.get_definitions()), 1)
+
+    def test_pickle_round_trip(self):
+        concept = make_concept()
+        self.assertEqual(pickle.loads(pickle.dumps(concept)), concept)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import random
+import tempfile
+import unittest
+
+from umlsparser import UMLSParser
+
+RESOURCES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources')
+
+
+def quiet(name, done, total):
+    pass
+
+
+def write_release(base, n_rows=3000, seed=0):
+    """
+    Small random UMLS release; CUIs repeat all over MRCONSO.RRF so their rows end up in different byte ranges.
+    """
+    rnd = random.Random(seed)
+    os.makedirs(os.path.join(base, 'META'))
+    os.makedirs(os.path.join(base, 'NET'))
+    words = ['acid', 'aspirin', 'tablet', 'oral', 'pain', 'fever', 'heart', 'disease', 'Ünïcode', '日本']
+    with open(os.path.join(base, 'META', 'MRCONSO.RRF'), 'w', encoding='utf-8') as f:
+        for i in range(n_rows):
+            lat = rnd.choice(['ENG', 'ENG', 'SPA', 'GER'])
+            sab = rnd.choice(['MSH', 'RXNORM', 'MDRSPA', 'MDRGER'])
+            code = 'X{}'.format(rnd.randrange(500)) if rnd.random() > 0.1 else ''
+            name = ' '.join(rnd.choice(words) for _ in range(rnd.randint(1, 3)))
+            f.write('|'.join(['C{:07d}'.format(rnd.randrange(400)), lat, rnd.choice('PS'), '', '', '', '', '', '', '',
+                              '', sab, rnd.choice(['PT', 'SY']), code, name, '0', rnd.choice('NO'), '256']) + '|\n')
+    with open(os.path.join(base, 'META', 'MRDEF.RRF'), 'w', encoding='utf-8') as f:
+        for i in range(200):
+            f.write('|'.join(['C{:07d}'.format(rnd.randrange(450)), '', '', '', rnd.choice(['MSH', 'MDRSPA']),
+                              'definition {}'.format(i), 'N', '']) + '|\n')
+    with open(os.path.join(base, 'META', 'MRSTY.RRF'), 'w', encoding='utf-8') as f:
+        for c in range(420):
+            f.write('|'.join(['C{:07d}'.format(c), 'T{:03d}'.format(rnd.randrange(1, 20)), '', '', '', '']) + '|\n')
+    with open(os.path.join(base, 'NET', 'SRDEF'), 'w', encoding='utf-8') as f:
+        for t in range(1, 20):
+            f.write('|'.join(['STY', 'T{:03d}'.format(t), 'Type {}'.format(t), '', 'def', '', '', '', '', '']) + '|\n')
+
+
+def snapshot(parser, languages=('ENG', 'SPA', 'GER')):
+    # getters return names in insertion order, so this also checks that the merge keeps the serial order
+    return [(cui, concept.get_tui(),
+             [concept.get_names_for_language(lang) for lang in languages],
+             [concept.get_preferred_names_for_language(lang) for lang in languages],
+             concept.get_definitions(), concept.get_source_ids())
+            for cui, concept in parser.get_concepts().items()]
+
+
+class TestParallelParsing(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        write_release(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parallel_equals_serial(self):
+        serial = UMLSParser(self.tmp.name, progress=quiet)
+        for workers in [2, 3, 7]:
+            parallel = UMLSParser(self.tmp.name, workers=workers, progress=quiet)
+            self.assertEqual(set(serial.get_concepts()), set(parallel.get_concepts()))
+            self.assertEqual(serial.get_concepts(), parallel.get_concepts())
+            self.assertEqual(snapshot(serial), snapshot(parallel))
+
+    def test_parallel_equals_serial_with_filters(self):
+        options = dict(language_filter=['ENG', 'SPA'], suppress_filter=['N'], progress=quiet)
+        serial = UMLSParser(self.tmp.name, **options)
+        parallel = UMLSParser(self.tmp.name, workers=4, **options)
+        self.assertEqual(snapshot(serial), snapshot(parallel))
+
+    def test_progress_reaches_total(self):
+        calls = []
+        UMLSParser(self.tmp.name, workers=2, progress=lambda *args: calls.append(args))
+        for name in ['MRCONSO', 'MRDEF', 'MRSTY', 'SRDEF']:
+            done, total = [call[1:] for call in calls if call[0] == name][-1]
+            self.assertEqual(done, total)
+
+    def test_empty_files(self):
+        parser = UMLSParser(RESOURCES, workers=2, progress=quiet)
+        self.assertEqual(parser.get_concepts(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
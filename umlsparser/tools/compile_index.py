@@ -0,0 +1,22 @@
+"""
+Compiles a UMLS release into a SQLite index for UMLSParser.from_index.
+
+usage: python -m umlsparser.tools.compile_index <umls basepath> <index file> [--languages ENG GER ...]
+"""
+import argparse
+
+from umlsparser.UMLSIndex import compile_index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compile UMLS RRF files into a lazily loadable SQLite index.')
+    parser.add_argument('path', help='Basepath to UMLS data files (the folder holding META and NET)')
+    parser.add_argument('index_path', help='File to write the index to')
+    parser.add_argument('--languages', nargs='*', default=[],
+                        help='Three-letter language codes to keep (default: all languages)')
+    args = parser.parse_args(argv)
+    compile_index(args.path, args.index_path, language_filter=args.languages)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,305 @@
+"""
+Exports UMLS concepts with their names, definitions and semantic type to JSON Lines, Parquet or SQLite.
+
+Reading from an index compiled with umlsparser.tools.compile_index streams the concepts chunk by chunk, and the chunks
+are built and serialized in worker processes; reading from the RRF files parses the whole UMLS first and serializes in
+this process. Chunks are written in index order, so the output is the same for any number of workers.
+
+usage: python -m umlsparser.tools.generate_json <index file or umls basepath> <output file>
+           [--format jsonl|parquet|sqlite] [--languages ENG GER ...] [--workers N] [--chunk-size N]
+"""
+import argparse
+import collections
 import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from umlsparser.model.Concept import Concept
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {'.jsonl': 'jsonl', '.jsonlines': 'jsonl', '.json': 'jsonl', '.parquet': 'parquet', '.sqlite': 'sqlite',
+           '.db': 'sqlite'}
+
+# keys of the languages in the exported names, languages not listed here use the lower case UMLS code
+LANGUAGE_KEYS = {'ENG': 'en', 'GER': 'de', 'SPA': 'es', 'FRE': 'fr', 'ITA': 'it', 'DUT': 'nl', 'POR': 'pt',
+                 'JPN': 'ja', 'CZE': 'cs', 'HUN': 'hu', 'NOR': 'no', 'HRV': 'hr'}
+
+CHUNK_SIZE = 5000
+
+SQLITE_SCHEMA = """
+CREATE TABLE concepts (cui TEXT PRIMARY KEY, tui TEXT, semantic_type TEXT);
+CREATE TABLE names (cui TEXT, lang TEXT, name TEXT, preferred INTEGER);
+CREATE TABLE definitions (cui TEXT, definition TEXT, source TEXT);
+"""
+SQLITE_INDEXES = """
+CREATE INDEX names_cui ON names (cui);
+CREATE INDEX definitions_cui ON definitions (cui);
+"""
+
+
+def dumps(record: dict) -> bytes:
+    """
+    Compact JSON as utf-8 bytes, with orjson if it is installed. Both encoders give the same bytes for these records.
+    """
+    if orjson is not None:
+        return orjson.dumps(record)
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def concept_record(cui: str, concept: Concept, languages: List[str], semantic_type_names: Dict[str, str]) -> dict:
+    """
+    :return: The exported form of a concept (the structure of the old generate_json output)
+    """
+    tui = concept.get_tui()
+    return {
+        'cui': cui,
+        'names': {
+            LANGUAGE_KEYS.get(lang, lang.lower()): {
+                'preferred': concept.get_preferred_names_for_language(lang),
+                'all': concept.get_names_for_language(lang)
+            } for lang in languages
+        },
+        # definitions are a set, sorted so the output is deterministic
+        'definitions': sorted([list(d) for d in concept.get_definitions()], key=lambda d: (d[0] or '', d[1] or '')),
+        'semantic_type': {
+            'TUI': tui,
+            # concepts without a (known) TUI get None instead of crashing the export
+            'name': semantic_type_names.get(tui) if tui is not None else None
+        }
+    }
+
+
+def serialize_chunk(fmt: str, items, languages: List[str], semantic_type_names: Dict[str, str]):
+    """
+    Serializes one chunk of (cui, concept) pairs for the writer of fmt.
+    :return: bytes of JSON lines (jsonl), an Arrow IPC buffer (parquet) or lists of table rows (sqlite)
+    """
+    records = [concept_record(cui, concept, languages, semantic_type_names) for cui, concept in items]
+    if fmt == 'jsonl':
+        return b''.join(dumps(record) + b'\n' for record in records)
+    if fmt == 'parquet':
+        import pyarrow as pa
 
-from umlsparser.UMLSParser import UMLSParser
-
-umls = UMLSParser('/home/devfoo/Dev/Data/UMLS/2019AA-full/2019AA/', language_filter=['ENG', 'GER'])
-
-with open('umls.jsonlines', 'w') as outfile:
-    for cui, concept in umls.get_concepts().items():
-        output = {
-            'cui': cui,
-            'names':{
-                'de': {
-                    'preferred': list(concept.get_preferred_names_for_language('GER')),
-                    'all': list(concept.get_names_for_language('GER'))
-                },
-                'en': {
-                    'preferred': list(concept.get_preferred_names_for_language('ENG')),
-                    'all': list(concept.get_names_for_language('ENG'))
-                }
-            },
-            'definitions': list(concept.get_definitions()),
-            'semantic_type': {
-                'TUI': concept.get_tui(),
-                'name': umls.get_semantic_types().get(concept.get_tui()).get_name()
-            }
+        columns = {
+            'cui': [r['cui'] for r in records],
+            'tui': [r['semantic_type']['TUI'] for r in records],
+            'semantic_type': [r['semantic_type']['name'] for r in records],
+            'definitions': [[{'definition': d[0], 'source': d[1]} for d in r['definitions']] for r in records],
         }
-        outfile.write(json.dumps(output) + '\n')
+        for key in [LANGUAGE_KEYS.get(lang, lang.lower()) for lang in languages]:
+            columns['names_{}_preferred'.format(key)] = [r['names'][key]['preferred'] for r in records]
+            columns['names_{}_all'.format(key)] = [r['names'][key]['all'] for r in records]
+        table = pa.table(columns, schema=parquet_schema(languages))
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as stream:
+            stream.write_table(table)
+        return sink.getvalue().to_pybytes()
+    concept_rows, name_rows, definition_rows = [], [], []
+    for r, (cui, concept) in zip(records, items):
+        concept_rows.append((cui, r['semantic_type']['TUI'], r['semantic_type']['name']))
+        for lang in languages:
+            preferred = set(concept.get_preferred_names_for_language(lang))
+            name_rows.extend((cui, lang, name, int(name in preferred)) for name in concept.get_names_for_language(lang))
+        definition_rows.extend((cui, d[0], d[1]) for d in r['definitions'])
+    return concept_rows, name_rows, definition_rows
+
+
+def parquet_schema(languages: List[str]):
+    import pyarrow as pa
+
+    fields = [('cui', pa.string()), ('tui', pa.string()), ('semantic_type', pa.string()),
+              ('definitions', pa.list_(pa.struct([('definition', pa.string()), ('source', pa.string())])))]
+    for key in [LANGUAGE_KEYS.get(lang, lang.lower()) for lang in languages]:
+        fields.append(('names_{}_preferred'.format(key), pa.list_(pa.string())))
+        fields.append(('names_{}_all'.format(key), pa.list_(pa.string())))
+    return pa.schema(fields)
+
+
+######## writers ###########
+
+class JsonlWriter:
+
+    def __init__(self, path: str, languages: List[str]):
+        self.file = open(path, 'wb')
+
+    def write(self, payload: bytes):
+        self.file.write(payload)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+
+    def __init__(self, path: str, languages: List[str]):
+        import pyarrow.parquet as pq
+
+        self.writer = pq.ParquetWriter(path, parquet_schema(languages))
+
+    def write(self, payload: bytes):
+        import pyarrow as pa
+
+        # one row group per chunk
+        self.writer.write_table(pa.ipc.open_stream(payload).read_all())
+
+    def close(self):
+        self.writer.close()
+
+
+class SqliteWriter:
+
+    def __init__(self, path: str, languages: List[str]):
+        if os.path.exists(path):
+            os.remove(path)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=OFF')
+        self.connection.execute('PRAGMA synchronous=OFF')
+        self.connection.executescript(SQLITE_SCHEMA)
+
+    def write(self, payload: Tuple[list, list, list]):
+        concept_rows, name_rows, definition_rows = payload
+        self.connection.executemany('INSERT INTO concepts VALUES (?, ?, ?)', concept_rows)
+        self.connection.executemany('INSERT INTO names VALUES (?, ?, ?, ?)', name_rows)
+        self.connection.executemany('INSERT INTO definitions VALUES (?, ?, ?)', definition_rows)
+
+    def close(self):
+        self.connection.executescript(SQLITE_INDEXES)
+        self.connection.commit()
+        self.connection.close()
+
+
+WRITERS = {'jsonl': JsonlWriter, 'parquet': ParquetWriter, 'sqlite': SqliteWriter}
+
+
+######## chunks from an index (worker processes) ###########
+
+_worker = {}
+
+
+def _init_worker(index_path: str, languages: List[str]):
+    from umlsparser.UMLSIndex import UMLSIndex
+
+    index = UMLSIndex(index_path)
+    _worker['index'] = index
+    _worker['languages'] = languages
+    _worker['semantic_type_names'] = {tui: st.get_name() for tui, st in index.load_semantic_types().items()}
+
+
+def _export_range(fmt: str, start: int, stop: int):
+    concepts = _worker['index'].concepts.load_range(start, stop)
+    return len(concepts), serialize_chunk(fmt, list(concepts.items()), _worker['languages'],
+                                          _worker['semantic_type_names'])
+
+
+def _index_chunks(fmt: str, index_path: str, languages: List[str], workers: int, chunk_size: int) -> Iterator[tuple]:
+    from umlsparser.UMLSIndex import UMLSIndex
+
+    index = UMLSIndex(index_path)
+    first, last = index.concepts.position_range()
+    index.close()
+    ranges = [(start, min(start + chunk_size, last + 1)) for start in range(first, last + 1, chunk_size)]
+    if workers <= 1:
+        _init_worker(index_path, languages)
+        for start, stop in ranges:
+            yield _export_range(fmt, start, stop)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(index_path, languages)) as executor:
+        # results are taken in submission order, which keeps the output deterministic; only a few chunks per worker
+        # are in flight, so memory stays bounded however large the index is
+        pending = collections.deque()
+        for start, stop in ranges:
+            pending.append(executor.submit(_export_range, fmt, start, stop))
+            if len(pending) >= workers * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _parsed_chunks(fmt: str, path: str, languages: List[str], chunk_size: int) -> Iterator[tuple]:
+    from umlsparser.UMLSParser import UMLSParser
+
+    umls = UMLSParser(path, language_filter=languages)
+    semantic_type_names = {tui: st.get_name() for tui, st in umls.get_semantic_types().items()}
+    items = list(umls.get_concepts().items())
+    for start in range(0, len(items), chunk_size):
+        chunk = items[start:start + chunk_size]
+        yield len(chunk), serialize_chunk(fmt, chunk, languages, semantic_type_names)
+
+
+def export_concepts(source: str, output: str, fmt: str = None, languages: List[str] = ('ENG',), workers: int = 1,
+                    chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Exports every concept of a UMLS release.
+    :param source: Index file written by compile_index (streamed, parallel), or basepath to the UMLS data files (parsed)
+    :param output: File to write (overwritten)
+    :param fmt: 'jsonl', 'parquet' or 'sqlite' (default: from the output file extension)
+    :param languages: Languages to export names for, three-letter UMLS codes
+    :param workers: Worker processes serializing chunks (index source only; None: one per CPU)
+    :param chunk_size: Concepts per chunk
+    :return: Report with concepts, seconds, concepts_per_second, bytes, megabytes_per_second
+    """
+    fmt = fmt or FORMATS.get(os.path.splitext(output)[1].lower())
+    if fmt not in WRITERS:
+        raise ValueError('Unknown export format for {}, use one of {}'.format(output, ', '.join(WRITERS)))
+    languages = list(languages)
+    workers = workers or os.cpu_count()
+
+    start_time = time.perf_counter()
+    if os.path.isfile(source):
+        chunks = _index_chunks(fmt, source, languages, workers, chunk_size)
+    else:
+        if workers > 1:
+            logger.info('Exporting from RRF files runs in one process, compile an index to use workers')
+        chunks = _parsed_chunks(fmt, source, languages, chunk_size)
+
+    tmp_path = output + '.tmp'
+    writer = WRITERS[fmt](tmp_path, languages)
+    n_concepts = 0
+    try:
+        for n, payload in chunks:
+            writer.write(payload)
+            n_concepts += n
+    finally:
+        writer.close()
+    os.replace(tmp_path, output)
+
+    seconds = time.perf_counter() - start_time
+    size = os.path.getsize(output)
+    report = {
+        'concepts': n_concepts,
+        'seconds': round(seconds, 3),
+        'concepts_per_second': round(n_concepts / seconds) if seconds else None,
+        'bytes': size,
+        'megabytes_per_second': round(size / 2 ** 20 / seconds, 2) if seconds else None,
+    }
+    logger.info('Exported {concepts} concepts in {seconds} s ({concepts_per_second} concepts/s, '
+                '{megabytes_per_second} MB/s)'.format(**report))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export UMLS concepts to JSON Lines, Parquet or SQLite.')
+    parser.add_argument('source', help='Index file from umlsparser.tools.compile_index, or basepath to UMLS data files')
+    parser.add_argument('output', help='File to write (.jsonl, .parquet or .sqlite)')
+    parser.add_argument('--format', choices=sorted(WRITERS), help='Output format (default: from the file extension)')
+    parser.add_argument('--languages', nargs='*', default=['ENG'], help='Three-letter language codes (default: ENG)')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes, 0 for one per CPU (default: 1)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Concepts per chunk')
+    args = parser.parse_args(argv)
+    report = export_concepts(args.source, args.output, fmt=args.format, languages=args.languages,
+                             workers=args.workers, chunk_size=args.chunk_size)
+    print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main()